@@ -6,12 +6,13 @@ import argparse
 
 import backtest
 import indicators
+import store
 import strategies
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("file")
+    store.addarguments(parser)
     parser.add_argument("--sma", type=int, nargs='+', help='Adds SMA to the price graph')
     parser.add_argument("--ema", type=int, nargs='+', help='Adds EMA to the price graph')
     parser.add_argument("--rsi", type=int, help='Adds RSI in a subplot')
@@ -20,7 +21,7 @@ def main():
     parser.add_argument("--strategy", type=int, nargs='+', help='Adds a strategy, 1 : EMA Cross')
     args = parser.parse_args()
 
-    ohlc = pd.read_csv(args.file, index_col='time', parse_dates=True)
+    ohlc = store.load(parser, args)
     close = ohlc['close']
 
     # calculates the number of sublots
@@ -37,16 +38,16 @@ def main():
     fig.add_trace(go.Scatter(x=ohlc.index, y=close, name="Close"), row=row, col=1)
     if args.ema != None:
         for period in args.ema:
-            ema = indicators.EMA(close, period)
+            ema = indicators.cache.get(indicators.EMA, close, period)
             fig.add_trace(go.Scatter(x=ohlc.index, y=ema.df['ema{}'.format(period)], name="EMA {}".format(period)), row=row, col=1)
     if args.sma != None:
         for period in args.sma:
-            sma = indicators.SMA(close, period)
+            sma = indicators.cache.get(indicators.SMA, close, period)
             fig.add_trace(go.Scatter(x=ohlc.index, y=sma.df['sma{}'.format(period)], name="SMA {}".format(period)), row=row, col=1)
 
     # plots Bollinger Bands
     if args.bbands != None:
-        bbands = indicators.BollingerBands(close, args.bbands[0])
+        bbands = indicators.cache.get(indicators.BollingerBands, close, args.bbands[0])
         fig.add_trace(go.Scatter(x=ohlc.index, y=bbands.df.ma), row=row, col=1)
         fig.add_trace(go.Scatter(x=ohlc.index, y=bbands.df.upper), row=row, col=1)
         fig.add_trace(go.Scatter(x=ohlc.index, y=bbands.df.lower), row=row, col=1)
@@ -56,13 +57,13 @@ def main():
 
     # plots RSI
     if args.rsi != None:
-        rsi = indicators.RSI(close, args.rsi)
+        rsi = indicators.cache.get(indicators.RSI, close, args.rsi)
         fig.add_trace(go.Scatter(x=ohlc.index, y=rsi.df.rsi, name="RSI {}".format(args.rsi)), row=row, col=1)
         row += 1
 
     # plots MACD
     if args.macd != None:
-        macd = indicators.MACD(close, args.macd[0], args.macd[1], args.macd[2])
+        macd = indicators.cache.get(indicators.MACD, close, args.macd[0], args.macd[1], args.macd[2])
         fig.add_trace(go.Scatter(x=ohlc.index, y=macd.df.MACD, name="MACD {} {} {}".format(args.macd[0], args.macd[1], args.macd[2])), row=row, col=1)
         fig.add_trace(go.Scatter(x=ohlc.index, y=macd.df.signal, name="MACD Signal"), row=row, col=1)
         row += 1
@@ -71,8 +72,8 @@ def main():
     if args.strategy != None:
         if args.strategy[0] == 1:
 
-            fast_ema = indicators.EMA(ohlc.close, period=args.strategy[1])
-            slow_ema = indicators.EMA(ohlc.close, period=args.strategy[2])
+            fast_ema = indicators.cache.get(indicators.EMA, ohlc.close, period=args.strategy[1])
+            slow_ema = indicators.cache.get(indicators.EMA, ohlc.close, period=args.strategy[2])
 
             strategy = strategies.AvgCrossStrategy(ohlc.close, fast_ema.data(), slow_ema.data())
 
@@ -84,7 +85,7 @@ def main():
 
         elif args.strategy[0] == 2:
 
-            macd = indicators.MACD(ohlc.close, args.strategy[1], args.strategy[2], args.strategy[3])
+            macd = indicators.cache.get(indicators.MACD, ohlc.close, args.strategy[1], args.strategy[2], args.strategy[3])
 
             strategy = strategies.MACDStrategy(ohlc.close, macd)
 
@@ -96,8 +97,8 @@ def main():
 
         elif args.strategy[0] == 3:
 
-            bb1 = indicators.BollingerBands(ohlc.close, 20, 1)
-            bb2 = indicators.BollingerBands(ohlc.close, 20, 2)
+            bb1 = indicators.cache.get(indicators.BollingerBands, ohlc.close, 20, 1)
+            bb2 = indicators.cache.get(indicators.BollingerBands, ohlc.close, 20, 2)
             strategy = strategies.DBBStrategy(ohlc.close, bb1, bb2)
 
             fig.add_trace(go.Scatter(x=close.loc[strategy.signals['positions'] == 1.0].index, y=close.loc[strategy.signals['positions'] == 1.0],
@@ -108,8 +109,8 @@ def main():
 
         elif args.strategy[0] == 4:
 
-            rsi = indicators.RSI(ohlc.close, 9)
-            macd = indicators.MACD(ohlc.close, 12, 26, 9)
+            rsi = indicators.cache.get(indicators.RSI, ohlc.close, 9)
+            macd = indicators.cache.get(indicators.MACD, ohlc.close, 12, 26, 9)
             strategy = strategies.RSIMACDStrategy(ohlc.close, rsi, macd)
 
             fig.add_trace(go.Scatter(x=close.loc[strategy.signals['positions'] == 1.0].index, y=close.loc[strategy.signals['positions'] == 1.0],
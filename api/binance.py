@@ -9,6 +9,10 @@ import http.client, urllib.parse
 import hmac, hashlib
 import json
 
+from api.latency import LatencyHistogram, telemetry
+from api.messages import Decoder
+from api.pool import ConnectionPool, AsyncConnectionPool
+
 Intervals = {
     "1m" : timedelta(minutes=1),
     "3m" : timedelta(minutes=3),
@@ -59,16 +63,40 @@ class Binance():
             self.secretkey = self.config['api']['secretkey']
         self.test = test
 
-    def _request(self, method, url, body=None, headers={}):
-        conn = http.client.HTTPSConnection("api.binance.com")
-        conn.request(method, url, body, headers=headers)
-        r1 = conn.getresponse()
-        data1 = r1.read()
-        conn.close()
-        
+        # l'URL de l'API peut être remplacée, par exemple par un serveur local pour les tests
+        apiconfig = self.config.get('api', {})
+        baseurl = urllib.parse.urlsplit(apiconfig.get('url', 'https://api.binance.com'))
+        self.secure = baseurl.scheme == 'https'
+        self.host = baseurl.netloc
+        self.streamurl = apiconfig.get('stream', 'wss://stream.binance.com:9443')
+
+        # connexions persistantes pour éviter une poignée de main TCP et TLS à chaque requête
+        self.pool = ConnectionPool(self.host, self.secure, apiconfig.get('poolsize', 4), apiconfig.get('timeout', 10.0))
+        self.latencies = {}
+        # décode les messages du websocket, les klines et executionReport en structures
+        self.decoder = Decoder()
+
+    def _request(self, method, url, body=None, headers={}, timeout=None):
+        endpoint = "{} {}".format(method, urllib.parse.urlsplit(url).path)
+        start = time.perf_counter()
+        status, responseheaders, data1 = self.pool.request(method, url, body, headers, timeout)
+        elapsed = time.perf_counter() - start
+        self.latency(endpoint).record(elapsed)
+        telemetry.record(endpoint, elapsed)
+
         data = json.loads(data1)
 
-        return r1.status, data
+        return status, data
+
+    def latency(self, endpoint) -> LatencyHistogram:
+        """Returns the latency histogram of an endpoint such as 'POST /api/v3/order'."""
+        histogram = self.latencies.get(endpoint)
+        if histogram == None:
+            histogram = self.latencies.setdefault(endpoint, LatencyHistogram())
+        return histogram
+
+    def close(self):
+        self.pool.close()
 
     def exchangeinfo(self):
         return self._request('GET', '/api/v3/exchangeInfo')
@@ -106,6 +134,11 @@ class Binance():
         return self._request('GET', "/api/v3/account?{}".format(params), headers={"X-MBX-APIKEY": self.apikey})
 
     def order(self, symbol: str, side: OrderSide, type: OrderType, quantity: float, price: float):
+        status, data = self._request('POST', *self.orderrequest(symbol, side, type, quantity, price))
+        return self.orderresponse(symbol, side, price, status, data)
+
+    def orderrequest(self, symbol: str, side: OrderSide, type: OrderType, quantity: float, price: float):
+        """Returns the url, body and headers of an order request."""
         if self.test == True:
             url = "/api/v3/order/test"
         else:
@@ -123,8 +156,9 @@ class Binance():
         signature = hmac.new(bytes(self.secretkey, "latin-1"), bytes(params, "latin-1"), hashlib.sha256)
         params = params + "&" + urllib.parse.urlencode({"signature": signature.hexdigest()})
 
-        status, data = self._request('POST', url, params, headers={"X-MBX-APIKEY": self.apikey, "Content-Type": "application/x-www-form-urlencoded"})
+        return url, params, {"X-MBX-APIKEY": self.apikey, "Content-Type": "application/x-www-form-urlencoded"}
 
+    def orderresponse(self, symbol: str, side: OrderSide, price: float, status, data):
         # lorsqu'on est en mode test, l'API ne répond pas d'objet à l'ordre, on insère une fausse réponse
         if self.test == True and status == 200:
             data = {'symbol': symbol, 'side': side.name, 'status': 'FILLED', 'price': str(price), 'orderId': random.randint(1000, 9999), 'transactTime': self.timestamp()}
@@ -153,24 +187,37 @@ class Binance():
         headers = {"X-MBX-APIKEY": self.apikey, "Content-Type": "application/x-www-form-urlencoded"}
         return self._request('PUT', "/api/v3/userDataStream?listenKey={}".format(listenkey), headers=headers)
 
-    async def ws(self, handler, symbol = None, interval = None, listenkey = None):
+    def streamuri(self, symbol = None, interval = None, listenkey = None):
+        """Returns the uri of the kline streams of every pair, or of a symbol, plus the stream of a listen key."""
         if symbol == None and interval == None:
-            uri = 'wss://stream.binance.com:9443/stream?streams='
+            uri = self.streamurl + '/stream?streams='
             for key in self.config['pairs']:
                 uri += "{}@kline_{}/".format(key.lower(), self.config['pairs'][key]['interval'])
             uri = uri[:-1]
         else:
-            uri = 'wss://stream.binance.com:9443/ws/' + symbol.lower() + '@kline_' + interval
+            uri = self.streamurl + '/ws/' + symbol.lower() + '@kline_' + interval
 
         if listenkey != None:
             uri += "/{}".format(listenkey)
 
+        return uri
+
+    async def ws(self, handler, symbol = None, interval = None, listenkey = None, connected = None):
+        """Calls handler with the stream and the event of every message, and connected once subscribed."""
+        uri = self.streamuri(symbol, interval, listenkey)
         async with websockets.connect(
-            uri, ssl=True
+            uri, ssl=True if uri.startswith('wss://') else None
         ) as websocket:
+            if connected != None:
+                connected()
             async for message in websocket:
-                data = json.loads(message)
-                handler(data['stream'], data['data'])
+                received = time.perf_counter()
+                stream, event = self.decoder(message)
+                telemetry.record('decode', time.perf_counter() - received)
+                # le handler peut mesurer la latence depuis la réception du message
+                telemetry.received = received
+                handler(stream, event)
+                telemetry.received = None
 
     def subscribe(self, handler, symbol = None, interval = None, listenkey = None):
         asyncio.get_event_loop().run_until_complete(self.ws(handler, symbol, interval, listenkey))
@@ -180,3 +227,32 @@ class Binance():
 
     def timestamp(self):
         return int(time.time() * 1000)
+
+class AsyncBinance(Binance):
+    """Binance client whose REST methods are coroutines.
+
+    Requests go through an AsyncConnectionPool so that waiting for the
+    exchange never blocks the event loop, which also runs the websockets.
+    Every REST method of Binance returns an awaitable here.
+    """
+
+    def __init__(self, config, test=True):
+        super().__init__(config, test)
+        apiconfig = self.config.get('api', {})
+        self.pool = AsyncConnectionPool(self.host, self.secure, apiconfig.get('poolsize', 4), apiconfig.get('timeout', 10.0))
+
+    async def _request(self, method, url, body=None, headers={}, timeout=None):
+        endpoint = "{} {}".format(method, urllib.parse.urlsplit(url).path)
+        start = time.perf_counter()
+        status, responseheaders, data1 = await self.pool.request(method, url, body, headers, timeout)
+        elapsed = time.perf_counter() - start
+        self.latency(endpoint).record(elapsed)
+        telemetry.record(endpoint, elapsed)
+
+        data = json.loads(data1)
+
+        return status, data
+
+    async def order(self, symbol: str, side: OrderSide, type: OrderType, quantity: float, price: float):
+        status, data = await self._request('POST', *self.orderrequest(symbol, side, type, quantity, price))
+        return self.orderresponse(symbol, side, price, status, data)
@@ -0,0 +1,200 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class LatencyHistogram():
+    """Histogram of request latencies over fixed, roughly logarithmic buckets.
+
+    Buckets are upper bounds in milliseconds, the last one catching everything
+    slower. Recording is thread safe and does not allocate.
+    """
+
+    Buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+    # pour les étapes internes qui durent quelques microsecondes
+    Fine = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5] + Buckets
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets if buckets != None else LatencyHistogram.Buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.count += 1
+            self.total += ms
+            self.max = max(self.max, ms)
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, q):
+        """Returns the upper bound in milliseconds of the bucket holding the q-th percentile."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max
+        return self.max
+
+    def merge(self, other):
+        """Adds the latencies of a histogram with the same buckets."""
+        with self.lock:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        with self.lock:
+            return {'count': self.count, 'mean': self.mean(), 'p50': self.percentile(50), 'p99': self.percentile(99), 'max': self.max}
+
+    def __str__(self):
+        return "count {} mean {:.3g}ms p50 {:g}ms p99 {:g}ms max {:.3g}ms".format(
+            self.count, self.mean(), self.percentile(50), self.percentile(99), self.max)
+
+class StageHistogram(LatencyHistogram):
+    """LatencyHistogram with fine buckets, written by a single thread without locking.
+
+    Readers from other threads may see a recording half done, which only
+    shifts a snapshot by one sample.
+    """
+
+    def __init__(self):
+        super().__init__(LatencyHistogram.Fine)
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+class Telemetry():
+    """Latencies and counters of the live pipeline.
+
+    Each stage of a websocket message, from its decoding to the order sent
+    for it, is timed with time.perf_counter and recorded once, in a
+    histogram of the stage for its symbol. The totals of the stages over
+    all symbols are only merged when they are read, which keeps recording
+    cheap enough to stay enabled while trading.
+
+    Recording is meant to happen from the event loop thread. The module
+    level telemetry instance is shared by the api and live.py.
+    """
+
+    def __init__(self):
+        # histogrammes et compteurs par symbole, la clé None pour ceux qui ne concernent aucun symbole
+        self.latencies = {}
+        self.counters = {}
+        # instant de réception du message en cours de traitement, None hors du websocket
+        self.received = None
+        self.started = time.time()
+        # mesures fournies par d'autres composants, des fonctions qui retournent un dict
+        self.sources = {}
+
+    def record(self, stage, seconds, symbol=None):
+        stages = self.latencies.get(symbol)
+        if stages == None:
+            stages = self.latencies.setdefault(symbol, {})
+        histogram = stages.get(stage)
+        if histogram == None:
+            histogram = stages.setdefault(stage, StageHistogram())
+        histogram.record(seconds)
+
+    def count(self, name, symbol=None, n=1):
+        counters = self.counters.get(symbol)
+        if counters == None:
+            counters = self.counters.setdefault(symbol, {})
+        counters[name] = counters.get(name, 0) + n
+
+    def reset(self):
+        self.__init__()
+
+    def stages(self):
+        """Returns the histograms of the stages merged over all symbols."""
+        stages = {}
+        for histograms in list(self.latencies.values()):
+            for stage, histogram in list(histograms.items()):
+                if stage not in stages:
+                    stages[stage] = LatencyHistogram(LatencyHistogram.Fine)
+                stages[stage].merge(histogram)
+        return stages
+
+    def totals(self):
+        """Returns the counters summed over all symbols."""
+        totals = {}
+        for counters in list(self.counters.values()):
+            for name, value in list(counters.items()):
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def snapshot(self):
+        """Returns the counters and the latencies in milliseconds as a dict that can be serialized to JSON."""
+        symbols = {}
+        for symbol, stages in list(self.latencies.items()):
+            if symbol != None:
+                symbols[symbol] = {'latencies': {stage: histogram.snapshot() for stage, histogram in list(stages.items())}}
+        for symbol, counters in list(self.counters.items()):
+            if symbol != None:
+                symbols.setdefault(symbol, {})['counters'] = dict(counters)
+
+        snapshot = {
+            'uptime': time.time() - self.started,
+            'counters': self.totals(),
+            'latencies': {stage: histogram.snapshot() for stage, histogram in self.stages().items()},
+            'symbols': symbols
+        }
+        for name, source in list(self.sources.items()):
+            snapshot[name] = source()
+        return snapshot
+
+    def log(self):
+        logging.info("Telemetry {}".format(self))
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serves the snapshot as JSON on http://host:port/metrics from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = json.dumps(telemetry.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info("Serving telemetry on http://{}:{}/metrics".format(*server.server_address))
+        return server
+
+    def __str__(self):
+        lines = ["counters {}".format(self.totals())]
+        for stage, histogram in self.stages().items():
+            lines.append("{} : {}".format(stage, histogram))
+        for name, source in list(self.sources.items()):
+            lines.append("{} : {}".format(name, source()))
+        return "\n".join(lines)
+
+telemetry = Telemetry()
@@ -0,0 +1,89 @@
+"""Decoding of the websocket messages of the combined streams.
+
+Kline and executionReport events, received on every tick, are decoded into
+small structs whose numbers are converted once, other events are left as
+dicts. Messages are parsed with orjson when it is installed, with the json
+module otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Event():
+    __slots__ = ()
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+class Kline(Event):
+    """Kline event, with its open time in milliseconds and its prices as floats."""
+
+    __slots__ = ('symbol', 'time', 'open', 'high', 'low', 'close', 'volume', 'closed', 'eventtime')
+    event = 'kline'
+
+    def __init__(self, symbol, time, open, high, low, close, volume, closed=False, eventtime=None):
+        self.symbol = symbol
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.closed = closed
+        self.eventtime = eventtime if eventtime != None else time
+
+    @staticmethod
+    def fromdict(data):
+        k = data['k']
+        return Kline(data['s'], int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']), k.get('x', False), data.get('E'))
+
+class ExecutionReport(Event):
+    """executionReport event, the price is kept as sent, the quantities are floats."""
+
+    __slots__ = ('symbol', 'side', 'status', 'price', 'orderid', 'time', 'quantity', 'filled', 'eventtime')
+    event = 'executionReport'
+
+    def __init__(self, symbol, side, status, price, orderid, time, quantity, filled, eventtime=None):
+        self.symbol = symbol
+        self.side = side
+        self.status = status
+        self.price = price
+        self.orderid = orderid
+        self.time = time
+        self.quantity = quantity
+        self.filled = filled
+        self.eventtime = eventtime if eventtime != None else time
+
+    @staticmethod
+    def fromdict(data):
+        return ExecutionReport(data['s'], data['S'], data['X'], data['p'], data['i'], data['T'], float(data['q']), float(data['z']), data.get('E'))
+
+Parsers = {'kline': Kline.fromdict, 'executionReport': ExecutionReport.fromdict}
+
+def fromdict(data: dict):
+    """Returns the struct of an event decoded as a dict, or the dict when it has none."""
+    parser = Parsers.get(data.get('e'))
+    return parser(data) if parser != None else data
+
+class Decoder():
+    """Decodes a combined stream message into its stream name and its event.
+
+    loads is the JSON parser, orjson.loads by default when it is installed.
+    """
+
+    def __init__(self, loads=None):
+        if loads == None:
+            loads = orjson.loads if orjson != None else json.loads
+        self.loads = loads
+
+    def __call__(self, message):
+        payload = self.loads(message)
+        data = payload['data']
+        parser = Parsers.get(data.get('e'))
+        return payload['stream'], parser(data) if parser != None else data
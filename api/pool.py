@@ -0,0 +1,256 @@
+import asyncio
+import http.client
+import queue
+import ssl
+import threading
+import time
+import urllib.parse
+
+# méthodes qui peuvent être renvoyées sans risque si la réponse est perdue
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# erreurs d'une connexion persistante fermée par le serveur pendant qu'elle était inactive
+STALE = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+class ConnectionPool():
+    """Pool of keep-alive HTTP connections to a single host.
+
+    At most size connections are open at once, threads asking for one while
+    all are busy wait up to timeout seconds. Idle connections are reused most
+    recently used first and discarded after maxidle seconds, before the
+    server closes them on its side.
+    """
+
+    def __init__(self, host, secure=True, size=4, timeout=10.0, maxidle=30.0):
+        self.host = host
+        self.secure = secure
+        self.size = size
+        self.timeout = timeout
+        self.maxidle = maxidle
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.idle = queue.LifoQueue(maxsize=size)
+        # chaque emplacement libre est représenté par None, une connexion sera créée à la demande
+        for i in range(size):
+            self.idle.put((None, 0.0))
+
+    def connect(self, timeout):
+        with self.lock:
+            self.connections += 1
+        if self.secure:
+            return http.client.HTTPSConnection(self.host, timeout=timeout)
+        return http.client.HTTPConnection(self.host, timeout=timeout)
+
+    def acquire(self, timeout):
+        """Returns an idle connection, or None when a new one has to be opened."""
+        try:
+            conn, since = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No connection to {} available after {}s".format(self.host, timeout))
+        if conn != None and time.monotonic() - since > self.maxidle:
+            conn.close()
+            conn = None
+        return conn
+
+    def release(self, conn):
+        if conn != None and conn.sock == None:
+            conn = None
+        self.idle.put((conn, time.monotonic()))
+
+    def request(self, method, url, body=None, headers={}, timeout=None):
+        """Sends a request and returns the status, headers and body of the response.
+
+        A reused connection which turns out to be closed is replaced once.
+        Non idempotent requests are only sent again if the failure happened
+        before the request was completely written.
+        """
+        timeout = timeout if timeout != None else self.timeout
+        conn = self.acquire(timeout)
+        try:
+            for attempt in range(2):
+                reused = conn != None
+                if conn == None:
+                    conn = self.connect(timeout)
+                elif conn.sock != None:
+                    conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+
+                sent = False
+                try:
+                    conn.request(method, url, body, headers=headers)
+                    sent = True
+                    response = conn.getresponse()
+                    data = response.read()
+                except STALE:
+                    conn.close()
+                    conn = None
+                    if not reused or (sent and method not in IDEMPOTENT) or attempt > 0:
+                        raise
+                    continue
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = None
+                    raise
+
+                if response.will_close:
+                    conn.close()
+                    conn = None
+                return response.status, response.headers, data
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Closes the idle connections."""
+        conns = []
+        while True:
+            try:
+                conns.append(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        for conn, since in conns:
+            if conn != None:
+                conn.close()
+            self.idle.put((None, 0.0))
+
+class AsyncConnectionPool():
+    """Pool of keep-alive HTTP/1.1 connections to a single host for asyncio.
+
+    Same behaviour as ConnectionPool, over asyncio streams so that a request
+    waiting for the exchange never blocks the event loop. Responses are read
+    from their Content-Length or chunked encoding.
+    """
+
+    def __init__(self, host, secure=True, size=4, timeout=10.0, maxidle=30.0):
+        self.host = host
+        self.secure = secure
+        self.size = size
+        self.timeout = timeout
+        self.maxidle = maxidle
+        self.connections = 0
+        self.idle = []
+        # le sémaphore est lié à une boucle, il est créé par la première requête de chaque boucle
+        self.semaphore = None
+        self.loop = None
+
+        address = urllib.parse.urlsplit('//' + host)
+        self.hostname = address.hostname
+        self.port = address.port if address.port != None else (443 if secure else 80)
+
+    async def connect(self):
+        self.connections += 1
+        context = ssl.create_default_context() if self.secure else None
+        return await asyncio.open_connection(self.hostname, self.port, ssl=context)
+
+    def bind(self):
+        """Creates the semaphore in the running loop, the connections opened in another loop are dropped."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.size)
+            self.idle = []
+
+    def acquire(self):
+        """Returns the most recently used idle connection still open, or None."""
+        while len(self.idle) > 0:
+            reader, writer, since = self.idle.pop()
+            if time.monotonic() - since <= self.maxidle and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def send(self, writer, method, url, body, headers):
+        if isinstance(body, str):
+            body = body.encode('latin-1')
+        lines = ["{} {} HTTP/1.1".format(method, url), "Host: {}".format(self.host)]
+        lines += ["{}: {}".format(key, value) for key, value in headers.items()]
+        if body != None or method in ('POST', 'PUT'):
+            lines.append("Content-Length: {}".format(len(body) if body != None else 0))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (body if body != None else b''))
+        await writer.drain()
+
+    @staticmethod
+    async def readresponse(reader, method):
+        """Reads a response and returns its status, headers, body and whether the connection can be reused."""
+        line = await reader.readline()
+        if line == b'':
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        parts = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise http.client.BadStatusLine(line)
+        version, status = parts[0], int(parts[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keepalive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            data = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # les éventuels en-têtes de fin sont ignorés
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        else:
+            data = await reader.read()
+            keepalive = False
+
+        return status, headers, data, keepalive
+
+    async def request(self, method, url, body=None, headers={}, timeout=None):
+        """Sends a request and returns the status, headers and body of the response.
+
+        Retries follow the same rules as ConnectionPool.request.
+        """
+        timeout = timeout if timeout != None else self.timeout
+        self.bind()
+        async with self.semaphore:
+            conn = self.acquire()
+            for attempt in range(2):
+                reused = conn != None
+                sent = False
+                try:
+                    if conn == None:
+                        conn = await asyncio.wait_for(self.connect(), timeout)
+                    reader, writer = conn
+                    await asyncio.wait_for(self.send(writer, method, url, body, headers), timeout)
+                    sent = True
+                    status, responseheaders, data, keepalive = await asyncio.wait_for(AsyncConnectionPool.readresponse(reader, method), timeout)
+                except STALE + (asyncio.IncompleteReadError,):
+                    if conn != None:
+                        conn[1].close()
+                    conn = None
+                    if not reused or (sent and method not in IDEMPOTENT) or attempt > 0:
+                        raise
+                    continue
+                except BaseException:
+                    if conn != None:
+                        conn[1].close()
+                    raise
+
+                if keepalive:
+                    self.idle.append((reader, writer, time.monotonic()))
+                else:
+                    writer.close()
+                return status, responseheaders, data
+
+    def close(self):
+        """Closes the idle connections."""
+        while len(self.idle) > 0:
+            reader, writer, since = self.idle.pop()
+            writer.close()
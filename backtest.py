@@ -5,21 +5,36 @@ import argparse
 
 import strategies
 import indicators
+import store
+import sweep
 
 plt.style.use('ggplot')
 
 def add_ema(df, period):
-    df["ema" + str(period)] = df["close"].ewm(span=period).mean()
+    df["ema" + str(period)] = indicators.cache.get(indicators.EMA, df["close"], period).data()
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("file")
+    store.addarguments(parser)
+    parser.add_argument("--sweep", choices=sorted(sweep.Strategies), help='Sweeps the parameters of a strategy instead of running the default backtests')
+    parser.add_argument("--grid", nargs='+', default=[], help='Parameter values as name=start:stop[:step] (stop included) or name=a,b,c')
+    parser.add_argument("--workers", type=int, help='Number of processes, defaults to the number of CPUs')
+    parser.add_argument("--batch", action='store_true', help='Evaluates the sweep as signal matrices in this process')
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--rank", default='netret', choices=sweep.Metrics, help='Metric used to rank the sweep results')
+    parser.add_argument("--top", type=int, default=20, help='Number of sweep results to display')
     args = parser.parse_args()
     
-    df = pd.read_csv(args.file, index_col='time', parse_dates=True)
+    df = store.load(parser, args)
 
     #close = df.loc['20191225':,['close']].astype('float64')
     close = df
+
+    if args.sweep != None:
+        results = sweep.sweep(close, args.sweep, sweep.parsegrid(args.grid), args.workers, args.fee, args.batch)
+        print("{} combinations of {} :".format(len(results), args.sweep))
+        print(sweep.rank(results, args.rank).head(args.top).to_string())
+        return
     
     print("Buy And Hold Strategy :")
     strat1 = strategies.BuyAndHoldStrategy(close, 0.001)
@@ -30,10 +45,10 @@ def main():
     add_ema(close, 12)
     add_ema(close, 26)
 
-    macd = indicators.MACD(close['close'], 12, 26, 9)
-    rsi = indicators.RSI(close['close'], 9)
-    bb1 = indicators.BollingerBands(close['close'], 20, 1)
-    bb2 = indicators.BollingerBands(close['close'], 20, 2)
+    macd = indicators.cache.get(indicators.MACD, close['close'], 12, 26, 9)
+    rsi = indicators.cache.get(indicators.RSI, close['close'], 9)
+    bb1 = indicators.cache.get(indicators.BollingerBands, close['close'], 20, 1)
+    bb2 = indicators.cache.get(indicators.BollingerBands, close['close'], 20, 2)
 
     print("MACD Strategy :")
     strat3 = strategies.MACDStrategy(close, macd, 0.001)
@@ -57,9 +72,13 @@ def main():
     strat2 = strategies.RSIMACDStrategy(close, rsi, macd, 0.001)
     res = strat2.backtest(close['close'])
     print(res)
+    print(flush=True)
+
+    print("Indicator cache :")
+    print(indicators.cache)
 
     fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, sharex=True)
-    fig.suptitle(args.file)
+    fig.suptitle(args.file if args.file != None else '{} {}'.format(args.symbol, args.interval))
     ax1.plot(close['close'])
     ax1.plot(close['ema12'], label='EMA12')
     ax1.plot(close['ema26'], label='EMA26')
@@ -0,0 +1,109 @@
+"""Backtests of many parameter sets of a strategy at once.
+
+Instead of building a Strategy for each parameter set, the signals of N
+parameter sets are computed as an (N, T) matrix from the averages of the
+shared close array, each average being computed once per period. The
+equity and the metrics of all the rows are then computed by broadcasting,
+see metrics.compute. Rows are evaluated by chunks whose size is bounded by
+maxbytes, so that screening thousands of parameter sets over a year of
+klines fits in memory.
+"""
+import numpy as np
+import pandas as pd
+
+import indicators
+import kernels
+import metrics
+import strategies
+
+class EMAs():
+    """EMAs of a close series by period, computed once each as indicators.EMA does.
+
+    The other indicators are taken from cache, indicators.cache by default.
+    """
+
+    def __init__(self, close: pd.Series, cache: indicators.IndicatorCache = None):
+        self.close = close
+        self.values = {}
+        self.cache = cache if cache != None else indicators.cache
+
+    def get(self, period):
+        if period not in self.values:
+            self.values[period] = self.close.ewm(span=period).mean().to_numpy()
+        return self.values[period]
+
+def avgcross(emas: EMAs, params):
+    """Signals of AvgCrossStrategy over EMAs, one row per parameter set of fast and slow periods."""
+    fast = np.stack([emas.get(p['fast']) for p in params])
+    slow = np.stack([emas.get(p['slow']) for p in params])
+    return fast > slow
+
+def macd(emas: EMAs, params):
+    """Signals of MACDStrategy, one row per parameter set of short, long and signal periods."""
+    lines = np.stack([emas.get(p['short']) - emas.get(p['long']) for p in params])
+    signals = np.empty_like(lines)
+    # les lignes de signal de même période sont lissées ensemble
+    for period in set(p['signal'] for p in params):
+        rows = [i for i, p in enumerate(params) if p['signal'] == period]
+        signals[rows] = pd.DataFrame(lines[rows].T).ewm(span=period).mean().to_numpy().T
+    return lines > signals
+
+def rsi(emas: EMAs, params):
+    """Signals of RSIStrategy, one row per RSI period, each RSI being computed once through the indicator cache."""
+    index = emas.close.index
+    return np.stack([kernels.rsisignals(kernels.asarray(emas.cache.get(indicators.RSI, emas.close, p['period']).data(), index)) for p in params]) > 0.0
+
+def dbb(emas: EMAs, params):
+    """Signals of DBBStrategy, one row per parameter set of period and inner and outer deviations."""
+    index = emas.close.index
+    rows = []
+    for p in params:
+        bb1 = emas.cache.get(indicators.BollingerBands, emas.close, p['period'], p['inner'])
+        bb2 = emas.cache.get(indicators.BollingerBands, emas.close, p['period'], p['outer'])
+        rows.append(kernels.dbbsignals(kernels.asarray(bb1.df['close'], index), kernels.asarray(bb1.df['upper'], index),
+            kernels.asarray(bb1.df['lower'], index), kernels.asarray(bb2.df['upper'], index), kernels.asarray(bb2.df['lower'], index)))
+    return np.stack(rows) > 0.0
+
+# stratégies évaluées par lots, avec les mêmes paramètres que dans sweep
+Signals = {
+    'avgcross': avgcross,
+    'macd': macd,
+    'rsi': rsi,
+    'dbb': dbb,
+}
+
+def signals(close: pd.Series, strategy: str, params, cache: indicators.IndicatorCache = None):
+    """Returns the (N, T) signal matrix of the parameter sets of a strategy, True when holding."""
+    return Signals[strategy](EMAs(close, cache), params)
+
+def chunkrows(length, maxbytes):
+    # sans numba, les statistiques utilisent environ huit tableaux de float64 de la taille du lot
+    return max(1, maxbytes // (length * 8 * 8))
+
+def evaluate(close, signals, fee=0.0, periods=None, maxbytes: int = 2 ** 28):
+    """Computes the metrics of the rows of a signal matrix by chunks, see metrics.compute."""
+    rows = chunkrows(signals.shape[1], maxbytes)
+    chunks = [metrics.compute(close, signals[first:first + rows], fee, periods) for first in range(0, signals.shape[0], rows)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in metrics.Names}
+
+def screen(ohlc: pd.DataFrame, strategy: str, params, fee: float = 0.0, interval=None, maxbytes: int = 2 ** 28):
+    """Backtests the parameter sets of a strategy, returns a list of (params, BacktestResult) like sweep.
+
+    interval scales the annualized metrics, it is inferred from the index
+    when None. maxbytes bounds the memory used by a chunk of rows.
+    """
+    close = ohlc['close']
+    values = close.to_numpy(dtype=np.float64)
+    periods = metrics.periodsperyear(interval if interval != None else metrics.inferinterval(close.index))
+    start, end = close.index[0], close.index[len(close.index) - 1]
+    emas = EMAs(close)
+
+    results = []
+    rows = chunkrows(len(values), maxbytes)
+    for first in range(0, len(params), rows):
+        chunk = params[first:first + rows]
+        signal = Signals[strategy](emas, chunk)
+        summary = metrics.compute(values, signal, fee, periods)
+        for n, p in enumerate(chunk):
+            results.append((p, strategies.BacktestResult(start, end, len(values), **{name: summary[name][n].item() for name in metrics.Names})))
+    return results
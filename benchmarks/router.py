@@ -0,0 +1,104 @@
+"""Measures Router throughput and tick to order latency against the local exchange.
+
+    python -m benchmarks.router --pairs 200 --candles 2000
+    python -m benchmarks.router --pairs 200 --candles 2000 --shards 4
+
+The exchange replays random walks for every pair as fast as the bot reads
+them. The bot runs Router, LiveTicker and Book as live.py does, with the
+orders sent over the loopback interface and the books kept in memory.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import live
+import replay
+from api.binance import Binance
+from localexchange import LocalExchange, synthetic
+from shards import ShardedRouter
+
+def main():
+    # les annulations d'ordres déjà exécutés sont attendues à cette vitesse, elles ne sont pas affichées
+    logging.basicConfig(level=logging.CRITICAL)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--candles", type=int, default=2000, help='Candles replayed per pair after the warmup')
+    parser.add_argument("--speed", type=float, help='Speed multiplier of the exchange, as fast as possible when omitted')
+    parser.add_argument("--shards", type=int, default=0, help='Number of shard processes, 0 to route in this process')
+    args = parser.parse_args()
+
+    exchange = LocalExchange(synthetic(args.pairs, args.candles + 500), '1m', args.speed)
+    exchange.background()
+    config = exchange.config({symbol: {'interval': '1m', 'quantity': 1} for symbol in exchange.exchange.klines})
+    api = Binance(config, test=False)
+
+    status, data = api.createlistenkey()
+    start = time.perf_counter()
+    if args.shards > 0:
+        sharded(args, exchange, config, api, data['listenKey'], start)
+        return
+    router = live.Router(config, api, replay.MemoryDatabase(), data['listenKey'])
+    print("Startup :\t\t{:.1f} s for {} pairs".format(time.perf_counter() - start, args.pairs))
+
+    events = 0
+    busy = 0.0
+    def route(stream, data):
+        nonlocal events, busy
+        tick = time.perf_counter()
+        router.route(stream, data)
+        busy += time.perf_counter() - tick
+        events += 1
+
+    async def trade():
+        task = asyncio.ensure_future(api.ws(route, listenkey=router.listenkey))
+        while not (exchange.finished.is_set() and events == exchange.messages) and not task.done():
+            await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, *router.tasks.values(), return_exceptions=True)
+        router.orderapi.close()
+
+    start = time.perf_counter()
+    asyncio.run(trade())
+    elapsed = time.perf_counter() - start
+    router.close()
+    api.close()
+    exchange.shutdown()
+
+    print("Events :\t\t{} in {:.1f} s, {:.0f} per second".format(events, elapsed, events / elapsed))
+    print("Router.route :\t\t{:.1f} us per event".format(busy / max(events, 1) * 1e6))
+    print("Orders :\t\t{}".format(exchange.orders))
+    print("Tick to order :\t\t{}".format(exchange.latency))
+    for endpoint, histogram in router.orderapi.latencies.items():
+        print("{} :\t{}".format(endpoint, histogram))
+
+def sharded(args, exchange, config, api, listenkey, start):
+    router = ShardedRouter(config, api, listenkey, args.shards, database=replay.MemoryDatabase, logconfig={'level': logging.CRITICAL})
+    print("Startup :\t\t{:.1f} s for {} pairs on {} shards".format(time.perf_counter() - start, args.pairs, args.shards))
+
+    async def ingest():
+        task = asyncio.ensure_future(router.ws())
+        while not (exchange.finished.is_set() and sum(router.sent) == exchange.messages) and not task.done():
+            await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    start = time.perf_counter()
+    asyncio.run(ingest())
+    # les shards terminent les messages reçus avant de s'arrêter
+    router.close()
+    elapsed = time.perf_counter() - start
+    api.close()
+    exchange.shutdown()
+
+    stats = router.shardstats()
+    events = sum(shard['sent'] for shard in stats)
+    print("Events :\t\t{} in {:.1f} s, {:.0f} per second".format(events, elapsed, events / elapsed))
+    print("Orders :\t\t{}".format(exchange.orders))
+    print("Tick to order :\t\t{}".format(exchange.latency))
+    for shard in stats:
+        print("Shard {shard} :\t\t{pairs} pairs, {processed} events".format(**shard))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compares the vectorized RSI with the former iterrows implementation.
+
+    python -m benchmarks.rsi --rows 525600
+
+The former implementation is timed on a smaller sample and extrapolated
+linearly as it would take minutes on a year of 1m candles.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import indicators
+
+def legacyrsi(data: pd.Series, period: int = 14):
+    rsi = pd.DataFrame(index=data.index)
+    rsi['close'] = data
+    rsi['diff'] = rsi['close'].diff()
+
+    firstgain = rsi['diff'].iloc[1:period + 1][rsi['diff'] > 0.0].sum() / period
+    firstloss = rsi['diff'].iloc[1:period + 1][rsi['diff'] < 0.0].sum() / period
+
+    rsi['avg_gain'] = 0.0
+    rsi['avg_loss'] = 0.0
+    rsi['avg_gain'].iloc[period - 1] = firstgain
+    rsi['avg_loss'].iloc[period - 1] = firstloss
+
+    tmpgain = firstgain
+    tmploss = firstloss
+    for index, row in rsi[period - 1:].iterrows():
+        newloss = tmploss * (period - 1)
+        newgain = tmpgain * (period - 1)
+        if row['diff'] < 0:
+            newloss = newloss + row['diff']
+        else:
+            newgain = newgain + row['diff']
+        newloss = newloss / period
+        newgain = newgain / period
+        row['avg_loss'] = newloss
+        row['avg_gain'] = newgain
+        tmploss = newloss
+        tmpgain = newgain
+
+    rs = rsi['avg_gain'] / abs(rsi['avg_loss'])
+    return 100.0 - (100.0 / (1.0 + rs))
+
+def randomwalk(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2020-01-01', periods=rows, freq='1min')
+    return pd.Series(8000.0 + np.cumsum(rng.normal(0.0, 5.0, rows)), index=index)
+
+def timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=525600, help='Number of 1m candles, defaults to one year')
+    parser.add_argument("--legacy-rows", type=int, default=20000, help='Sample size for the former implementation')
+    parser.add_argument("--period", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    close = randomwalk(args.rows)
+    vectorized = timeit(lambda: indicators.RSI(close, args.period), args.repeat)
+
+    sample = close.iloc[:args.legacy_rows]
+    legacy = timeit(lambda: legacyrsi(sample, args.period), 1) * args.rows / len(sample)
+
+    print("Rows :\t\t\t{}".format(args.rows))
+    print("Vectorized RSI :\t{:.1f} ms".format(vectorized * 1000.0))
+    print("Former RSI (est.) :\t{:.1f} ms".format(legacy * 1000.0))
+    print("Speedup :\t\t{:.0f}x".format(legacy / vectorized))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Fixed capacity window of the last candles of a live ticker.
+
+The candles are stored twice in a NumPy array of twice the capacity, each one
+written at its position and at its position plus the capacity. The window of
+the last candles is therefore always a contiguous slice of the array, exposed
+as a view without copying, while appending and revising stay O(1).
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+class CandleBuffer():
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("Invalid capacity {}".format(capacity))
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self.values = np.zeros((len(COLUMNS), 2 * capacity))
+        # position de la prochaine chandelle et nombre de chandelles conservées
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, time: int, open: float, high: float, low: float, close: float, volume: float):
+        """Adds a new candle, the oldest one is dropped once the buffer is full."""
+        position = self.position
+        self.position = (position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.write(position, time, open, high, low, close, volume)
+
+    def revise(self, open: float, high: float, low: float, close: float, volume: float):
+        """Replaces the prices of the last candle, which is still in progress."""
+        if self.count == 0:
+            raise IndexError("No candle to revise")
+        position = (self.position - 1) % self.capacity
+        self.write(position, self.timestamps[position], open, high, low, close, volume)
+
+    def write(self, position, time, open, high, low, close, volume):
+        for offset in (position, position + self.capacity):
+            self.timestamps[offset] = time
+            values = self.values[:, offset]
+            values[0] = open
+            values[1] = high
+            values[2] = low
+            values[3] = close
+            values[4] = volume
+
+    def extend(self, df: pd.DataFrame):
+        """Appends candles shaped like utils.klinestodataframe, only the last ones are kept."""
+        df = df.iloc[-self.capacity:]
+        times = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        values = df[COLUMNS].to_numpy(dtype=np.float64)
+        for i in range(len(df)):
+            self.append(times[i], *values[i])
+
+    def window(self):
+        """Returns the bounds of the contiguous slice holding the candles, oldest first."""
+        end = self.position if self.position >= self.count else self.position + self.capacity
+        return end - self.count, end
+
+    def times(self) -> np.ndarray:
+        """Returns a read-only view of the open times in milliseconds."""
+        start, end = self.window()
+        return self.readonly(self.timestamps[start:end])
+
+    def column(self, name) -> np.ndarray:
+        """Returns a read-only view of a column, oldest candle first."""
+        start, end = self.window()
+        return self.readonly(self.values[COLUMNS.index(name), start:end])
+
+    def ohlcv(self) -> np.ndarray:
+        """Returns a read-only (5, n) view of all columns."""
+        start, end = self.window()
+        return self.readonly(self.values[:, start:end])
+
+    @staticmethod
+    def readonly(view):
+        view = view.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def open(self):
+        return self.column('open')
+
+    @property
+    def high(self):
+        return self.column('high')
+
+    @property
+    def low(self):
+        return self.column('low')
+
+    @property
+    def close(self):
+        return self.column('close')
+
+    @property
+    def volume(self):
+        return self.column('volume')
+
+    def lasttime(self):
+        """Returns the open time of the last candle in milliseconds, or None."""
+        if self.count == 0:
+            return None
+        return int(self.timestamps[(self.position - 1) % self.capacity])
+
+    def last(self):
+        """Returns the last candle as a dict of its open time in milliseconds and its prices, or None."""
+        if self.count == 0:
+            return None
+        position = (self.position - 1) % self.capacity
+        candle = dict(zip(COLUMNS, self.values[:, position].tolist()))
+        candle['time'] = int(self.timestamps[position])
+        return candle
+
+    def dataframe(self) -> pd.DataFrame:
+        """Returns the candles as a DataFrame shaped like utils.klinestodataframe, without copying the prices."""
+        index = pd.DatetimeIndex(self.times().astype('datetime64[ms]').astype('datetime64[ns]'), name='time')
+        return pd.DataFrame(self.ohlcv().T, index=index, columns=COLUMNS, copy=False)
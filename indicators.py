@@ -1,4 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+import hashlib
+import inspect
+import math
 import pandas as pd 
 import numpy as np
 
@@ -33,15 +37,16 @@ class EMA(Indicator):
 
 class MACD(Indicator):
 
-    def __init__(self, data: pd.Series, short_period: int, long_period: int, period: int):
+    def __init__(self, data: pd.Series, short_period: int, long_period: int, period: int, cache=None):
         Indicator.__init__(self, data.index)
         
         self.short_period = short_period
         self.long_period = long_period
         self.period = period
 
-        short_ema = EMA(data, short_period)
-        long_ema = EMA(data, long_period)
+        # construit par un cache, les moyennes y ont souvent déjà été calculées pour une autre stratégie
+        short_ema = cache.get(EMA, data, short_period) if cache != None else EMA(data, short_period)
+        long_ema = cache.get(EMA, data, long_period) if cache != None else EMA(data, long_period)
         
         self.df['MACD'] = short_ema.data() - long_ema.data()
         self.df['signal'] = EMA(self.df['MACD'], period).data()
@@ -54,46 +59,29 @@ class RSI(Indicator):
     def __init__(self, data: pd.Series, period: int = 14):
         Indicator.__init__(self, data.index)
 
-        rsi = pd.DataFrame(index=data.index)
-        rsi['close'] = data
-
         # différence pour avoir la fluctuation
-        rsi['diff'] = rsi['close'].diff()
-        
-        # calcul de la première moyenne de gains et de pertes
+        diff = data.diff()
+        gain = diff.clip(lower=0.0)
+        loss = (-diff).clip(lower=0.0)
+
+        # les premiers gains et pertes moyens sont la moyenne des period premières différences,
         # on saute la première valeur qui est un NaN à cause du diff
-        firstgain = rsi['diff'].iloc[1:period + 1][rsi['diff'] > 0.0].sum() / period
-        firstloss = rsi['diff'].iloc[1:period + 1][rsi['diff'] < 0.0].sum() / period
-
-        # initialisation de deux colonnes contenant les gains et les pertes moyens
-        rsi['avg_gain'] = 0.0
-        rsi['avg_loss'] = 0.0
-
-        # ajout des premiers gains et pertes
-        rsi['avg_gain'].iloc[period - 1] = firstgain
-        rsi['avg_loss'].iloc[period - 1] = firstloss
-
-        # les gains et pertes suivants sont calculés en lissant les valeurs avec la formule suivante :
-        # nouveau gain moyen = ((gain moyen précédent / période -1) + nouveau gain) / période
-        # et de même pour les pertes.
-        tmpgain = firstgain
-        tmploss = firstloss
-        for index, row in rsi[period - 1:].iterrows():
-            newloss = tmploss * (period - 1)
-            newgain = tmpgain * (period - 1)
-            if row['diff'] < 0:    
-                newloss = newloss + row['diff']
-            else:
-                newgain = newgain + row['diff']
-            newloss = newloss / period
-            newgain = newgain / period
-            row['avg_loss'] = newloss
-            row['avg_gain'] = newgain
-            tmploss = newloss
-            tmpgain = newgain
+        # les suivants sont lissés avec la formule de Wilder :
+        # nouveau gain moyen = ((gain moyen précédent * (période - 1)) + nouveau gain) / période
+        # ce qui est une moyenne exponentielle de coefficient 1 / période initialisée avec la première moyenne
+        avg_gain = self.smooth(gain, period)
+        avg_loss = self.smooth(loss, period)
+
+        rs = avg_gain / avg_loss
+        self.df['rsi'] = 100.0 - (100.0 / (1.0 + rs))
 
-        rs = rsi['avg_gain'] / abs(rsi['avg_loss'])
-        self.df['rsi'] = 100.0 - (100.0 / ( 1.0 + rs))
+    @staticmethod
+    def smooth(values: pd.Series, period: int) -> pd.Series:
+        seeded = pd.Series(np.nan, index=values.index)
+        if len(values) > period:
+            seeded.iloc[period] = values.iloc[1:period + 1].mean()
+            seeded.iloc[period + 1:] = values.iloc[period + 1:]
+        return seeded.ewm(alpha=1.0 / period, adjust=False).mean()
 
     def data(self):
         return self.df['rsi']
@@ -108,4 +96,338 @@ class BollingerBands(Indicator):
         self.df['lower'] = self.df['ma'] - (self.df['close'].rolling(window=period).std(ddof=0) * std)
 
     def data(self):
-        return self.df['ma'], self.df['upper'], self.df['lower']
\ No newline at end of file
+        return self.df['ma'], self.df['upper'], self.df['lower']
+
+class IndicatorCache():
+    """Size bounded LRU cache of batch indicators.
+
+    Entries are keyed on a fingerprint of the input series, the indicator
+    class and its parameters, so that the same indicator computed for several
+    strategies or parameter sets is only built once. Indicators taking a
+    cache parameter, such as MACD, are given this cache for the indicators
+    they are built on. Cached indicators are shared and must not be modified.
+    """
+
+    def __init__(self, maxsize: int = 128, maxbytes: int = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, cls, data: pd.Series, *args, **kwargs):
+        """Returns cls(data, *args, **kwargs), built only if it is not already cached."""
+        # les paramètres sont normalisés pour que EMA(data, 9) et EMA(data, period=9) partagent la même entrée
+        signature = inspect.signature(cls)
+        if 'cache' in signature.parameters and kwargs.get('cache') == None:
+            kwargs['cache'] = self
+        params = signature.bind(data, *args, **kwargs)
+        params.apply_defaults()
+        params.arguments.pop('cache', None)
+        key = (self.fingerprint(data), cls, tuple(params.arguments.values())[1:])
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        self.misses += 1
+        indicator = cls(data, *args, **kwargs)
+        size = int(indicator.df.memory_usage(index=False).sum())
+        self.entries[key] = (indicator, size)
+        self.nbytes += size
+        self.evict()
+        return indicator
+
+    def evict(self):
+        # on garde toujours la dernière entrée même si elle dépasse la taille maximale
+        while len(self.entries) > 1 and (len(self.entries) > self.maxsize or (self.maxbytes != None and self.nbytes > self.maxbytes)):
+            key, (indicator, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def fingerprint(self, data: pd.Series):
+        """BLAKE2 digest of the values and index of a series, or of a DataFrame.
+
+        A checksum is cheaper but lets different series share a key, and the
+        cache would then return the indicator of another series.
+        """
+        values = np.ascontiguousarray(data.to_numpy(dtype=np.float64))
+        if isinstance(data.index, pd.DatetimeIndex):
+            index = np.ascontiguousarray(data.index.asi8)
+        else:
+            index = pd.util.hash_pandas_object(data.index, index=False).to_numpy()
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(values.view(np.uint8).ravel())
+        digest.update(index.view(np.uint8).ravel())
+        return values.shape, digest.digest()
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return 'Entries :\t{}\nSize :\t\t{}\nHits :\t\t{}\nMisses :\t{}\nEvictions :\t{}'\
+            .format(len(self.entries), self.nbytes, self.hits, self.misses, self.evictions)
+
+# cache partagé par défaut, borné en mémoire car une entrée sur des années de klines 1m pèse des dizaines de Mo
+CacheBytes = 512 * 2 ** 20
+cache = IndicatorCache(maxbytes=CacheBytes)
+
+class StreamingIndicator(ABC):
+    """Base class of the O(1) incremental indicators used by live trading.
+
+    Values are pushed one candle at a time with update(), and the candle which
+    is still in progress can be amended with revise_last() without having to
+    replay the history. Both return the current value of the indicator.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    @abstractmethod
+    def update(self, value: float):
+        pass
+
+    @abstractmethod
+    def revise_last(self, value: float):
+        pass
+
+    @property
+    def lookback(self):
+        """Number of candles the indicator needs before producing a value."""
+        return self.period
+
+    def extend(self, values):
+        """Pushes several values, typically the history used to warm up the indicator."""
+        result = None
+        for value in values:
+            result = self.update(float(value))
+        return result
+
+class _RollingWindow():
+    """Fixed size window maintaining mean and variance with Welford's updates.
+
+    The sums are recomputed exactly once per window length to prevent
+    floating point drift over long running sessions, which keeps the cost
+    amortized O(1) per update.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def push(self, value: float):
+        if len(self.values) < self.period:
+            self.values.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(self.values)
+            self.m2 += delta * (value - self.mean)
+        else:
+            old = self.values.popleft()
+            self.values.append(value)
+            self._replace(old, value)
+
+        self.updates += 1
+        if self.updates % self.period == 0:
+            self._resync()
+
+    def replace_last(self, value: float):
+        old = self.values[-1]
+        self.values[-1] = value
+        if len(self.values) < self.period:
+            # la fenêtre n'est pas pleine, le coût reste borné par la période
+            self._resync()
+        else:
+            self._replace(old, value)
+
+    def _replace(self, old: float, new: float):
+        oldmean = self.mean
+        self.mean += (new - old) / self.period
+        self.m2 += (new - old) * (new - self.mean + old - oldmean)
+        if self.m2 < 0.0:
+            self.m2 = 0.0
+
+    def _resync(self):
+        n = len(self.values)
+        self.mean = math.fsum(self.values) / n
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.values)
+
+    def full(self):
+        return len(self.values) == self.period
+
+    def variance(self):
+        return self.m2 / self.period
+
+class StreamingSMA(StreamingIndicator):
+    """Incremental counterpart of SMA."""
+
+    def __init__(self, period: int = 9):
+        StreamingIndicator.__init__(self)
+        self.period = period
+        self.window = _RollingWindow(period)
+        self.value = np.nan
+
+    def update(self, value: float):
+        self.count += 1
+        self.window.push(value)
+        return self._compute()
+
+    def revise_last(self, value: float):
+        self.window.replace_last(value)
+        return self._compute()
+
+    def _compute(self):
+        self.value = self.window.mean if self.window.full() else np.nan
+        return self.value
+
+class StreamingEMA(StreamingIndicator):
+    """Incremental counterpart of EMA.
+
+    EMA relies on pandas ewm(span=period) with adjust=True, which is the ratio
+    of two recursive sums : the weighted values and the weights themselves.
+    """
+
+    def __init__(self, period: int = 9):
+        StreamingIndicator.__init__(self)
+        self.period = period
+        self.decay = 1.0 - 2.0 / (period + 1.0)
+        self.num = 0.0
+        self.den = 0.0
+        self.previous = (0.0, 0.0)
+        self.value = np.nan
+
+    def update(self, value: float):
+        self.count += 1
+        self.previous = (self.num, self.den)
+        return self._compute(value)
+
+    def revise_last(self, value: float):
+        self.num, self.den = self.previous
+        return self._compute(value)
+
+    def _compute(self, value):
+        self.num = value + self.decay * self.num
+        self.den = 1.0 + self.decay * self.den
+        self.value = self.num / self.den
+        return self.value
+
+class StreamingMACD(StreamingIndicator):
+    """Incremental counterpart of MACD, value is a (MACD, signal) tuple."""
+
+    def __init__(self, short_period: int, long_period: int, period: int):
+        StreamingIndicator.__init__(self)
+        self.short_period = short_period
+        self.long_period = long_period
+        self.period = period
+        self.short_ema = StreamingEMA(short_period)
+        self.long_ema = StreamingEMA(long_period)
+        self.signal = StreamingEMA(period)
+        self.value = (np.nan, np.nan)
+
+    @property
+    def lookback(self):
+        return self.long_period + self.period
+
+    def update(self, value: float):
+        self.count += 1
+        macd = self.short_ema.update(value) - self.long_ema.update(value)
+        self.value = (macd, self.signal.update(macd))
+        return self.value
+
+    def revise_last(self, value: float):
+        macd = self.short_ema.revise_last(value) - self.long_ema.revise_last(value)
+        self.value = (macd, self.signal.revise_last(macd))
+        return self.value
+
+class StreamingRSI(StreamingIndicator):
+    """Incremental RSI using Wilder's smoothing.
+
+    The first average gain and loss are the simple mean of the first period
+    differences, the RSI is therefore defined from the period-th value on.
+    """
+
+    def __init__(self, period: int = 14):
+        StreamingIndicator.__init__(self)
+        self.period = period
+        self.last = None
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.previous = None
+        self.value = np.nan
+
+    @property
+    def lookback(self):
+        return self.period + 1
+
+    def update(self, value: float):
+        self.previous = (self.count, self.last, self.avg_gain, self.avg_loss)
+        return self._compute(value)
+
+    def revise_last(self, value: float):
+        self.count, self.last, self.avg_gain, self.avg_loss = self.previous
+        return self._compute(value)
+
+    def _compute(self, value):
+        self.count += 1
+        if self.last is not None:
+            diff = value - self.last
+            gain = diff if diff > 0.0 else 0.0
+            loss = -diff if diff < 0.0 else 0.0
+
+            if self.count <= self.period + 1:
+                # les premières moyennes sont de simples moyennes arithmétiques
+                self.avg_gain += gain / self.period
+                self.avg_loss += loss / self.period
+            else:
+                self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+                self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        self.last = value
+
+        if self.count <= self.period:
+            self.value = np.nan
+        elif self.avg_loss == 0.0:
+            self.value = 100.0 if self.avg_gain > 0.0 else np.nan
+        else:
+            self.value = 100.0 - (100.0 / (1.0 + self.avg_gain / self.avg_loss))
+        return self.value
+
+class StreamingBollingerBands(StreamingIndicator):
+    """Incremental counterpart of BollingerBands, value is a (ma, upper, lower) tuple."""
+
+    def __init__(self, period: int = 20, std: int = 2):
+        StreamingIndicator.__init__(self)
+        self.period = period
+        self.std = std
+        self.window = _RollingWindow(period)
+        self.ma = self.upper = self.lower = np.nan
+
+    def update(self, value: float):
+        self.count += 1
+        self.window.push(value)
+        return self._compute()
+
+    def revise_last(self, value: float):
+        self.window.replace_last(value)
+        return self._compute()
+
+    def _compute(self):
+        if self.window.full():
+            width = math.sqrt(self.window.variance()) * self.std
+            self.ma = self.window.mean
+            self.upper = self.ma + width
+            self.lower = self.ma - width
+        else:
+            self.ma = self.upper = self.lower = np.nan
+        return self.value
+
+    @property
+    def value(self):
+        return self.ma, self.upper, self.lower
@@ -0,0 +1,181 @@
+"""Array kernels of the threshold crossing state machines used by strategies.
+
+Each state machine exists as a single pass loop over contiguous float64 arrays,
+compiled with numba when it is installed, and as an equivalent vectorized NumPy
+form used otherwise. Both produce the signal column of the strategy (1.0 when
+holding, 0.0 otherwise).
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# états de la stratégie RSI + MACD
+FLAT = 0
+RSI_LONG = 1
+MACD_LONG = 2
+
+def rsiloop(rsi):
+    signal = np.zeros(rsi.shape[0])
+    lowthreshpassed = False
+    lowlowthreshpassed = False
+    hithreshpassed = False
+    hihithreshpassed = False
+    hasbought = False
+    for i in range(rsi.shape[0]):
+        value = rsi[i]
+        if value < 33:
+            lowthreshpassed = True
+        if value < 20:
+            lowlowthreshpassed = True
+        if value > 66:
+            hithreshpassed = True
+        if value > 80:
+            hihithreshpassed = True
+
+        if value > 20 and lowlowthreshpassed:
+            lowlowthreshpassed = False
+            hasbought = True
+        if value > 33 and lowthreshpassed:
+            lowthreshpassed = False
+            hasbought = True
+        if value < 80 and hihithreshpassed:
+            hihithreshpassed = False
+            hasbought = False
+        if value < 66 and hithreshpassed:
+            hithreshpassed = False
+            hasbought = False
+
+        if hasbought:
+            signal[i] = 1.0
+    return signal
+
+def rsimacdloop(rsi, macd, macdsignal):
+    signal = np.zeros(rsi.shape[0])
+    state = FLAT
+    macdcrossedfromdown = False
+    macdcrossedfromtop = False
+    lowthreshpassed = False
+    lowlowthreshpassed = False
+    hithreshpassed = False
+    hihithreshpassed = False
+    for i in range(rsi.shape[0]):
+        value = rsi[i]
+        if value < 33:
+            lowthreshpassed = True
+        if value < 20:
+            lowlowthreshpassed = True
+        if value > 66:
+            hithreshpassed = True
+        if value > 80:
+            hihithreshpassed = True
+
+        if value > 20 and lowlowthreshpassed:
+            lowlowthreshpassed = False
+            if state == FLAT:
+                state = RSI_LONG
+        if value > 33 and lowthreshpassed:
+            lowthreshpassed = False
+            if state == FLAT:
+                state = RSI_LONG
+        # on revend par RSI seulement si c'est le seul signal qui a généré l'achat
+        if value < 80 and hihithreshpassed:
+            hihithreshpassed = False
+            if state == RSI_LONG:
+                state = FLAT
+        if value < 66 and hithreshpassed:
+            hithreshpassed = False
+            if state == RSI_LONG:
+                state = FLAT
+
+        # le signal de la MACD prévaut sur celui du RSI
+        if macd[i] > macdsignal[i] and not macdcrossedfromdown:
+            macdcrossedfromdown = True
+            macdcrossedfromtop = False
+            state = MACD_LONG
+        if macd[i] < macdsignal[i] and not macdcrossedfromtop:
+            macdcrossedfromtop = True
+            macdcrossedfromdown = False
+            state = FLAT
+
+        if state != FLAT:
+            signal[i] = 1.0
+    return signal
+
+def dbbloop(close, upper1, lower1, upper2, lower2):
+    signal = np.zeros(close.shape[0])
+    hasbought = False
+    for i in range(close.shape[0]):
+        if close[i] > upper1[i] and close[i] < upper2[i]:
+            hasbought = True
+        if close[i] < lower1[i] and close[i] > lower2[i]:
+            hasbought = False
+        if hasbought:
+            signal[i] = 1.0
+    return signal
+
+def ffill(values):
+    """Propagates the last non NaN value forward, leading NaN are kept."""
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[0]))
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+def lastside(values, threshold, below):
+    """Tells for each row if the last previous value on either side of threshold was below (or above) it.
+
+    Values equal to the threshold or NaN leave the side unchanged.
+    """
+    side = np.where(values < threshold, 1.0, np.where(values > threshold, 0.0, np.nan))
+    if not below:
+        side = np.where(np.isnan(side), np.nan, 1.0 - side)
+    previous = np.empty_like(side)
+    previous[0] = np.nan
+    previous[1:] = ffill(side)[:-1]
+    return previous
+
+def rsievents(rsi):
+    buy = ((rsi > 20) & (lastside(rsi, 20, True) == 1.0)) | ((rsi > 33) & (lastside(rsi, 33, True) == 1.0))
+    sell = ((rsi < 80) & (lastside(rsi, 80, False) == 1.0)) | ((rsi < 66) & (lastside(rsi, 66, False) == 1.0))
+    return buy, sell
+
+def hold(events):
+    return np.nan_to_num(ffill(events), nan=0.0)
+
+def rsivectorized(rsi):
+    buy, sell = rsievents(rsi)
+    # un achat et une vente sur la même chandelle se soldent par une vente
+    events = np.where(sell, 0.0, np.where(buy, 1.0, np.nan))
+    return hold(events)
+
+def rsimacdvectorized(rsi, macd, macdsignal):
+    buy, sell = rsievents(rsi)
+    up = (macd > macdsignal) & (lastside(macd - macdsignal, 0.0, False) != 1.0)
+    down = (macd < macdsignal) & (lastside(macd - macdsignal, 0.0, True) != 1.0)
+
+    # tant que l'achat vient de la MACD, les signaux du RSI sont ignorés
+    macdstate = hold(np.where(up, MACD_LONG, np.where(down, FLAT, np.nan)))
+    events = np.where(sell, FLAT, np.where(buy, RSI_LONG, np.nan))
+    events[macdstate == MACD_LONG] = np.nan
+    events[up] = MACD_LONG
+    events[down] = FLAT
+    return np.where(hold(events) != FLAT, 1.0, 0.0)
+
+def dbbvectorized(close, upper1, lower1, upper2, lower2):
+    buy = (close > upper1) & (close < upper2)
+    sell = (close < lower1) & (close > lower2)
+    return hold(np.where(sell, 0.0, np.where(buy, 1.0, np.nan)))
+
+if njit != None:
+    rsisignals = njit(cache=True)(rsiloop)
+    rsimacdsignals = njit(cache=True)(rsimacdloop)
+    dbbsignals = njit(cache=True)(dbbloop)
+else:
+    rsisignals = rsivectorized
+    rsimacdsignals = rsimacdvectorized
+    dbbsignals = dbbvectorized
+
+def asarray(data, index):
+    """Aligns data on index and returns it as a contiguous float64 array."""
+    return np.ascontiguousarray(data.reindex(index).to_numpy(dtype=np.float64))
@@ -1,54 +1,389 @@
 import argparse
-import pandas as pd
-from datetime import datetime, timedelta, timezone
+import http.client
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
 from api.binance import Binance, Intervals
+from store import KlineStore
 import utils
 
-import time
+# nombre maximum de klines renvoyées par l'API en une requête
+PAGE_SIZE = 1000
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("symbol")
-    parser.add_argument("--interval", default="1m")
-    parser.add_argument("--start")
-    parser.add_argument("--end")
-    args = parser.parse_args()
+class DownloadError(Exception):
+    pass
 
-    if args.interval not in Intervals:
-        print("Invalid interval", args.interval)
-        exit(1)
+def tomillis(delta):
+    return int(delta.total_seconds() * 1000)
+
+def missingranges(times, start, end, step):
+    """Returns the (first, last) open time ranges, in milliseconds and included, which are not covered by times.
+
+    times are the sorted open times already stored, step the interval duration.
+    A gap is detected when two consecutive times are more than one and a half
+    interval apart, which also suits the irregular monthly interval.
+    """
+    times = [t for t in times if start <= t <= end]
+    if len(times) == 0:
+        return [(start, end)] if start <= end else []
+
+    ranges = []
+    if times[0] - start >= step:
+        ranges.append((start, times[0] - 1))
+    for previous, current in zip(times[:-1], times[1:]):
+        if current - previous > step + step // 2:
+            ranges.append((previous + 1, current - 1))
+    if end - times[-1] >= step:
+        ranges.append((times[-1] + 1, end))
+    return ranges
+
+def subtract(ranges, excluded):
+    """Removes the excluded ranges from ranges, all bounds being included."""
+    for low, high in sorted(excluded):
+        result = []
+        for first, last in ranges:
+            if high < first or low > last:
+                result.append((first, last))
+                continue
+            if first < low:
+                result.append((first, low - 1))
+            if last > high:
+                result.append((high + 1, last))
+        ranges = result
+    return ranges
+
+class Checkpoint():
+    """Progress of a download, stored next to the klines of the series.
+
+    Ranges in which the exchange has no klines (before the listing of a pair or
+    during maintenances) are remembered so that they are not requested again.
+    The klines already downloaded are found in the store, an interrupted
+    download therefore resumes from the missing ranges only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.empty = []
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.empty = [tuple(r) for r in data.get('empty', [])]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'empty': self.empty}, f)
+        os.replace(tmp, self.path)
+
+class Downloader():
+    """Downloads the klines of a series which are missing from the store.
+
+    Pages are accumulated in a list and written to the store every flushpages
+    pages, each write being a checkpoint from which an interrupted download
+    resumes.
+    """
+
+    def __init__(self, api, store: KlineStore, symbol, interval, flushpages=10):
+        self.api = api
+        self.store = store
+        self.symbol = symbol.upper()
+        self.interval = interval
+        self.step = tomillis(Intervals[interval])
+        self.flushpages = flushpages
+        self.checkpoint = Checkpoint(os.path.join(store.directory(symbol, interval), 'checkpoint.json'))
+        self.pages = []
+        self.requests = 0
+        self.klines = 0
+
+    def laststored(self):
+        """Returns the open time of the last stored kline, or None."""
+        months = self.store.months(self.symbol, self.interval)
+        if len(months) == 0:
+            return None
+        return int(self.store.times(self.symbol, self.interval, start=months[-1] + '-01')[-1])
+
+    def missing(self, start, end):
+        times = self.store.times(self.symbol, self.interval, start, end).tolist()
+        return subtract(missingranges(times, start, end, self.step), self.checkpoint.empty)
+
+    def download(self, start, end):
+        """Fetches the missing klines between start and end, in milliseconds, and returns the number of klines stored."""
+        for first, last in self.missing(start, end):
+            logging.info("{} {} - downloading {} to {}".format(self.symbol, self.interval, first, last))
+            self.fetch(first, last)
+        self.flush()
+        return self.klines
+
+    def fetch(self, first, last):
+        cursor = first
+        while cursor != None and cursor <= last:
+            status, data = self.api.getklines(self.symbol, self.interval, PAGE_SIZE, cursor, last)
+            self.requests += 1
+            if status != 200:
+                # ce qui a déjà été téléchargé est conservé pour reprendre plus tard
+                self.flush()
+                raise DownloadError("Could not get {} {} klines from {} : {} {}".format(self.symbol, self.interval, cursor, status, data))
+
+            cursor = self.addpage(cursor, last, data)
+            if len(self.pages) >= self.flushpages:
+                self.flush()
+
+    def addpage(self, first, last, data):
+        """Collects a page of klines requested from first to last and returns the next time to request, or None when the range is complete."""
+        if len(data) == 0:
+            self.markempty(first, last)
+            return None
+        if data[0][0] > first:
+            self.markempty(first, data[0][0] - 1)
+        for previous, current in zip(data[:-1], data[1:]):
+            if current[0] - previous[0] > self.step + self.step // 2:
+                self.markempty(previous[0] + 1, current[0] - 1)
+
+        # la dernière chandelle n'est pas stockée tant qu'elle n'est pas clôturée
+        now = int(time.time() * 1000)
+        closed = [k for k in data if k[6] < now]
+        if len(closed) > 0:
+            self.pages.append(closed)
+        if len(closed) < len(data):
+            return None
+
+        # une page incomplète signifie que la plage est épuisée
+        if len(data) < PAGE_SIZE:
+            self.markempty(data[-1][0] + 1, last)
+            return None
 
-    delta = Intervals[args.interval]
+        return data[-1][0] + 1
 
-    start = None
-    if args.start != None:
-        start = datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S')
-        start = start.replace(tzinfo=timezone.utc)
+    def markempty(self, first, last):
+        # une plage plus courte qu'un intervalle ne peut pas contenir de chandelle
+        if last - first + 1 < self.step:
+            return
+        # une plage récente peut encore recevoir des klines, elle n'est pas mémorisée
+        if last < int(time.time() * 1000) - self.step:
+            self.checkpoint.empty.append((first, last))
 
-    end = datetime.utcnow()
-    if args.end != None:
-        end = datetime.strptime(args.end, '%Y-%m-%dT%H:%M:%S')
-        end = end.replace(tzinfo=timezone.utc)
+    def flush(self):
+        if len(self.pages) > 0:
+            klines = [k for page in self.pages for k in page]
+            self.store.write(self.symbol, self.interval, utils.klinestodataframe(klines))
+            self.klines += len(klines)
+            self.pages = []
+        self.checkpoint.save()
 
-    api = Binance({})
-    status, data = api.getklines(args.symbol, args.interval, 1000, int(start.timestamp() * 1000) if start != None else None, int(end.timestamp() * 1000))
-    df = utils.klinestodataframe(data)
-    ohlc = df
+def klinesweight(limit):
+    """Request weight of a klines request, as documented by Binance."""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
 
-    while data != []:
-        newstart = df.index[-1] + delta
+class RateLimiter():
+    """Thread safe request budget modeled on the rateLimits of exchangeinfo().
 
-        status, data = api.getklines(args.symbol, args.interval, 1000, int(newstart.timestamp() * 1000) if start != None else None, int(end.timestamp() * 1000))
+    Each limit is a sliding window of the weights (or the number of requests
+    for RAW_REQUESTS limits) spent during its interval. Only a fraction of the
+    limits is used, to leave room for the live trading processes.
+    """
 
-        if data != []:
-            df = utils.klinestodataframe(data)
-            ohlc = ohlc.append(df)
+    Seconds = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
 
-    path = "data/{}_{}_{}_{}.csv".format(args.symbol, start.strftime('%Y%m%d-%H%M%S'), end.strftime('%Y%m%d-%H%M%S'), args.interval)
+    def __init__(self, limits, margin=0.8):
+        self.windows = []
+        for ratelimittype, seconds, limit in limits:
+            self.windows.append({'type': ratelimittype, 'seconds': seconds, 'limit': max(1, int(limit * margin)), 'events': deque(), 'used': 0})
+        self.condition = threading.Condition()
+        self.resume = 0.0
+        self.waited = 0.0
+        self.pauses = 0
 
-    f = open(path, 'w+')
-    ohlc.to_csv(f)
-    f.close()
+    @staticmethod
+    def fromexchangeinfo(info, margin=0.8):
+        limits = []
+        for limit in info.get('rateLimits', []):
+            if limit['rateLimitType'] in ('REQUEST_WEIGHT', 'RAW_REQUESTS'):
+                limits.append((limit['rateLimitType'], RateLimiter.Seconds[limit['interval']] * limit['intervalNum'], limit['limit']))
+        return RateLimiter(limits, margin)
+
+    def acquire(self, weight):
+        """Blocks until the request fits in every window, then spends it."""
+        start = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self.resume - now
+                for window in self.windows:
+                    events = window['events']
+                    while len(events) > 0 and events[0][0] <= now - window['seconds']:
+                        window['used'] -= events.popleft()[1]
+                    cost = weight if window['type'] == 'REQUEST_WEIGHT' else 1
+                    if window['used'] + cost > window['limit'] and len(events) > 0:
+                        wait = max(wait, events[0][0] + window['seconds'] - now)
+
+                if wait <= 0:
+                    for window in self.windows:
+                        cost = weight if window['type'] == 'REQUEST_WEIGHT' else 1
+                        window['events'].append((now, cost))
+                        window['used'] += cost
+                    self.waited += now - start
+                    return
+                self.condition.wait(wait)
+
+    def pause(self, seconds):
+        """Suspends every request for a while, after the exchange refused one."""
+        with self.condition:
+            self.pauses += 1
+            self.resume = max(self.resume, time.monotonic() + seconds)
+
+class BulkDownloader():
+    """Downloads the missing klines of many series concurrently.
+
+    Missing ranges are split in pages which are fetched by a bounded thread
+    pool within the request budget of a RateLimiter. Requests refused with 429
+    (too many requests) or 418 (IP banned) suspend every worker with a
+    jittered exponential backoff. Pages are written to the store by the
+    Downloader of their series.
+    """
+
+    def __init__(self, api, store: KlineStore, series, workers=8, limiter: RateLimiter = None, retries=5, backoff=1.0):
+        self.api = api
+        self.downloaders = [Downloader(api, store, symbol, interval) for symbol, interval in series]
+        self.locks = {downloader: threading.Lock() for downloader in self.downloaders}
+        self.workers = workers
+        self.limiter = limiter if limiter != None else RateLimiter([('REQUEST_WEIGHT', 60, 1200)])
+        self.retries = retries
+        self.backoff = backoff
+
+    def pages(self, start, end):
+        for downloader in self.downloaders:
+            first = start if start != None else downloader.laststored()
+            if first == None:
+                logging.error("{} {} - no kline stored, a start time is required".format(downloader.symbol, downloader.interval))
+                continue
+            for low, high in downloader.missing(first, end):
+                size = PAGE_SIZE * downloader.step
+                for page in range(low, high + 1, size):
+                    yield downloader, page, min(page + size - 1, high)
+
+    def download(self, start, end):
+        """Fetches the missing klines of every series and returns the number of klines stored.
+
+        A None start resumes each series from its last stored kline.
+        """
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.fetch, downloader, first, last) for downloader, first, last in self.pages(start, end)]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except DownloadError as e:
+                    logging.error(e)
+                    errors.append(e)
+
+        for downloader in self.downloaders:
+            downloader.flush()
+        if len(errors) > 0:
+            raise DownloadError("{} pages could not be downloaded, first error : {}".format(len(errors), errors[0]))
+        return sum(downloader.klines for downloader in self.downloaders)
+
+    def fetch(self, downloader, first, last):
+        cursor = first
+        attempt = 0
+        while cursor != None and cursor <= last:
+            self.limiter.acquire(klinesweight(PAGE_SIZE))
+            try:
+                status, data = self.api.getklines(downloader.symbol, downloader.interval, PAGE_SIZE, cursor, last)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                status, data = None, e
+
+            if status != 200:
+                attempt += 1
+                # les erreurs de requête autres que les limites ne sont pas réessayées
+                if attempt > self.retries or (status != None and 400 <= status < 500 and status not in (418, 429)):
+                    raise DownloadError("Could not get {} {} klines from {} : {} {}".format(downloader.symbol, downloader.interval, cursor, status, data))
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if status in (418, 429):
+                    logging.warning("{} {} - rate limited ({}), backing off {:.1f}s".format(downloader.symbol, downloader.interval, status, delay))
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            attempt = 0
+            with self.locks[downloader]:
+                downloader.requests += 1
+                cursor = downloader.addpage(cursor, last, data)
+                if len(downloader.pages) >= downloader.flushpages:
+                    downloader.flush()
+
+def parsedate(value):
+    date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    return date.replace(tzinfo=timezone.utc)
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", nargs='*')
+    parser.add_argument("--interval", nargs='+', default=["1m"])
+    parser.add_argument("--config", help='Downloads the pairs of this configuration file')
+    parser.add_argument("--start", help='Defaults to the last stored kline')
+    parser.add_argument("--end", help='Defaults to now')
+    parser.add_argument("--root", default="data", help='Root directory of the store')
+    parser.add_argument("--workers", type=int, default=1, help='Concurrent requests, within the rate limits of the exchange')
+    args = parser.parse_args()
+
+    for interval in args.interval:
+        if interval not in Intervals:
+            print("Invalid interval", interval)
+            exit(1)
+
+    symbols = list(args.symbols)
+    if args.config != None:
+        with open(args.config, 'r') as f:
+            symbols += list(json.load(f)['pairs'].keys())
+    if len(symbols) == 0:
+        parser.error("a symbol or --config is required")
+
+    store = KlineStore(args.root)
+    end = int((parsedate(args.end) if args.end != None else datetime.now(timezone.utc)).timestamp() * 1000)
+    start = int(parsedate(args.start).timestamp() * 1000) if args.start != None else None
+
+    api = Binance({"api": {"poolsize": max(args.workers, 1)}})
+    series = [(symbol, interval) for symbol in symbols for interval in args.interval]
+
+    if args.workers > 1 or len(series) > 1:
+        status, info = api.exchangeinfo()
+        limiter = RateLimiter.fromexchangeinfo(info) if status == 200 else None
+        downloader = BulkDownloader(api, store, series, args.workers, limiter)
+        downloaders = downloader.downloaders
+    else:
+        downloader = Downloader(api, store, symbols[0], args.interval[0])
+        downloaders = [downloader]
+        if start == None:
+            start = downloader.laststored()
+            if start == None:
+                print("No {} {} klines stored, --start is required".format(symbols[0], args.interval[0]))
+                exit(1)
+
+    try:
+        downloader.download(start, end)
+    except DownloadError as e:
+        logging.error(e)
+        print("Download interrupted, run the same command again to resume")
+        exit(1)
+    finally:
+        print("{} klines stored in {} requests".format(sum(d.klines for d in downloaders), sum(d.requests for d in downloaders)))
 
 if __name__ == "__main__":
     main()
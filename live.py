@@ -1,29 +1,42 @@
 import argparse
+import asyncio
 import logging
 import datetime
 import time
+import http.client
 import json
-import websockets
-import socket
+import random
+import signal
+import sys
 import time
+from time import perf_counter
 
 import pandas as pd
 
 from pymongo import MongoClient
 
-from api.binance import Binance, OrderStatus, OrderType, OrderSide
+from api.binance import Binance, AsyncBinance, OrderStatus, OrderType, OrderSide, Intervals
+from api.latency import telemetry
+from api.messages import Kline, ExecutionReport, fromdict
 import strategies
 import indicators
 import utils
+from candles import CandleBuffer
+from resample import Resampler
+from persistence import OrderWriter, CandleWriter
 
 class Book():
     """Emits and persists buy and sell orders.
     Calculates profit and loss, and adjusts initial quantity.
+
+    Orders are persisted through an OrderWriter, written immediately unless
+    it has been started by the caller.
     """
 
-    def __init__(self, api, db, symbol, quantity):
+    def __init__(self, api, db, symbol, quantity, writer=None):
         self.api = api
         self.db = db
+        self.writer = writer if writer != None else OrderWriter(db.orders)
         self.symbol = symbol
         self.quantity = float(quantity)
         # indique si on possède de la devise
@@ -32,6 +45,8 @@ class Book():
         self.orders = {}
         self.lastbuyorderid = None
         self.lastsellorderid = None
+        # rapports d'exécution reçus avant la réponse à l'ordre, indexés par orderId
+        self.earlyreports = {}
 
         # récupère le dernier ordree, si c'est un ordre d'achat, on le retient
         cursor = self.db.orders.find({'symbol' : self.symbol}).limit(1).sort('transactTime', -1)
@@ -53,35 +68,28 @@ class Book():
         if self.holding == False:
 
             # s'il y a déjà eu un ordre d'achat et qu'il n'a été FILLED, on l'annule
-            if self.lastbuyorderid != None:
-                if self.orders[self.lastbuyorderid]['status'] != OrderStatus.FILLED.name:
-                    logging.info("Cancelling last unfilled BUY order {}".format(self.lastbuyorderid))
-                    status, data = self.api.cancelorder(self.symbol, self.lastbuyorderid)
-                    if status == 200:
-                        logging.info("Successfuly canceled order {}".format(self.lastbuyorderid))
-                        del self.orders[self.lastbuyorderid]
-                        self.lastbuyorderid = None
-                    else:
-                        logging.error("Could not cancel order {} : {}".format(self.lastbuyorderid, data))
-                        return
+            orderid = self.unfilledbuy()
+            if orderid != None:
+                status, data = self.api.cancelorder(self.symbol, orderid)
+                if not self.cancelled(orderid, status, data):
+                    return False
 
             status, order = self.api.order(self.symbol, OrderSide.BUY, OrderType.LIMIT, self.quantity, price)
-            if status == 200:
-                logging.info("Order sent {}".format(order))
-
-                order['transactTime'] = datetime.datetime.utcfromtimestamp(order['transactTime'] / 1000)
-
-                if order['status'] == OrderStatus.FILLED.name or order['status'] == OrderStatus.PARTIALLY_FILLED.name:
-                    self.holding = True
+            return self.ordered(OrderSide.BUY, status, order)
 
-                self.orders[order['orderId']] = order
-                self.lastbuyorderid = order['orderId']
+        return False
 
-                self.db.orders.insert_one(order)
+    async def buyasync(self, price) -> bool:
+        """Same as buy, with an api whose methods are coroutines."""
+        if self.holding == False:
+            orderid = self.unfilledbuy()
+            if orderid != None:
+                status, data = await self.api.cancelorder(self.symbol, orderid)
+                if not self.cancelled(orderid, status, data):
+                    return False
 
-                return True
-            else:
-                logging.error("Could not send order : {}".format(order))
+            status, order = await self.api.order(self.symbol, OrderSide.BUY, OrderType.LIMIT, self.quantity, price)
+            return self.ordered(OrderSide.BUY, status, order)
 
         return False
 
@@ -95,45 +103,102 @@ class Book():
         if self.lastbuyorderid != None and self.holding == True:
 
             # s'il y a déjà eu un ordre de vente et qu'il n'a été FILLED ou PARTIALLY_FILLED, on l'annule
-            if self.lastsellorderid != None:
-                if self.orders[self.lastsellorderid]['status'] != OrderStatus.FILLED.name and self.orders[self.lastsellorderid]['status'] != OrderStatus.PARTIALLY_FILLED.name:
-                    logging.info("Cancelling last unfilled SELL order {}".format(self.lastbuyorderid))
-                    status, data = self.api.cancelorder(self.symbol, self.lastsellorderid)
-                    if status == 200:
-                        logging.info("Successfuly canceled order {}".format(self.lastsellorderid))
-                        del self.orders[self.lastsellorderid]
-                        self.lastsellorderid = None
-                    else:
-                        logging.error("Could not cancel order {} : {}".format(self.lastsellorderid, data))
-                        return
+            orderid = self.unfilledsell()
+            if orderid != None:
+                status, data = self.api.cancelorder(self.symbol, orderid)
+                if not self.cancelled(orderid, status, data):
+                    return False
+
+            quantity = self.sellquantity()
+            if quantity != None:
+                status, order = self.api.order(self.symbol, OrderSide.SELL, OrderType.LIMIT, quantity, price)
+                return self.ordered(OrderSide.SELL, status, order)
 
-            if self.orders[self.lastbuyorderid]['status'] == OrderStatus.FILLED.name or self.orders[self.lastbuyorderid]['status'] == OrderStatus.PARTIALLY_FILLED.name:
-                # Attention : s'assurer que le compte contient une quantité de BNB pour couvrir les commissions
+        return False
 
-                # on récupère la quantité achetée
-                if "filledQuantity" in self.orders[self.lastbuyorderid]:
-                    quantity = self.orders[self.lastbuyorderid]["filledQuantity"]
-                else:
-                    quantity = self.quantity
+    async def sellasync(self, price) -> bool:
+        """Same as sell, with an api whose methods are coroutines."""
+        if self.lastbuyorderid != None and self.holding == True:
+            orderid = self.unfilledsell()
+            if orderid != None:
+                status, data = await self.api.cancelorder(self.symbol, orderid)
+                if not self.cancelled(orderid, status, data):
+                    return False
 
-                status, order = self.api.order(self.symbol, OrderSide.SELL, OrderType.LIMIT, quantity, price)
-                if status == 200:
-                    logging.info("Order sent {}".format(order))
+            quantity = self.sellquantity()
+            if quantity != None:
+                status, order = await self.api.order(self.symbol, OrderSide.SELL, OrderType.LIMIT, quantity, price)
+                return self.ordered(OrderSide.SELL, status, order)
 
-                    order['transactTime'] = datetime.datetime.utcfromtimestamp(order['transactTime'] / 1000)
+        return False
+
+    def unfilledbuy(self):
+        """Returns the id of the last buy order if it has to be cancelled before buying again."""
+        if self.lastbuyorderid != None and self.orders[self.lastbuyorderid]['status'] != OrderStatus.FILLED.name:
+            logging.info("Cancelling last unfilled BUY order {}".format(self.lastbuyorderid))
+            return self.lastbuyorderid
+        return None
+
+    def unfilledsell(self):
+        """Returns the id of the last sell order if it has to be cancelled before selling again."""
+        if self.lastsellorderid != None:
+            if self.orders[self.lastsellorderid]['status'] != OrderStatus.FILLED.name and self.orders[self.lastsellorderid]['status'] != OrderStatus.PARTIALLY_FILLED.name:
+                logging.info("Cancelling last unfilled SELL order {}".format(self.lastsellorderid))
+                return self.lastsellorderid
+        return None
+
+    def cancelled(self, orderid, status, data) -> bool:
+        if status == 200:
+            logging.info("Successfuly canceled order {}".format(orderid))
+            telemetry.count('cancels', self.symbol)
+            del self.orders[orderid]
+            if self.lastbuyorderid == orderid:
+                self.lastbuyorderid = None
+            if self.lastsellorderid == orderid:
+                self.lastsellorderid = None
+            return True
+
+        logging.error("Could not cancel order {} : {}".format(orderid, data))
+        telemetry.count('cancelrejects', self.symbol)
+        return False
 
-                    if order['status'] == OrderStatus.FILLED.name or order['status'] == OrderStatus.PARTIALLY_FILLED.name:
-                        self.holding = False
+    def sellquantity(self):
+        """Returns the quantity to sell, or None if the last buy order has not been filled."""
+        if self.orders[self.lastbuyorderid]['status'] == OrderStatus.FILLED.name or self.orders[self.lastbuyorderid]['status'] == OrderStatus.PARTIALLY_FILLED.name:
+            # Attention : s'assurer que le compte contient une quantité de BNB pour couvrir les commissions
 
-                    self.orders[order['orderId']] = order
-                    self.lastsellorderid = order['orderId']
-                    
-                    self.db.orders.insert_one(order)
+            # on récupère la quantité achetée
+            if "filledQuantity" in self.orders[self.lastbuyorderid]:
+                return self.orders[self.lastbuyorderid]["filledQuantity"]
+            return self.quantity
+        return None
 
-                    return True
-                else:
-                    logging.error("Could not send order : {}".format(order))
+    def ordered(self, side: OrderSide, status, order) -> bool:
+        """Records an order accepted by the brocker."""
+        if status == 200:
+            logging.info("Order sent {}".format(order))
+            telemetry.count('orders', self.symbol)
 
+            order['transactTime'] = datetime.datetime.utcfromtimestamp(order['transactTime'] / 1000)
+
+            if order['status'] == OrderStatus.FILLED.name or order['status'] == OrderStatus.PARTIALLY_FILLED.name:
+                self.holding = side == OrderSide.BUY
+
+            self.orders[order['orderId']] = order
+            if side == OrderSide.BUY:
+                self.lastbuyorderid = order['orderId']
+            else:
+                self.lastsellorderid = order['orderId']
+
+            self.writer.upsert(order)
+
+            if order['orderId'] in self.earlyreports:
+                self.update_order(self.earlyreports.pop(order['orderId']))
+
+            return True
+
+        logging.error("Could not send order : {}".format(order))
+        telemetry.count('rejects', self.symbol)
         return False
 
     def calcpnl(self, fees=0.15):
@@ -147,33 +212,35 @@ class Book():
 
             logging.info("{} - PnL {}, new quantity {}".format(self.symbol, pnl, self.quantity))
 
-    def update_order(self, data):
-        logging.info("{}".format(data))
+    def update_order(self, report):
+        """Applies an ExecutionReport, or an executionReport event as a dict, to its order."""
+        if type(report) is dict:
+            report = ExecutionReport.fromdict(report)
+        logging.info("%s", report)
 
         order = {}
-        order['symbol'] = data['s']
-        order['side'] = data['S']
-        order['status'] = data['X']
-        order['price'] = data['p']
-        order['orderId'] = data['i']
-        order['transactTime'] = data['T']
-        order['orderQuantity'] = float(data['q'])
-        order['filledQuantity'] = float(data['z'])
+        order['symbol'] = report.symbol
+        order['side'] = report.side
+        order['status'] = report.status
+        order['price'] = report.price
+        order['orderId'] = report.orderid
+        order['transactTime'] = datetime.datetime.utcfromtimestamp(report.time / 1000)
+        order['orderQuantity'] = report.quantity
+        order['filledQuantity'] = report.filled
 
         self.filledquantity = order['filledQuantity']
 
-        order['transactTime'] = datetime.datetime.utcfromtimestamp(order['transactTime'] / 1000)
-
         if order['orderId'] in self.orders:
             self.orders[order['orderId']] = order
-
-            storedorder = self.db.orders.find_one({'orderId' : order['orderId']})
-            if storedorder != None:
-                self.db.orders.replace_one({'_id' : storedorder.get('_id')}, order)
+            self.writer.upsert(order)
 
             logging.info("Order updated {}".format(order))
         else:
+            # le rapport peut arriver par le websocket avant la réponse à l'ordre, il sera appliqué avec elle
             logging.info("Unkown order {}".format(order))
+            self.earlyreports[order['orderId']] = report
+            if len(self.earlyreports) > 100:
+                del self.earlyreports[next(iter(self.earlyreports))]
 
         # si l'ordre concerne le dernier ordre de vente
         if self.lastsellorderid != None and self.lastsellorderid == order['orderId']:
@@ -192,148 +259,505 @@ class Book():
 
 class LiveTicker():
 
-    def __init__(self, api, db, symbol, interval, quantity):
+    def __init__(self, api, db, symbol, interval, quantity, orderapi=None, writer=None, candlewriter=None, timeframes=()):
         self.symbol = symbol
         self.interval = interval
+        # les chandelles clôturées sont enregistrées pour liveview lorsqu'un CandleWriter est donné
+        self.candlewriter = candlewriter
         # Indique si on est au lancement, on attend de passer par un tendance baissière avant d'achater
         self.startup = True
         self.lasttimetick = None
+        self.lastkline = None
+        # durée d'une chandelle en millisecondes, pour détecter les chandelles manquées
+        self.step = int(Intervals[interval].total_seconds() * 1000) if interval in Intervals else None
 
-        self.book = Book(api, db, symbol, quantity)
+        # les ordres peuvent passer par un client différent, par exemple asynchrone
+        self.book = Book(orderapi if orderapi != None else api, db, symbol, quantity, writer)
         status, data = api.getklines(self.symbol.upper(), self.interval, 500)
-        self.df = utils.klinestodataframe(data)
+        history = utils.klinestodataframe(data)
+
+        # les indicateurs sont mis à jour de façon incrémentale à chaque nouvelle chandelle,
+        # on les initialise avec l'historique à l'exception de la chandelle en cours
+        #self.rsi = indicators.StreamingRSI(9)
+        #self.macd = indicators.StreamingMACD(12, 26, 9)
+        self.bb1 = indicators.StreamingBollingerBands(20, 1)
+        self.bb2 = indicators.StreamingBollingerBands(20, 2)
+        self.strategy = strategies.StreamingDBBStrategy()
+        for price in history['open'].iloc[:-1]:
+            self.updateindicators(price)
+            self.runstrategy(price)
+
+        # seules les chandelles couvertes par les indicateurs sont conservées, plus celle en cours
+        lookback = max(indicator.lookback for indicator in (self.bb1, self.bb2))
+        self.candles = CandleBuffer(lookback + 1)
+        self.candles.extend(history)
+
+        # les intervalles supérieurs lus par la stratégie sont construits à partir des chandelles reçues
+        self.resampler = None
+        if len(timeframes) > 0:
+            self.resampler = Resampler(interval, timeframes)
+            for timeframe in timeframes:
+                status, data = api.getklines(self.symbol.upper(), timeframe, 500)
+                # la chandelle en cours de l'exchange tient déjà l'historique de l'intervalle de base, sauf la chandelle en cours
+                self.resampler.seed(timeframe, utils.klinestodataframe(data), history)
+            self.resampler.extend(history)
+
+    def updateindicators(self, price):
+        #self.rsi.update(price)
+        #self.macd.update(price)
+        #logging.info("{} - RSI {} MACD {} MACD SIGNAL {}".format(self.symbol, self.rsi.value, self.macd.value[0], self.macd.value[1]))
+        self.bb1.update(price)
+        self.bb2.update(price)
+
+    def runstrategy(self, price):
+        return self.strategy.update(price, self.bb1, self.bb2)
+
+    def indicatorvalues(self):
+        return {'ma': self.bb1.ma, 'bb1upper': self.bb1.upper, 'bb1lower': self.bb1.lower,
+            'bb2upper': self.bb2.upper, 'bb2lower': self.bb2.lower, 'signal': self.strategy.signal}
+
+    def persistcandle(self):
+        """Hands the last candle, which has just closed, to the candle writer."""
+        candle = self.candles.last()
+        candle['time'] = datetime.datetime.utcfromtimestamp(candle['time'] / 1000)
+        candle['symbol'] = self.symbol
+        candle['interval'] = self.interval
+        # les indicateurs ont été calculés avec l'ouverture de cette chandelle
+        if self.candlewriter.indicators:
+            candle['indicators'] = self.indicatorvalues()
+        self.candlewriter.upsert(candle)
+
+    def signal(self, price):
+        """Returns the side of the order the strategy asks for, or None."""
+        if self.strategy.signal == 1.0 and self.startup == False:
+            logging.info("%s - BUY signal at %s", self.symbol, price)
+
+            return OrderSide.BUY
+        elif self.strategy.signal == 0.0:
+            logging.info("%s - SELL signal at %s", self.symbol, price)
 
-        #self.rsi = indicators.RSI(self.df['open'], 9)
-        #self.macd = indicators.MACD(self.df['open'], 12, 26, 9)
-        self.bb1 = indicators.BollingerBands(self.df['close'], 20, 1)
-        self.bb2 = indicators.BollingerBands(self.df['close'], 20, 2)
+            self.startup = False
 
-    def updateindicators(self):
-        #self.rsi = indicators.RSI(self.df['open'], 9)
-        #self.macd = indicators.MACD(self.df['open'], 12, 26, 9)
-        #logging.info("{} - RSI {} MACD {} MACD SIGNAL {}".format(self.symbol, self.rsi.df.iloc[-1]['rsi'], self.macd.df.iloc[-1]['MACD'], self.macd.df.iloc[-1]['signal']))
-        self.bb1 = indicators.BollingerBands(self.df['open'], 20, 1)
-        self.bb2 = indicators.BollingerBands(self.df['open'], 20, 2)
+            return OrderSide.SELL
 
-    def runstrategy(self):
-        #self.strategy = strategies.RSIMACDStrategy(self.df, self.rsi, self.macd)
-        self.strategy = strategies.DBBStrategy(self.df['open'], self.bb1, self.bb2)
+        return None
 
     def act(self, time, price):
-        if self.strategy.signals['signal'].loc[time] == 1.0 and self.startup == False:
-            logging.info("{} - BUY signal at {}".format(self.symbol, price))
-
+        side = self.signal(price)
+        if side == OrderSide.BUY:
             return self.book.buy(price)
-        elif self.strategy.signals['signal'].loc[time] == 0.0:
-            logging.info("{} - SELL signal at {}".format(self.symbol, price))
-
-            self.startup = False
-
+        elif side == OrderSide.SELL:
             return self.book.sell(price)
 
         return False
 
-    def update_price(self, data):
-        time = datetime.datetime.utcfromtimestamp(data['k']['t'] / 1000)
-        open, high, low, close, volume  = float(data['k']['o']), float(data['k']['h']), float(data['k']['l']), float(data['k']['c']), float(data['k']['v'])
-        logging.debug("{} {} {} {}".format(time, data['e'], data['s'], close))
+    async def actasync(self, side, price, received=None):
+        """Same as act for a side already read from the signal, with a book whose api methods are coroutines.
+
+        The side is read by the caller when the candle opens, as the strategy
+        may have moved on to later candles by the time this coroutine runs.
+        received is the perf_counter of the websocket message of the candle,
+        from which the tick to order latency is measured.
+        """
+        start = perf_counter()
+        if side == OrderSide.BUY:
+            sent = await self.book.buyasync(price)
+        elif side == OrderSide.SELL:
+            sent = await self.book.sellasync(price)
+        else:
+            return False
+
+        end = perf_counter()
+        telemetry.record('act', end - start, self.symbol)
+        if received != None:
+            # attente derrière la tâche précédente du symbole, puis du message à la réponse de l'ordre
+            telemetry.record('queue', start - received, self.symbol)
+            telemetry.record('ticktoorder', end - received, self.symbol)
+        return sent
 
-        if time != self.lasttimetick:
-            self.df.loc[time] = 0.0
+    def update_price(self, kline):
+        """Updates the current candle, returns its open time and price when it is a new one.
 
-            self.df.loc[time]['close'] = close
-            self.df.loc[time]['open'] = open
-            self.df.loc[time]['high'] = high
-            self.df.loc[time]['low'] = low
-            self.df.loc[time]['volume'] = volume
+        kline is a Kline, or a kline event as a dict. Acting on the signal of
+        a new candle is left to the caller.
+        """
+        if type(kline) is dict:
+            kline = Kline.fromdict(kline)
+        timestamp = kline.time
+        open, high, low, close, volume = kline.open, kline.high, kline.low, kline.close, kline.volume
+        # messages formatés seulement s'ils sont écrits, ils sont émis à chaque tick
+        logging.debug("%s %s %s", timestamp, kline.symbol, close)
+
+        # une kline plus ancienne que la chandelle en cours, par exemple retenue pendant un rattrapage, est ignorée
+        last = self.lasttimetick if self.lasttimetick != None else self.candles.lasttime()
+        if last != None and timestamp < last:
+            logging.warning("%s - stale kline %s ignored, last candle %s", self.symbol, timestamp, last)
+            telemetry.count('stale', self.symbol)
+            return None
+
+        if timestamp != self.lasttimetick:
+            if self.step != None and self.lasttimetick != None and timestamp - self.lasttimetick > self.step:
+                missed = (timestamp - self.lasttimetick) // self.step - 1
+                logging.warning("%s - %s candles missed before %s", self.symbol, missed, timestamp)
+                telemetry.count('missed', self.symbol, missed)
+
+            # si la dernière chandelle de l'historique s'est clôturée avant le premier message,
+            # elle n'a pas encore été prise en compte par les indicateurs
+            if self.lasttimetick == None and timestamp > self.candles.lasttime():
+                self.updateindicators(self.candles.open[-1])
+                self.runstrategy(self.candles.open[-1])
+
+            if timestamp == self.candles.lasttime():
+                self.candles.revise(open, high, low, close, volume)
+            else:
+                if self.candlewriter != None:
+                    self.persistcandle()
+                self.candles.append(timestamp, open, high, low, close, volume)
+            if self.resampler != None:
+                self.resampler.update(timestamp, open, high, low, close, volume)
 
-            logging.info("{} - OPEN {} HIGH {} LOW {} CLOSE {}".format(self.symbol, open, high, low, close))
+            logging.info("%s - OPEN %s HIGH %s LOW %s CLOSE %s", self.symbol, open, high, low, close)
+            telemetry.count('candles', self.symbol)
 
             # nouvelle chandelle
             # mise à jour des indicateurs
-            self.updateindicators()
+            start = perf_counter()
+            self.updateindicators(open)
+            updated = perf_counter()
+            telemetry.record('indicators', updated - start, self.symbol)
             # la stratégie détermine les signaux d'achat / vente
-            self.runstrategy()
-            self.act(time, open)   
-        else:
-            self.df.loc[time]['close'] = close
-            self.df.loc[time]['open'] = open
-            self.df.loc[time]['high'] = high
-            self.df.loc[time]['low'] = low
-            self.df.loc[time]['volume'] = volume
+            self.runstrategy(open)
+            telemetry.record('strategy', perf_counter() - updated, self.symbol)
+            self.lasttimetick = timestamp
+            self.lastkline = kline
+            return datetime.datetime.utcfromtimestamp(timestamp / 1000), open
+
+        # la plupart des messages ne changent que le volume, que rien ne lit avant la clôture
+        last = self.lastkline
+        if not kline.closed and close == last.close and high == last.high and low == last.low and open == last.open:
+            telemetry.count('unchanged', self.symbol)
+            return None
+
+        self.candles.revise(open, high, low, close, volume)
+        if self.resampler != None:
+            self.resampler.update(timestamp, open, high, low, close, volume)
+        self.lastkline = kline
+        return None
+
+    def backfill(self, klines):
+        """Applies the klines closed since the last candle, as returned by getklines, without acting on them.
+
+        The last kline, which is still open, is left to the websocket.
+        Returns the number of candles added.
+        """
+        last = self.candles.lasttime()
+        added = 0
+        for k in klines[:-1]:
+            timestamp = int(k[0])
+            if timestamp < last:
+                continue
+            self.update_price(Kline(self.symbol, timestamp, float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), True))
+            if timestamp > last:
+                added += 1
+        telemetry.count('backfilled', self.symbol, added)
+        return added
+
+def reconnectdelay(attempt, backoff, maxbackoff):
+    """Seconds to wait before a reconnection, doubling with each attempt up to maxbackoff, with a random jitter."""
+    return min(maxbackoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+class Supervisor():
+    """Keeps the websocket of ws subscribed, reconnecting after a jittered exponential backoff.
+
+    The delay starts at backoff seconds and doubles after every failed
+    attempt up to maxbackoff, it is reset once connected. disconnected is
+    the time.monotonic of the last disconnection until the missed candles
+    are backfilled.
+
+    While subscribed, the listen key is pinged by the orderapi every
+    listenkeyperiod seconds and the telemetry is logged every
+    telemetryperiod seconds, each from its own task of the event loop.
+    """
+
+    def initsupervisor(self, config):
+        reconnect = config.get('reconnect', {})
+        self.backoff = reconnect.get('backoff', 1.0)
+        self.maxbackoff = reconnect.get('maxbackoff', 60.0)
+        self.attempt = 0
+        self.stream = None
+        self.stopping = False
+        self.disconnected = None
+
+        # la clé expire après 60 minutes sans ping
+        listenkey = config.get('listenkey', {})
+        self.listenkeyperiod = listenkey.get('period', 30 * 60)
+        self.listenkeyretries = listenkey.get('retries', 3)
+        self.telemetryperiod = config.get('telemetry', {}).get('period', 300)
+
+    async def supervise(self):
+        tasks = [asyncio.ensure_future(self.restarting(self.keepalive)), asyncio.ensure_future(self.restarting(self.report))]
+        try:
+            await self.resubscribeloop()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resubscribeloop(self):
+        while not self.stopping:
+            self.stream = asyncio.ensure_future(self.ws())
+            await asyncio.wait([self.stream])
+            if self.stopping:
+                break
+            if self.disconnected == None:
+                self.disconnected = time.monotonic()
+            if self.stream.cancelled():
+                # nouvelle listen key, on se réabonne sans attendre
+                logging.info("Resubscribing with the new listen key")
+                continue
+
+            logging.error("Websocket disconnected : {!r}".format(self.stream.exception()))
+            telemetry.count('disconnects')
+            delay = reconnectdelay(self.attempt, self.backoff, self.maxbackoff)
+            self.attempt += 1
+            logging.info("Reconnecting in {:.1f}s".format(delay))
+            await asyncio.sleep(delay)
+
+    async def restarting(self, function):
+        """Runs the coroutine function, and runs it again after a backoff whenever it exits."""
+        while True:
+            try:
+                await function()
+                logging.error("{} exited".format(function.__name__))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("{} failed".format(function.__name__))
+            # sans ping, la listen key expire et les executionReport ne sont plus reçus
+            telemetry.count('restarts')
+            await asyncio.sleep(self.backoff)
+
+    async def keepalive(self):
+        """Pings the listen key periodically, retrying after a backoff, and replaces it once the retries are exhausted."""
+        attempt = 0
+        while True:
+            if attempt == 0:
+                await asyncio.sleep(self.listenkeyperiod)
+            else:
+                await asyncio.sleep(reconnectdelay(attempt - 1, self.backoff, self.maxbackoff))
+            if await self.pinglistenkey(renew=attempt >= self.listenkeyretries):
+                attempt = 0
+            else:
+                attempt += 1
 
-        self.lasttimetick = time
+    async def pinglistenkey(self, renew=False):
+        """Pings the listen key, or creates a new one when it expired or renew is True.
 
-class Router():
+        Returns False when it should be tried again.
+        """
+        try:
+            if not renew:
+                status, data = await self.orderapi.pinglistenkey(self.listenkey)
+                if status == 200:
+                    telemetry.count('listenkeypings')
+                    return True
+                logging.warning("Could not update listen key : {}".format(data))
+                telemetry.count('listenkeyfailures')
+                # -1125 : la clé n'existe plus, la pinger à nouveau est inutile
+                if not (type(data) is dict and data.get('code') == -1125):
+                    return False
+
+            logging.info("Creating a new listen key")
+            status, data = await self.orderapi.createlistenkey()
+        except (OSError, EOFError, asyncio.TimeoutError, http.client.HTTPException, ValueError) as e:
+            # IncompleteReadError est une EOFError, ni elle ni TimeoutError ne sont des OSError avant Python 3.11
+            logging.warning("Could not update listen key : {!r}".format(e))
+            telemetry.count('listenkeyfailures')
+            return False
+
+        if status != 200:
+            logging.warning("Could not create listen key : {}".format(data))
+            telemetry.count('listenkeyfailures')
+            return False
+        # le websocket est rouvert avec la nouvelle clé par supervise
+        self.listenkey = data['listenKey']
+        telemetry.count('listenkeys')
+        self.resubscribe()
+        return True
+
+    async def report(self):
+        """Logs the telemetry periodically, in wall time."""
+        while True:
+            await asyncio.sleep(self.telemetryperiod)
+            telemetry.log()
+
+    def resubscribe(self):
+        """Closes the websocket, which supervise opens again at once, with the current listen key."""
+        if self.stream != None:
+            self.stream.cancel()
+
+    def stop(self):
+        self.stopping = True
+        if self.stream != None:
+            self.stream.cancel()
+
+    def subscribe(self):
+        asyncio.get_event_loop().run_until_complete(self.supervise())
 
-    def __init__(self, config, api, db, listenkey):
+class Router(Supervisor):
+    """Routes the websocket events to the tickers.
+
+    Orders and backfills are sent by an AsyncBinance as tasks of the
+    websocket's event loop, so that waiting for the exchange never delays the
+    candles of the other symbols. The tasks of a symbol run one after the
+    other, in the order of the candles.
+
+    After a reconnection the klines closed meanwhile are fetched for every
+    ticker, the messages of the new websocket waiting until they are applied.
+    """
+
+    def __init__(self, config, api, db, listenkey, orderapi=None, writer=None):
         self.tickers = {}
         self.api = api
+        self.orderapi = orderapi if orderapi != None else AsyncBinance(config, api.test)
+        # les ordres de tous les symboles sont écrits en base par un même thread
+        self.writer = writer if writer != None else OrderWriter(db.orders).start()
+        self.writer.ensureindexes()
+        # les chandelles sont enregistrées seulement si la configuration le demande
+        self.candlewriter = None
+        if 'candles' in config:
+            self.candlewriter = CandleWriter(db.candles, config['candles'].get('retention', 30) * 86400, config['candles'].get('indicators', False)).start()
+            self.candlewriter.ensureindexes()
         for key in config['pairs']:
             symbol = key
             interval = config['pairs'][key]['interval']
             quantity = config['pairs'][key]['quantity']
-            ticker = LiveTicker(api, db, symbol, interval, quantity)
+            timeframes = config['pairs'][key].get('timeframes', [])
+            ticker = LiveTicker(api, db, symbol, interval, quantity, self.orderapi, self.writer, self.candlewriter, timeframes)
             self.tickers[symbol] = ticker
 
-        # toutes les 30 minutes on ping la clé
+        # dernière tâche lancée par symbole
+        self.tasks = {}
+
         self.listenkey = listenkey
-        self.lastlistenkeyupdate = None
-        self.listenkeyupdateperiod = datetime.timedelta(minutes=30)
 
-    def route(self, stream, data):
-        eventtype = data['e']
-        eventtime = data['E']
-        eventtime = datetime.datetime.utcfromtimestamp(eventtime / 1000)
+        # messages reçus pendant le rattrapage des chandelles
+        self.pending = None
+        self.initsupervisor(config)
 
-        if eventtype == 'kline':
-            symbol = stream.split("@")[0].upper()
+    def ws(self):
+        return self.api.ws(self.receive, listenkey=self.listenkey, connected=self.connected)
+
+    def receive(self, stream, event):
+        if self.pending != None:
+            self.pending.append((stream, event))
+        else:
+            self.route(stream, event)
+
+    def connected(self):
+        self.attempt = 0
+        if self.disconnected != None and self.pending == None:
+            self.pending = []
+            self.dispatch('backfill', self.backfill())
+
+    async def backfill(self):
+        """Applies the klines closed since the disconnection to every ticker, then the messages received meanwhile."""
+        try:
+            added = await asyncio.gather(*(self.backfillticker(ticker) for ticker in self.tickers.values()))
+        finally:
+            pending, self.pending = self.pending, None
+            for stream, event in pending:
+                self.route(stream, event)
+        elapsed = time.monotonic() - self.disconnected
+        self.disconnected = None
+        telemetry.record('reconnect', elapsed)
+        logging.info("Reconnected in {:.1f}s, {} candles backfilled".format(elapsed, sum(added)))
+
+    async def backfillticker(self, ticker):
+        # les chandelles manquées, plus celle en cours lors de la déconnexion et la nouvelle, dans la limite d'une requête
+        limit = 1000
+        if ticker.step != None:
+            limit = min(limit, (self.api.timestamp() - ticker.candles.lasttime()) // ticker.step + 2)
+        status, data = await self.orderapi.getklines(ticker.symbol.upper(), ticker.interval, limit)
+        if status != 200:
+            logging.error("{} - could not backfill the candles : {}".format(ticker.symbol, data))
+            return 0
+        return ticker.backfill(data)
+
+    def route(self, stream, event):
+        """Handles an event of the websocket, a Kline, an ExecutionReport, or any event as a dict."""
+        start = perf_counter()
+        received = telemetry.received if telemetry.received != None else start
+        telemetry.count('messages')
+        symbol = None
+
+        if type(event) is dict:
+            event = fromdict(event)
+        eventtype = type(event)
+
+        if eventtype is Kline:
+            symbol = event.symbol
 
             if symbol in self.tickers:
                 ticker = self.tickers[symbol]
-                ticker.update_price(data)
+                candle = ticker.update_price(event)
+                telemetry.record('update_price', perf_counter() - start, symbol)
+                if candle != None:
+                    # le signal est lu à l'ouverture de la chandelle, pas quand la tâche du symbole s'exécute
+                    side = ticker.signal(candle[1])
+                    if side != None:
+                        self.dispatch(symbol, ticker.actasync(side, candle[1], received))
             else:
                 logging.error("Unrecognized stream {}".format(stream))
+                symbol = None
 
-        elif eventtype == 'executionReport':
-            symbol = data['s']
+        elif eventtype is ExecutionReport:
+            symbol = event.symbol
 
             if symbol in self.tickers:
                 ticker = self.tickers[symbol]
-                ticker.book.update_order(data)
-
-        else:
-            logging.info("Unhandled event{}".format(eventtype))
-
-        # mise à jour de la listen key
-        if self.lastlistenkeyupdate == None:
-            self.lastlistenkeyupdate = eventtime
-        elif eventtime - self.lastlistenkeyupdate > self.listenkeyupdateperiod:
-            logging.info("Updating listen key")
-            status, data = self.api.pinglistenkey(self.listenkey)
-            if status == 200:
-                self.lastlistenkeyupdate = eventtime
+                ticker.book.update_order(event)
+                telemetry.count('reports', symbol)
             else:
-                logging.info("Could not update listen key : {}".format(data))
-                self.api.unsubscribe()
-                conn, data = self.api.createlistenkey()
-                if conn == 200:
-                    self.listenkey = data['listenKey']
-                    self.subscribe()
+                symbol = None
 
-    def subscribe(self):
-        try:
-            self.api.subscribe(self.route, listenkey=self.listenkey)
-        except (socket.gaierror, websockets.exceptions.ConnectionClosedError) as e:
-            logging.error(e)
-            time.sleep(30)
-            self.subscribe()
+        else:
+            logging.info("Unhandled event{}".format(event['e']))
+
+        telemetry.record('route', perf_counter() - start, symbol)
+
+    def dispatch(self, key, coroutine):
+        """Runs a coroutine as a task once the previous task of the same key is done."""
+        task = asyncio.ensure_future(Router.chain(self.tasks.get(key), coroutine))
+        self.tasks[key] = task
+        task.add_done_callback(lambda task: self.done(key, task))
+        return task
+
+    @staticmethod
+    async def chain(previous, coroutine):
+        if previous != None and not previous.done():
+            await asyncio.wait([previous])
+        return await coroutine
+
+    def done(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        if not task.cancelled() and task.exception() != None:
+            logging.error("{} - task failed : {!r}".format(key, task.exception()))
+
+    def close(self):
+        """Writes the pending orders and candles to the database."""
+        self.writer.close()
+        if self.candlewriter != None:
+            self.candlewriter.close()
 
 def main():
-    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO, filename='live.log')
+    logconfig = {'format': '%(asctime)s - %(processName)s - %(levelname)s - %(message)s', 'level': logging.INFO, 'filename': 'live.log'}
+    logging.basicConfig(**logconfig)
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--no-test", action='store_false', dest='test')
+    parser.add_argument("--shards", type=int, default=0, help='Number of processes sharing the pairs, 0 to trade them in this process')
     parser.set_defaults(test=True, dropdb=False)
     args = parser.parse_args()
     
@@ -343,14 +767,25 @@ def main():
 
     api = Binance(config, args.test)
 
-    client = MongoClient(config['db']['host'])
-    db = client[config['db']['name']]
+    if 'port' in config.get('telemetry', {}):
+        telemetry.serve(config['telemetry']['port'])
 
     conn, data = api.createlistenkey()
     if conn == 200:
         listenkey = data['listenKey']
-        router = Router(config, api, db, listenkey)
-        router.subscribe()
+        if args.shards > 0:
+            import shards
+            router = shards.ShardedRouter(config, api, listenkey, args.shards, logconfig=logconfig)
+        else:
+            client = MongoClient(config['db']['host'])
+            db = client[config['db']['name']]
+            router = Router(config, api, db, listenkey)
+        # SIGTERM arrête le processus comme un Ctrl-C, les ordres en attente sont écrits avant de quitter
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            router.subscribe()
+        finally:
+            router.close()
 
 if __name__ == "__main__":
     main()
@@ -13,24 +13,27 @@ from pymongo import MongoClient
 
 import strategies
 import indicators
+from persistence import recentcandles
 
 plt.style.use('ggplot')
 
 class LiveTicker():
 
-    def __init__(self, db, symbol):
+    def __init__(self, db, symbol, window=500):
         logging.basicConfig(level=logging.INFO)
         self.db = db
         self.symbol = symbol
-        
 
-        cursor = self.db.candles.find({ 'symbol' : self.symbol })
-        self.df = pd.DataFrame(list(cursor), columns=['time', 'close'])
+        # seules les dernières chandelles sont chargées, avec les champs affichés
+        self.df = pd.DataFrame(recentcandles(self.db.candles, self.symbol, window), columns=['time', 'close'])
         self.df = self.df.set_index('time')
 
         self.add_indicators()
 
-        cursor = self.db.orders.find({ 'symbol' : self.symbol })
+        query = { 'symbol' : self.symbol }
+        if len(self.df) > 0:
+            query['transactTime'] = { '$gte' : self.df.index[0] }
+        cursor = self.db.orders.find(query, { '_id' : 0, 'transactTime' : 1, 'side' : 1, 'status' : 1, 'price' : 1 })
         self.orders = pd.DataFrame(list(cursor), columns=['transactTime', 'side', 'status', 'price'])
         self.orders = self.orders.set_index('transactTime')
         self.orders['price'] = self.orders['price'].astype('float')
@@ -130,6 +133,7 @@ class LiveTicker():
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("symbol")
+    parser.add_argument("--window", type=int, default=500, help='Number of candles displayed')
     args = parser.parse_args()
 
     f = open('config.json', 'r')
@@ -139,7 +143,7 @@ def main():
     client = MongoClient(config['db']['host'])
 
     db = client[config['db']['name']]
-    lt = LiveTicker(db, args.symbol)
+    lt = LiveTicker(db, args.symbol, args.window)
 
     #t1 = threading.Thread(target=lt.watchcandles)
     #t1.daemon = True
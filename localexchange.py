@@ -0,0 +1,364 @@
+"""Local stand-in of the Binance exchange for load and latency testing.
+
+It serves the REST endpoints used by the bot over HTTP/1.1 keep-alive
+connections and the combined kline and user data streams over websockets,
+replaying stored klines at a configurable speed. Orders are matched by
+replay.SimulatedBinance and their fills are sent as executionReport events
+on the streams of the listen keys.
+
+Signatures are not verified. The time between the opening tick of a candle
+and the orders received for its symbol is recorded as the tick to order
+latency.
+
+    python localexchange.py --interval 1m --speed 60 BTCUSDT ETHUSDT
+    python localexchange.py --synthetic 200 --speed 600
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+import websockets
+
+from api.binance import Intervals, OrderSide, OrderType
+from api.latency import LatencyHistogram
+from replay import SimulatedBinance
+from store import KlineStore
+
+async def readrequest(reader):
+    """Reads a request and returns its method, target, headers and body, or None when the connection is closed."""
+    line = await reader.readline()
+    if line in (b'', b'\r\n', b'\n'):
+        return None
+    method, target, version = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+
+    body = b''
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    return method, target, headers, body
+
+def klinemessage(symbol, interval, time, step, o, h, l, c, v, closed):
+    return {'e': 'kline', 'E': time, 's': symbol, 'k': {
+        't': time, 'T': time + step - 1, 's': symbol, 'i': interval,
+        'o': str(o), 'h': str(h), 'l': str(l), 'c': str(c), 'v': str(v), 'x': closed}}
+
+class LocalExchange():
+    """Exchange server replaying klines in time order.
+
+    The replay starts when the first websocket subscribes, after warmup
+    candles which are served as history by /api/v3/klines. A speed of 60
+    replays a 1m candle per second, no speed replays as fast as the
+    subscribers read the messages.
+    """
+
+    def __init__(self, klines: dict, interval='1m', speed=None, fee=0.001, warmup=500, cash=1e9, host='127.0.0.1', port=0, wsport=0):
+        self.exchange = SimulatedBinance(klines, fee)
+        self.interval = interval
+        self.step = int(Intervals[interval].total_seconds() * 1000)
+        self.speed = speed
+        self.warmup = warmup
+        self.host = host
+        self.port = port
+        self.wsport = wsport
+        for symbol in klines:
+            self.exchange.cursors[symbol] = warmup
+            self.exchange.cash[symbol] = cash
+            self.exchange.now = max(self.exchange.now, int(self.exchange.klines[symbol][0][warmup]))
+
+        # connexions abonnées par flux, les flux des listen keys reçoivent les executionReport
+        self.subscribers = {}
+        self.listenkeys = set()
+        # créés par start dans la boucle qui les attend, Python 3.8 lie les Event à la boucle courante
+        self.subscribed = None
+        self.finished = None
+
+        self.handlers = set()
+        self.ticked = {}
+        self.latency = LatencyHistogram()
+        self.messages = 0
+        self.requests = 0
+        self.orders = 0
+
+        self.routes = {
+            ('GET', '/api/v3/time'): self.time,
+            ('GET', '/api/v3/exchangeInfo'): self.exchangeinfo,
+            ('GET', '/api/v3/klines'): self.klines,
+            ('POST', '/api/v3/order'): self.order,
+            ('POST', '/api/v3/order/test'): self.order,
+            ('DELETE', '/api/v3/order'): self.cancelorder,
+            ('GET', '/api/v3/order'): self.getorder,
+            ('POST', '/api/v3/userDataStream'): self.createlistenkey,
+            ('PUT', '/api/v3/userDataStream'): self.pinglistenkey,
+            ('DELETE', '/api/v3/userDataStream'): self.pinglistenkey,
+        }
+
+    async def start(self):
+        self.subscribed = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.httpserver = await asyncio.start_server(self.handle, self.host, self.port)
+        self.wsserver = await websockets.serve(self.stream, self.host, self.wsport)
+        self.port = self.httpserver.sockets[0].getsockname()[1]
+        self.wsport = list(self.wsserver.sockets)[0].getsockname()[1]
+        self.clock = asyncio.ensure_future(self.run())
+        self.clock.add_done_callback(self.stopped)
+
+    def stopped(self, task):
+        # une erreur du rejeu le termine, serve ne doit pas attendre indéfiniment
+        if not task.cancelled() and task.exception() != None:
+            logging.error("Replay failed", exc_info=task.exception())
+            self.finished.set()
+
+    async def stop(self):
+        self.clock.cancel()
+        self.httpserver.close()
+        self.wsserver.close()
+        # les connexions persistantes des clients ne sont pas fermées par le serveur
+        for task in list(self.handlers):
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.httpserver.wait_closed()
+        await self.wsserver.wait_closed()
+
+    def background(self):
+        """Runs the exchange in a thread with its own event loop, so that blocking clients can use it."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    def shutdown(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def wait(self, timeout=None):
+        """Waits for the end of the replay from another thread, returns False on timeout."""
+        try:
+            asyncio.run_coroutine_threadsafe(self.finished.wait(), self.loop).result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            return False
+
+    def config(self, pairs: dict):
+        """Returns the configuration of a bot trading pairs on this exchange."""
+        return {
+            'api': {'url': 'http://{}:{}'.format(self.host, self.port), 'stream': 'ws://{}:{}'.format(self.host, self.wsport), 'apikey': 'local', 'secretkey': 'local'},
+            'pairs': pairs
+        }
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            while True:
+                request = await readrequest(reader)
+                if request == None:
+                    break
+                method, target, headers, body = request
+                self.requests += 1
+
+                url = urllib.parse.urlsplit(target)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                params.update(urllib.parse.parse_qsl(body.decode('latin-1')))
+                route = self.routes.get((method, url.path))
+                if route == None:
+                    status, data = 404, {'code': -1, 'msg': 'Unknown endpoint {} {}'.format(method, url.path)}
+                else:
+                    try:
+                        status, data = route(url.path, params)
+                    except (KeyError, ValueError) as e:
+                        status, data = 400, {'code': -1102, 'msg': 'Mandatory parameter missing or malformed : {}'.format(e)}
+
+                payload = json.dumps(data).encode()
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(status, 'OK' if status == 200 else 'Error', len(payload)).encode('latin-1') + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            self.handlers.discard(task)
+
+    def time(self, path, params):
+        return self.exchange.time()
+
+    def exchangeinfo(self, path, params):
+        return 200, {
+            'timezone': 'UTC',
+            'serverTime': self.exchange.now,
+            'rateLimits': [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200}],
+            'symbols': [{'symbol': symbol, 'status': 'TRADING'} for symbol in self.exchange.klines]
+        }
+
+    def klines(self, path, params):
+        if params['symbol'] not in self.exchange.klines:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        return self.exchange.getklines(params['symbol'], params['interval'], min(int(params.get('limit', 500)), 1000))
+
+    def order(self, path, params):
+        symbol = params['symbol']
+        self.orders += 1
+        if symbol in self.ticked:
+            self.latency.record(time.perf_counter() - self.ticked[symbol])
+        if path.endswith('/test'):
+            return 200, {}
+        return self.exchange.order(symbol, OrderSide[params['side']], OrderType[params['type']], float(params['quantity']), float(params['price']))
+
+    def cancelorder(self, path, params):
+        return self.exchange.cancelorder(params['symbol'], int(params['orderId']))
+
+    def getorder(self, path, params):
+        return self.exchange.getorder(params['symbol'], int(params['orderId']))
+
+    def createlistenkey(self, path, params):
+        listenkey = 'local{}'.format(len(self.listenkeys))
+        self.listenkeys.add(listenkey)
+        return 200, {'listenKey': listenkey}
+
+    def pinglistenkey(self, path, params):
+        if params.get('listenKey') not in self.listenkeys:
+            return 400, {'code': -1125, 'msg': 'This listenKey does not exist.'}
+        return 200, {}
+
+    async def stream(self, websocket, path=None):
+        path = path if path != None else websocket.request.path
+        url = urllib.parse.urlsplit(path)
+        if url.path == '/stream':
+            streams = dict(urllib.parse.parse_qsl(url.query)).get('streams', '').split('/')
+        else:
+            streams = url.path[len('/ws/'):].split('/')
+
+        for name in streams:
+            self.subscribers.setdefault(name, set()).add(websocket)
+        self.subscribed.set()
+        try:
+            await websocket.wait_closed()
+        finally:
+            for name in streams:
+                self.subscribers[name].discard(websocket)
+
+    async def publish(self, name, data):
+        subscribers = self.subscribers.get(name)
+        if not subscribers:
+            return
+        message = json.dumps({'stream': name, 'data': data})
+        for websocket in list(subscribers):
+            try:
+                await websocket.send(message)
+                self.messages += 1
+            except websockets.exceptions.ConnectionClosed:
+                subscribers.discard(websocket)
+
+    async def run(self):
+        """Replays the candles once a client subscribed."""
+        await self.subscribed.wait()
+
+        exchange = self.exchange
+        symbols = list(exchange.klines.keys())
+        names = {symbol: "{}@kline_{}".format(symbol.lower(), self.interval) for symbol in symbols}
+        times = np.concatenate([exchange.klines[symbol][0][self.warmup:] for symbol in symbols])
+        owners = np.concatenate([np.full(len(exchange.klines[symbol][0]) - self.warmup, i) for i, symbol in enumerate(symbols)])
+        order = np.argsort(times, kind='stable')
+        if len(order) == 0:
+            self.finished.set()
+            return
+
+        first = int(times[order[0]])
+        start = time.perf_counter()
+        for position in order:
+            symbol = symbols[owners[position]]
+            stamps, values = exchange.klines[symbol]
+            i = exchange.cursors[symbol]
+            t = int(stamps[i])
+            o, h, l, c, v = values[:, i].tolist()
+
+            # l'horloge de la simulation avance au rythme demandé
+            if self.speed != None:
+                delay = start + (t - first) / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            exchange.now = t
+
+            self.ticked[symbol] = time.perf_counter()
+            await self.publish(names[symbol], klinemessage(symbol, self.interval, t, self.step, o, o, o, o, 0.0, False))
+            # laisse les requêtes reçues entre temps être traitées
+            await asyncio.sleep(0)
+            for report in exchange.match(symbol, h, l):
+                for listenkey in self.listenkeys:
+                    await self.publish(listenkey, report)
+            await self.publish(names[symbol], klinemessage(symbol, self.interval, t, self.step, o, h, l, c, v, True))
+            exchange.cursors[symbol] = i + 1
+
+        self.finished.set()
+
+    def __str__(self):
+        return "{} requests, {} orders, {} messages, tick to order {}".format(self.requests, self.orders, self.messages, self.latency)
+
+def synthetic(count, length, interval='1m', seed=0):
+    """Generates random walk klines for count pairs."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2020-01-01', periods=length, freq=pd.Timedelta(Intervals[interval]), name='time')
+    klines = {}
+    for n in range(count):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, length)))
+        open = np.r_[close[0], close[:-1]]
+        klines['PAIR{:04d}USDT'.format(n)] = pd.DataFrame({'open': open, 'high': np.maximum(open, close) * 1.001, 'low': np.minimum(open, close) * 0.999, 'close': close, 'volume': 1.0}, index=index)
+    return klines
+
+async def serve(exchange: LocalExchange):
+    await exchange.start()
+    print("REST API on http://{}:{}, streams on ws://{}:{}".format(exchange.host, exchange.port, exchange.host, exchange.wsport))
+    try:
+        while not exchange.finished.is_set():
+            await asyncio.sleep(10)
+            print(exchange)
+    finally:
+        await exchange.stop()
+    print(exchange)
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", nargs='*')
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", help='Start time, as 2020-01-01T00:00:00')
+    parser.add_argument("--end", help='End time, as 2020-12-31T00:00:00')
+    parser.add_argument("--root", default="data", help='Root directory of the store')
+    parser.add_argument("--synthetic", type=int, help='Replays random walks for this number of pairs instead of stored klines')
+    parser.add_argument("--length", type=int, default=10000, help='Number of synthetic candles')
+    parser.add_argument("--speed", type=float, help='Speed multiplier, as fast as possible when omitted')
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--wsport", type=int, default=9443)
+    args = parser.parse_args()
+
+    if args.interval not in Intervals:
+        parser.error("invalid interval {}".format(args.interval))
+    if args.synthetic != None:
+        klines = synthetic(args.synthetic, args.length, args.interval)
+    elif len(args.symbols) > 0:
+        store = KlineStore(args.root)
+        klines = {symbol.upper(): store.read(symbol.upper(), args.interval, args.start, args.end) for symbol in args.symbols}
+    else:
+        parser.error("symbols or --synthetic are required")
+
+    asyncio.run(serve(LocalExchange(klines, args.interval, args.speed, args.fee, args.warmup, port=args.port, wsport=args.wsport)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Performance metrics of backtests, computed over NumPy arrays.
+
+A backtest is given by the close prices and the signal of a strategy (1.0
+when holding, 0.0 otherwise). The signal of a candle is only known at its
+close, so the position it gives is taken at that close and held during the
+next candle, see positions. A candle held earns the change of the close
+since the previous candle, and every change of position pays the fee on the
+traded amount. Equity is compounded from these net returns.
+
+The statistics of a batch of signals of shape (N, T) on the same closes are
+computed by a single pass loop over each row, compiled with numba when it is
+installed, or by NumPy operations over the whole matrix otherwise, as in
+kernels. The metrics are then derived from them for every row at once.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from api.binance import Intervals
+
+# les cryptomonnaies s'échangent 24h/24, 365 jours par an
+Year = 365 * 24 * 3600
+
+Names = ['trades', 'netret', 'annualret', 'sharpe', 'sortino', 'calmar', 'maxdrawdown', 'maxdrawdownduration', 'winrate', 'exposure', 'turnover']
+
+def periodsperyear(interval):
+    """Number of candles in a year for a kline interval such as '15m', or a timedelta."""
+    if isinstance(interval, str):
+        interval = Intervals[interval]
+    return Year / interval.total_seconds()
+
+def inferinterval(index: pd.DatetimeIndex):
+    """Most common spacing of a time index, as a Timedelta."""
+    if len(index) < 2:
+        raise ValueError("At least two candles are needed to infer the interval")
+    return pd.Timedelta(int(np.median(np.diff(index.values.astype('datetime64[ns]').view(np.int64)))), 'ns')
+
+def changes(close):
+    """Returns the change of every close since the previous one, 0.0 for the first."""
+    close = np.asarray(close, dtype=np.float64)
+    change = np.zeros(close.shape[-1])
+    change[1:] = close[1:] / close[:-1] - 1.0
+    return change
+
+def positions(signal):
+    """Returns the position held during every candle of signal, the signal of the previous candle, flat during the first."""
+    signal = np.asarray(signal, dtype=np.float64)
+    position = np.zeros(signal.shape)
+    position[..., 1:] = signal[..., :-1]
+    return position
+
+def applyfees(change, position, fee):
+    returns = position * change
+    if fee != 0.0:
+        # (1 + r) * (1 - cost) - 1, sans tableau intermédiaire de plus
+        cost = np.abs(np.diff(position, axis=-1, prepend=0.0))
+        cost *= fee
+        returns -= cost
+        cost *= returns + cost
+        returns -= cost
+    return returns
+
+def netreturns(close, signal, fee=0.0):
+    """Returns the return of every candle of signal, net of the fees paid when the position changed."""
+    return applyfees(changes(close), positions(signal), fee)
+
+def runs(mask):
+    """Run-length encoding of the True values of mask along its last axis.
+
+    Returns the row, the start and the length of every run, ordered by row
+    and start.
+    """
+    mask = np.atleast_2d(mask)
+    width = mask.shape[1] + 1
+    padded = np.zeros((mask.shape[0], width + 1), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    # chaque ligne est bordée de False, débuts et fins de séquences alternent donc dans l'ordre des lignes
+    edges = np.flatnonzero(padded[:, 1:] != padded[:, :-1])
+    starts, ends = edges[0::2], edges[1::2]
+    return starts // width, starts % width, ends - starts
+
+# colonnes des statistiques brutes de chaque ligne, dont les métriques sont déduites
+TRADES, WINS, TOTAL, SQUARES, DOWNSIDE, LOGEQUITY, DRAWDOWN, DURATION, HELD, TRADED = range(10)
+Stats = 10
+
+def statsloop(change, position, fee):
+    """Single pass over each row of position, with the change of the closes, returns the raw statistics of the rows."""
+    count, length = position.shape
+    stats = np.zeros((count, Stats))
+    for n in range(count):
+        logequity = 0.0
+        peak = -np.inf
+        drawdown = 0.0
+        duration = 0
+        longest = 0
+        entry = 0.0
+        previous = 0.0
+        for t in range(length):
+            current = position[n, t]
+            traded = abs(current - previous)
+            r = (1.0 + current * change[t]) * (1.0 - fee * traded) - 1.0
+            if current > 0.0 and previous <= 0.0:
+                stats[n, TRADES] += 1.0
+                entry = logequity
+            logequity += np.log1p(r)
+            # un trade se termine à la chandelle de la vente, qui paie les frais de sortie
+            if current <= 0.0 and previous > 0.0 and logequity > entry:
+                stats[n, WINS] += 1.0
+
+            stats[n, TOTAL] += r
+            stats[n, SQUARES] += r * r
+            if r < 0.0:
+                stats[n, DOWNSIDE] += r * r
+            stats[n, HELD] += current
+            stats[n, TRADED] += traded
+
+            if logequity > peak:
+                peak = logequity
+            if logequity < peak:
+                duration += 1
+                if duration > longest:
+                    longest = duration
+                if logequity - peak < drawdown:
+                    drawdown = logequity - peak
+            else:
+                duration = 0
+            previous = current
+
+        if previous > 0.0 and logequity > entry:
+            stats[n, WINS] += 1.0
+        stats[n, LOGEQUITY] = logequity
+        stats[n, DRAWDOWN] = drawdown
+        stats[n, DURATION] = longest
+    return stats
+
+def statsvectorized(change, position, fee):
+    """Same as statsloop, with NumPy operations over the whole matrix."""
+    returns = applyfees(change, position, fee)
+    count, length = returns.shape
+    stats = np.zeros((count, Stats))
+
+    # équité composée, en logarithme pour mesurer les trades et les drawdowns par différence
+    logequity = np.zeros((count, length + 1))
+    np.cumsum(np.log1p(returns), axis=1, out=logequity[:, 1:])
+    drawdown = logequity[:, 1:] - np.maximum.accumulate(logequity[:, 1:], axis=1)
+    stats[:, LOGEQUITY] = logequity[:, -1]
+    stats[:, DRAWDOWN] = drawdown.min(axis=1)
+
+    # durée des drawdowns en chandelles, depuis le dernier plus haut
+    rows, starts, lengths = runs(drawdown < 0.0)
+    np.maximum.at(stats[:, DURATION], rows, lengths)
+
+    # un trade s'étend de son achat à la chandelle de la vente, qui paie les frais de sortie
+    rows, starts, lengths = runs(position > 0.0)
+    exits = np.minimum(starts + lengths, length - 1)
+    tradereturns = logequity[rows, exits + 1] - logequity[rows, starts]
+    stats[:, TRADES] = np.bincount(rows, minlength=count)
+    stats[:, WINS] = np.bincount(rows, weights=tradereturns > 0.0, minlength=count)
+
+    stats[:, TOTAL] = returns.sum(axis=1)
+    stats[:, SQUARES] = np.einsum('ij,ij->i', returns, returns)
+    downside = np.minimum(returns, 0.0)
+    stats[:, DOWNSIDE] = np.einsum('ij,ij->i', downside, downside)
+    stats[:, HELD] = position.sum(axis=1)
+    stats[:, TRADED] = np.abs(np.diff(position, axis=1, prepend=0.0)).sum(axis=1)
+    return stats
+
+if njit != None:
+    rowstats = njit(cache=True)(statsloop)
+else:
+    rowstats = statsvectorized
+
+def summarize(stats, length, periods):
+    """Computes the metrics from the raw statistics of rows of length candles, periods is the number of candles in a year.
+
+    Returns a dict of metric name to an array of values. Returns, drawdowns,
+    win rate and exposure are in %, the ratios are annualized, the drawdown
+    duration is in candles, and the turnover is the traded amount per year
+    as a multiple of the capital.
+    """
+    trades = stats[:, TRADES].astype(np.int64)
+    mean = stats[:, TOTAL] / length
+    maxdrawdown = np.expm1(stats[:, DRAWDOWN])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(np.maximum(stats[:, SQUARES] - stats[:, TOTAL] * mean, 0.0) / (length - 1))
+        downside = np.sqrt(stats[:, DOWNSIDE] / length)
+        annualret = np.expm1(stats[:, LOGEQUITY] * periods / length)
+        return {
+            'trades': trades,
+            'netret': np.expm1(stats[:, LOGEQUITY]) * 100.0,
+            'annualret': annualret * 100.0,
+            'sharpe': np.where(std > 0.0, mean / std, np.nan) * math.sqrt(periods),
+            'sortino': np.where(downside > 0.0, mean / downside, np.nan) * math.sqrt(periods),
+            'calmar': np.where(maxdrawdown < 0.0, annualret / -maxdrawdown, np.nan),
+            'maxdrawdown': maxdrawdown * 100.0,
+            'maxdrawdownduration': stats[:, DURATION].astype(np.int64),
+            'winrate': np.where(trades > 0, stats[:, WINS] / trades, np.nan) * 100.0,
+            'exposure': stats[:, HELD] / length * 100.0,
+            'turnover': stats[:, TRADED] * periods / length,
+        }
+
+def compute(close, signal, fee=0.0, periods=None):
+    """Computes the metrics of signal on close, see summarize. periods defaults to a year of 1m candles.
+
+    signal is a single signal of shape (T,), for which the metrics are
+    numbers, or a batch of shape (N, T), for which they are arrays.
+    """
+    periods = periods if periods != None else periodsperyear('1m')
+    single = np.ndim(signal) == 1
+    position = positions(np.atleast_2d(signal))
+    values = summarize(rowstats(changes(close), position, fee), position.shape[1], periods)
+    if single:
+        return {name: value[0].item() for name, value in values.items()}
+    return values
@@ -0,0 +1,182 @@
+"""Write-behind persistence of the live documents to MongoDB.
+
+The trading code hands documents to a BulkWriter, which upserts them from a
+background thread in bulk writes, so that the latency of the database never
+delays the event loop. Orders are kept, closed candles expire after a
+retention period and are read back by liveview.
+"""
+import logging
+import queue
+import threading
+import time
+
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+
+class BulkWriter():
+    """Upserts documents keyed by some of their fields, grouped in bulk writes.
+
+    Until start is called, documents are written as soon as they are given,
+    which is what the tests and the replay want. Once started, they go
+    through a bounded queue to a thread which writes them by batches of at
+    most batchsize documents, or of what arrived within period seconds.
+    Successive versions of a document within a batch are merged into a
+    single upsert. flush waits for everything queued to be written, close
+    flushes and stops the thread.
+    """
+
+    Flush = object()
+    Stop = object()
+
+    def __init__(self, collection, keys, batchsize=500, period=1.0, maxsize=10000, retries=3):
+        self.collection = collection
+        self.keys = keys
+        self.batchsize = batchsize
+        self.period = period
+        self.retries = retries
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.written = 0
+        self.batches = 0
+        self.lost = 0
+
+    def start(self):
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run, name='BulkWriter', daemon=True)
+            self.thread.start()
+        return self
+
+    def upsert(self, document):
+        # une copie, le document peut encore être modifié par l'appelant
+        document = dict(document)
+        document.pop('_id', None)
+
+        if self.thread == None:
+            self.write([document])
+            return
+
+        try:
+            self.queue.put_nowait(document)
+        except queue.Full:
+            # on ne perd pas d'ordre, quitte à attendre la base
+            logging.warning("Write queue of {} is full, waiting for the database".format(self.collection.name))
+            self.queue.put(document)
+
+    def flush(self):
+        if self.thread != None:
+            self.queue.put(BulkWriter.Flush)
+            self.queue.join()
+
+    def close(self):
+        if self.thread != None:
+            self.queue.put(BulkWriter.Stop)
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            documents = []
+            item = self.queue.get()
+            received = 1
+            deadline = time.monotonic() + self.period
+            while True:
+                if item is BulkWriter.Stop:
+                    stopping = True
+                    break
+                if item is BulkWriter.Flush:
+                    break
+                documents.append(item)
+                if len(documents) >= self.batchsize:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    received += 1
+                except queue.Empty:
+                    break
+
+            if len(documents) > 0:
+                self.write(documents)
+            for i in range(received):
+                self.queue.task_done()
+
+    def write(self, documents):
+        """Upserts documents in a single bulk write, retried when the database fails."""
+        merged = {}
+        for document in documents:
+            key = tuple(document[k] for k in self.keys)
+            if key in merged:
+                merged[key].update(document)
+            else:
+                merged[key] = document
+
+        upserts = [({k: v for k, v in zip(self.keys, key)}, document) for key, document in merged.items()]
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(upserts)
+                self.written += len(upserts)
+                self.batches += 1
+                return True
+            except PyMongoError as e:
+                logging.error("Could not write {} documents to {} : {}".format(len(upserts), self.collection.name, e))
+                if attempt < self.retries:
+                    time.sleep(2 ** attempt)
+
+        self.lost += len(upserts)
+        logging.error("Lost {}".format(list(merged.values())))
+        return False
+
+    def send(self, upserts):
+        """Upserts the (filter, document) pairs in a single bulk write.
+
+        Collections held in memory, such as those of the replay, receive the
+        pairs through their upsertmany method instead of pymongo requests.
+        """
+        # cherché sur la classe, les collections pymongo renvoient une sous-collection pour tout attribut
+        if hasattr(type(self.collection), 'upsertmany'):
+            self.collection.upsertmany(upserts)
+        else:
+            self.collection.bulk_write([UpdateOne(filter, {'$set': document}, upsert=True) for filter, document in upserts], ordered=True)
+
+class OrderWriter(BulkWriter):
+    """BulkWriter of the orders, keyed by symbol and orderId."""
+
+    def __init__(self, collection, batchsize=500, period=1.0, maxsize=10000):
+        super().__init__(collection, ('symbol', 'orderId'), batchsize, period, maxsize)
+
+    def ensureindexes(self):
+        # Book cherche le dernier ordre d'un symbole au démarrage, les rapports d'exécution mettent à jour un ordre
+        self.collection.create_index([('symbol', ASCENDING), ('transactTime', DESCENDING)])
+        self.collection.create_index([('orderId', ASCENDING)])
+
+class CandleWriter(BulkWriter):
+    """BulkWriter of the closed candles, keyed by symbol and open time.
+
+    Candles are flat documents with their open time as a date in 'time' and
+    the symbol in 'symbol', the time and meta fields of a time series. They
+    expire retention seconds after their open time through a TTL index.
+    When indicators is set, LiveTicker adds the values of its indicators to
+    each candle.
+    """
+
+    def __init__(self, collection, retention=30 * 86400, indicators=False, batchsize=500, period=1.0, maxsize=10000):
+        super().__init__(collection, ('symbol', 'time'), batchsize, period, maxsize)
+        self.retention = int(retention)
+        self.indicators = indicators
+
+    def ensureindexes(self):
+        self.collection.create_index([('symbol', ASCENDING), ('time', DESCENDING)])
+        try:
+            self.collection.create_index([('time', ASCENDING)], expireAfterSeconds=self.retention)
+        except OperationFailure:
+            # l'index existe avec une autre durée de rétention, on la modifie
+            self.collection.database.command('collMod', self.collection.name, index={'keyPattern': {'time': ASCENDING}, 'expireAfterSeconds': self.retention})
+
+def recentcandles(collection, symbol, count, fields=('time', 'close')):
+    """Returns the fields of the last count candles of a symbol, oldest first."""
+    projection = {field: 1 for field in fields}
+    projection['_id'] = 0
+    cursor = collection.find({'symbol': symbol}, projection).sort('time', DESCENDING).limit(count)
+    candles = list(cursor)
+    candles.reverse()
+    return candles
@@ -0,0 +1,261 @@
+"""Backtests of a strategy over many symbols sharing the same quote capital.
+
+The stored klines of the symbols are aligned on a common time grid, as a
+(T, S) array of close prices with a column per symbol, and the strategy runs
+on every column with the same parameters, see batch. A sizing rule turns the
+signals into the weights of the capital held in each symbol, the rest being
+kept in quote currency, and the portfolio is rebalanced to these weights at
+the close of every candle, paying the fee on the change of the weights, so
+that the weights decided on a candle earn the change of the next one.
+
+Years of 1m klines of hundreds of symbols do not fit in memory, so the grid
+is processed by chunks of candles whose size is bounded by maxbytes. Each
+chunk is read with warmup candles before it, on which the indicators are
+computed again. The last prices, signals and weights, and the changes of
+the last warmup candles from which the volatilities are computed, are
+carried from a chunk to the next.
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+import batch
+import indicators
+import metrics
+import strategies
+import sweep
+from api.binance import Intervals
+from store import KlineStore, tomillis
+
+Sizings = ['equal', 'active', 'inversevol']
+
+def limits(store: KlineStore, symbol, interval, start=None, end=None):
+    """Returns the open times of the first and last klines of a symbol between start and end included, or None."""
+    start, end = tomillis(start), tomillis(end)
+    first = last = None
+    for month in store.months(symbol, interval):
+        times = store.partition(symbol, interval, month)[0]
+        if start != None:
+            times = times[times >= start]
+        if end != None:
+            times = times[times <= end]
+        if len(times) > 0:
+            first = int(times[0]) if first == None else first
+            last = int(times[-1])
+    return (first, last) if first != None else None
+
+def load(store: KlineStore, symbols, interval, start: int, end: int):
+    """Returns the times of the grid from start to end included, in milliseconds, and the (T, S) close prices of the symbols on it.
+
+    Prices are NaN where a symbol has no kline.
+    """
+    step = int(Intervals[interval].total_seconds() * 1000)
+    times = np.arange(start, end + 1, step, dtype=np.int64)
+    close = np.full((len(times), len(symbols)), np.nan)
+    for column, symbol in enumerate(symbols):
+        values = store.select(symbol, interval, start, end)
+        offsets = values[0].astype(np.int64) - start
+        # les klines hors de la grille, décalées dans le temps, sont ignorées
+        aligned = offsets % step == 0
+        close[offsets[aligned] // step, column] = values[4][aligned]
+    return times, close
+
+def signals(times, close, strategy: str, params: dict, previous=None, cache: indicators.IndicatorCache = None):
+    """Returns the (T, S) signals of the strategy on each column of close.
+
+    Signals are computed on the klines of each symbol only, and held through
+    its missing klines. previous is the last signal of each symbol, held
+    until its first kline, 0.0 by default.
+    """
+    index = pd.DatetimeIndex(times.astype('datetime64[ms]').astype('datetime64[ns]'), name='time')
+    signal = np.full((len(times) + 1, close.shape[1]), np.nan)
+    signal[0] = previous if previous is not None else 0.0
+    for column in range(close.shape[1]):
+        valid = ~np.isnan(close[:, column])
+        if valid.any():
+            signal[1:][valid, column] = batch.signals(pd.Series(close[valid, column], index=index[valid]), strategy, [params], cache)[0]
+    return pd.DataFrame(signal).ffill().to_numpy()[1:]
+
+def weights(signal, change, sizing='equal', maxweight=1.0, lookback=1440):
+    """Returns the (T, S) weights of the capital held in each symbol for the signals.
+
+    equal gives 1/S of the capital to each symbol held, active splits it
+    evenly between the symbols held, and inversevol splits it in inverse
+    proportion to the volatility of their changes over the lookback candles
+    before. Weights are capped at maxweight, the remainder stays in quote.
+    """
+    if sizing == 'equal':
+        weight = signal / signal.shape[1]
+    elif sizing == 'active':
+        weight = signal / np.maximum(signal.sum(axis=1, keepdims=True), 1.0)
+    elif sizing == 'inversevol':
+        volatility = pd.DataFrame(change).rolling(lookback, min_periods=2).std().shift(1).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = np.where((signal > 0.0) & (volatility > 0.0), 1.0 / volatility, 0.0)
+        total = inverse.sum(axis=1, keepdims=True)
+        weight = inverse / np.where(total > 0.0, total, 1.0)
+    else:
+        raise ValueError("Unknown sizing {}".format(sizing))
+    return np.minimum(weight, maxweight)
+
+class PortfolioResult():
+    """Results of a portfolio backtest.
+
+    equity is the value of the portfolio starting at 100, result its
+    metrics, trades and exposure being summed over the symbols, and symbols
+    has a row per symbol with its trades, its win rate, the % of candles it
+    was held, and its contribution to the returns and the fees in %.
+    """
+
+    def __init__(self, equity: pd.Series, result: strategies.BacktestResult, symbols: pd.DataFrame):
+        self.equity = equity
+        self.result = result
+        self.symbols = symbols
+
+    def __str__(self):
+        return '{}\n\nSymbols :\n{}'.format(self.result, self.symbols.to_string())
+
+def backtest(store: KlineStore, symbols, interval: str, strategy: str, params: dict, start=None, end=None, sizing: str = 'equal',
+        maxweight: float = 1.0, fee: float = 0.0, lookback: int = 1440, warmup: int = 1000, maxbytes: int = 2 ** 28):
+    """Backtests a strategy with the same parameters on the stored klines of symbols, with shared capital.
+
+    start and end default to the first and last stored klines of the
+    symbols. warmup is the number of candles on which the indicators of a
+    chunk are computed before it, at least lookback with inversevol, and
+    maxbytes bounds the memory used by a chunk.
+    """
+    if interval == '1M':
+        raise ValueError("Months have no fixed length")
+    if strategy not in batch.Signals:
+        raise ValueError("Unknown strategy {}".format(strategy))
+    bounds = [b for b in (limits(store, symbol, interval, start, end) for symbol in symbols) if b != None]
+    if len(bounds) == 0:
+        raise ValueError("No {} klines stored for {}".format(interval, ', '.join(symbols)))
+    step = int(Intervals[interval].total_seconds() * 1000)
+    first, last = min(b[0] for b in bounds), max(b[1] for b in bounds)
+    length = (last - first) // step + 1
+    count = len(symbols)
+    if sizing == 'inversevol':
+        # la volatilité de la première chandelle d'un bloc porte sur les lookback variations avant elle
+        warmup = max(warmup, lookback)
+    # une dizaine de tableaux (T, S) de float64 sont alloués par bloc, préchauffage compris
+    rows = max(1, maxbytes // (count * 8 * 10) - warmup)
+    cache = indicators.IndicatorCache(maxsize=8)
+
+    lastclose = np.full(count, np.nan)
+    lastsignal = np.zeros(count)
+    lastweight = np.zeros(count)
+    lastposition, lastholding = np.zeros(count), np.zeros(count)
+    pastchange = np.zeros((0, count))
+    entries = np.full(count, np.nan)
+    trades, wins, held = np.zeros(count), np.zeros(count), np.zeros(count)
+    contribution, fees = np.zeros(count), np.zeros(count)
+    exposure = turnover = 0.0
+    returns = []
+
+    for chunk in range(0, length, rows):
+        chunkstart = first + chunk * step
+        readstart = max(first, chunkstart - warmup * step)
+        skip = (chunkstart - readstart) // step
+        times, close = load(store, symbols, interval, readstart, min(last, chunkstart + (rows - 1) * step))
+
+        # prix connus à chaque chandelle, ceux du bloc étant précédés du dernier prix du bloc précédent
+        filled = pd.DataFrame(np.vstack([lastclose, close[skip:]])).ffill().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.nan_to_num(filled[1:] / filled[:-1] - 1.0)
+        # les variations du préchauffage sont celles des blocs précédents, un préchauffage commençant dans un trou de cotation les fausserait
+        change = np.vstack([pastchange[len(pastchange) - skip:], change])
+        pastchange = change[max(0, len(change) - warmup):]
+        signal = signals(times, close, strategy, params, lastsignal, cache)
+        weight = weights(signal, change, sizing, maxweight, lookback)
+
+        # seules les chandelles du bloc comptent, le préchauffage a déjà été évalué avec le bloc précédent
+        signal, weight, change = signal[skip:], weight[skip:], change[skip:]
+        # les poids décidés à la clôture d'une chandelle sont tenus pendant la suivante
+        position = np.vstack([lastsignal, signal[:-1]])
+        holding = np.vstack([lastweight, weight[:-1]])
+        traded = np.abs(np.diff(holding, axis=0, prepend=lastholding[np.newaxis]))
+        earned = holding * change
+        gross, cost = earned.sum(axis=1), traded.sum(axis=1) * fee
+        returns.append((1.0 + gross) * (1.0 - cost) - 1.0)
+        contribution += earned.sum(axis=0)
+        fees += traded.sum(axis=0) * fee
+        held += position.sum(axis=0)
+        exposure += holding.sum()
+        turnover += traded.sum()
+
+        # un trade est gagnant si le prix a plus monté que les frais d'achat et de vente, filled[t] étant le prix avant la chandelle t
+        transitions = np.vstack([lastposition, position])
+        for column in np.flatnonzero((transitions[1:] != transitions[:-1]).any(axis=0)):
+            for t in np.flatnonzero(transitions[1:, column] != transitions[:-1, column]):
+                if transitions[t + 1, column] > 0.0:
+                    trades[column] += 1
+                    entries[column] = filled[t, column]
+                else:
+                    wins[column] += filled[t, column] / entries[column] * (1.0 - fee) ** 2 > 1.0
+                    entries[column] = np.nan
+
+        lastclose, lastsignal, lastweight = filled[-1], signal[-1], weight[-1]
+        lastposition, lastholding = position[-1], holding[-1]
+
+    # les trades encore ouverts sont évalués au dernier prix, sans frais de vente
+    pending = ~np.isnan(entries)
+    wins[pending] += lastclose[pending] / entries[pending] * (1.0 - fee) > 1.0
+
+    returns = np.concatenate(returns)
+    periods = metrics.periodsperyear(interval)
+    values = {name: value[0].item() for name, value in metrics.summarize(metrics.rowstats(returns, np.ones((1, length)), 0.0), length, periods).items()}
+    values['trades'] = int(trades.sum())
+    values['winrate'] = wins.sum() / trades.sum() * 100.0 if trades.sum() > 0 else float('nan')
+    values['exposure'] = exposure / length * 100.0
+    values['turnover'] = turnover * periods / length
+
+    index = pd.DatetimeIndex((first + np.arange(length, dtype=np.int64) * step).astype('datetime64[ms]').astype('datetime64[ns]'), name='time')
+    equity = pd.Series(100.0 * np.cumprod(1.0 + returns), index=index, name='equity')
+    result = strategies.BacktestResult(index[0], index[-1], length, **values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = pd.DataFrame({'trades': trades.astype(np.int64), 'winrate': np.where(trades > 0, wins / trades, np.nan) * 100.0,
+            'exposure': held / length * 100.0, 'contribution': contribution * 100.0, 'fees': fees * 100.0}, index=pd.Index(symbols, name='symbol'))
+    return PortfolioResult(equity, result, table)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", nargs='*')
+    parser.add_argument("--config", help='Backtests the pairs of this configuration file')
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", help='Start time, as 2020-01-01T00:00:00')
+    parser.add_argument("--end", help='End time, as 2020-01-31T00:00:00')
+    parser.add_argument("--root", default="data", help='Root directory of the store')
+    parser.add_argument("--strategy", required=True, choices=sorted(batch.Signals))
+    parser.add_argument("--params", nargs='+', default=[], help='Parameters of the strategy as name=value')
+    parser.add_argument("--sizing", default='equal', choices=Sizings, help='Allocation of the capital between the symbols held')
+    parser.add_argument("--maxweight", type=float, default=1.0, help='Largest share of the capital held in a symbol')
+    parser.add_argument("--lookback", type=int, default=1440, help='Candles over which volatilities are measured')
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--warmup", type=int, default=1000, help='Candles read before each chunk to compute the indicators')
+    parser.add_argument("--memory", type=int, default=256, help='Memory used by a chunk, in MB')
+    parser.add_argument("--equity", help='Writes the equity curve to this CSV file')
+    args = parser.parse_args()
+
+    if args.interval not in Intervals:
+        parser.error("invalid interval {}".format(args.interval))
+    symbols = list(args.symbols)
+    if args.config != None:
+        with open(args.config, 'r') as f:
+            symbols += list(json.load(f)['pairs'].keys())
+    if len(symbols) == 0:
+        parser.error("a symbol or --config is required")
+    params = sweep.combinations(args.strategy, sweep.parsegrid(args.params))
+    if len(params) != 1:
+        parser.error("--params must give a single valid value of each parameter")
+
+    result = backtest(KlineStore(args.root), symbols, args.interval, args.strategy, params[0], args.start, args.end, args.sizing,
+        args.maxweight, args.fee, args.lookback, args.warmup, args.memory * 2 ** 20)
+    print(result)
+    if args.equity != None:
+        result.equity.to_csv(args.equity, header=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Bar by bar replay of stored klines through the live trading code.
+
+The klines are fed to live.Router as websocket messages, so that LiveTicker
+computes its signals and Book sends its orders exactly as in live trading,
+against SimulatedBinance : an in-memory exchange which fills limit orders
+when a candle trades through their price, charges fees and answers with
+executionReport events.
+
+Each candle is replayed as two messages : its opening tick, on which the
+strategy acts, then its closing values once the orders had a chance to be
+filled within the candle.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import live
+from api.binance import Intervals, OrderSide, OrderStatus
+from api.messages import Kline
+from store import KlineStore, COLUMNS
+from persistence import OrderWriter
+
+class SimulatedBinance():
+    """In-memory exchange serving the Binance methods used by live trading.
+
+    The exchange time is the open time of the candle being replayed, klines
+    requests only see the candles before it and the opening tick of the
+    current one.
+    """
+
+    def __init__(self, klines: dict, fee=0.001):
+        self.config = {}
+        self.test = False
+        self.fee = fee
+        self.klines = {}
+        for symbol, df in klines.items():
+            times = df.index.values.astype('datetime64[ms]').astype(np.int64)
+            self.klines[symbol] = (times, np.ascontiguousarray(df[COLUMNS].to_numpy(dtype=np.float64).T))
+        self.now = 0
+        self.cursors = {symbol: 0 for symbol in klines}
+        # ordres en attente d'exécution, indexés par orderId
+        self.orders = {}
+        self.nextorderid = 1
+        self.position = {symbol: 0.0 for symbol in klines}
+        self.cash = {symbol: 0.0 for symbol in klines}
+        self.fees = {symbol: 0.0 for symbol in klines}
+        self.fills = {symbol: 0 for symbol in klines}
+        self.rejects = {symbol: 0 for symbol in klines}
+
+    def timestamp(self):
+        return self.now
+
+    def time(self):
+        return 200, {'serverTime': self.now}
+
+    def getklines(self, symbol, interval, limit, start = None, end = None):
+        times, values = self.klines[symbol]
+        cursor = self.cursors[symbol]
+        data = []
+        for i in range(max(0, cursor - limit + 1), cursor + 1):
+            o, h, l, c, v = values[:, i].tolist()
+            # la chandelle en cours n'est connue que par son ouverture
+            if i == cursor:
+                h = l = c = o
+                v = 0.0
+            data.append([int(times[i]), o, h, l, c, v, int(times[i]) + 1, 0.0, 0, 0.0, 0.0, 0.0])
+        return 200, data
+
+    def order(self, symbol, side, type, quantity, price):
+        if symbol not in self.klines or quantity <= 0:
+            return 400, {'code': -1013, 'msg': 'Invalid quantity.'}
+
+        # les ordres en attente réservent leur part du solde
+        pending = [o for o in self.orders.values() if o['symbol'] == symbol and o['side'] == side.name]
+        if side == OrderSide.BUY:
+            reserved = sum(float(o['price']) * float(o['origQty']) for o in pending)
+            enough = self.cash[symbol] - reserved >= price * quantity * (1.0 + self.fee)
+        else:
+            reserved = sum(float(o['origQty']) for o in pending)
+            enough = self.position[symbol] - reserved >= quantity - 1e-12
+        if not enough:
+            self.rejects[symbol] += 1
+            return 400, {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'}
+
+        order = {
+            'symbol': symbol,
+            'side': side.name,
+            'type': type.name,
+            'status': OrderStatus.NEW.name,
+            'price': str(price),
+            'origQty': str(quantity),
+            'orderId': self.nextorderid,
+            'transactTime': self.now
+        }
+        self.nextorderid += 1
+        self.orders[order['orderId']] = order
+        return 200, dict(order)
+
+    def cancelorder(self, symbol, orderid):
+        order = self.orders.pop(orderid, None)
+        if order == None:
+            return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+        order['status'] = OrderStatus.CANCELED.name
+        return 200, dict(order)
+
+    def getorder(self, symbol, orderid):
+        if orderid in self.orders:
+            return 200, dict(self.orders[orderid])
+        return 400, {'code': -2013, 'msg': 'Order does not exist.'}
+
+    def createlistenkey(self):
+        return 200, {'listenKey': 'replay'}
+
+    def pinglistenkey(self, listenkey):
+        return 200, {}
+
+    def match(self, symbol, high, low):
+        """Fills the orders of a symbol that the candle traded through and returns their executionReport events."""
+        reports = []
+        for orderid in [orderid for orderid, order in self.orders.items() if order['symbol'] == symbol]:
+            order = self.orders[orderid]
+            price = float(order['price'])
+            if (order['side'] == OrderSide.BUY.name and low <= price) or (order['side'] == OrderSide.SELL.name and high >= price):
+                del self.orders[orderid]
+                reports.append(self.fill(order, price))
+        return reports
+
+    def fill(self, order, price):
+        symbol = order['symbol']
+        quantity = float(order['origQty'])
+        commission = price * quantity * self.fee
+        if order['side'] == OrderSide.BUY.name:
+            self.position[symbol] += quantity
+            self.cash[symbol] -= price * quantity
+        else:
+            self.position[symbol] -= quantity
+            self.cash[symbol] += price * quantity
+        self.cash[symbol] -= commission
+        self.fees[symbol] += commission
+        self.fills[symbol] += 1
+
+        return {'e': 'executionReport', 'E': self.now, 's': symbol, 'S': order['side'], 'o': order['type'], 'f': 'GTC',
+            'q': order['origQty'], 'p': order['price'], 'x': 'TRADE', 'X': OrderStatus.FILLED.name, 'i': order['orderId'],
+            'l': order['origQty'], 'z': order['origQty'], 'L': order['price'], 'n': str(commission), 'N': 'USDT', 'T': self.now}
+
+class AsyncSimulatedBinance():
+    """Coroutine interface of SimulatedBinance, as used by Router for the orders.
+
+    The coroutines never wait, the replay runs them to completion immediately.
+    """
+
+    def __init__(self, exchange: SimulatedBinance):
+        self.exchange = exchange
+        self.test = exchange.test
+
+    async def order(self, symbol, side, type, quantity, price):
+        return self.exchange.order(symbol, side, type, quantity, price)
+
+    async def cancelorder(self, symbol, orderid):
+        return self.exchange.cancelorder(symbol, orderid)
+
+    async def getorder(self, symbol, orderid):
+        return self.exchange.getorder(symbol, orderid)
+
+    async def createlistenkey(self):
+        return self.exchange.createlistenkey()
+
+    async def pinglistenkey(self, listenkey):
+        return self.exchange.pinglistenkey(listenkey)
+
+class MemoryOrders():
+    """In-memory stand-in of the orders collection, limited to the queries made by Book.
+
+    Orders are indexed by orderId, so that recording and updating them stays
+    O(1) however long the replay.
+    """
+
+    name = 'orders'
+
+    def __init__(self):
+        self.documents = {}
+
+    def create_index(self, keys):
+        pass
+
+    def upsertmany(self, upserts):
+        """Upserts the (filter, document) pairs written by OrderWriter, see persistence.BulkWriter.send."""
+        for filter, update in upserts:
+            document = self.find_one(filter)
+            if document != None:
+                document.update(update)
+            else:
+                self.insert_one(dict(update))
+
+    def insert_one(self, document):
+        document.setdefault('_id', document['orderId'])
+        self.documents[document['_id']] = document
+
+    def find_one(self, filter):
+        if 'orderId' in filter:
+            document = self.documents.get(filter['orderId'])
+            return document if document != None and all(document.get(k) == v for k, v in filter.items()) else None
+        return next(iter(self.find(filter)), None)
+
+    def find(self, filter):
+        return MemoryCursor([d for d in self.documents.values() if all(d.get(k) == v for k, v in filter.items())])
+
+class MemoryCursor():
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.limited = None
+        self.position = 0
+
+    def sort(self, key, direction=1):
+        self.documents.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        # comme avec pymongo, la limite s'applique après le tri
+        self.limited = count
+        return self
+
+    def results(self):
+        return self.documents if self.limited == None else self.documents[:self.limited]
+
+    def count(self):
+        return len(self.results())
+
+    def next(self):
+        results = self.results()
+        if self.position >= len(results):
+            raise StopIteration
+        self.position += 1
+        return results[self.position - 1]
+
+    def __iter__(self):
+        return iter(self.results()[self.position:])
+
+class MemoryDatabase():
+
+    def __init__(self):
+        self.orders = MemoryOrders()
+
+class ReplayRouter(live.Router):
+    """Router running the order coroutines as soon as they are dispatched."""
+
+    def dispatch(self, key, coroutine):
+        try:
+            coroutine.send(None)
+        except StopIteration as e:
+            return e.value
+        coroutine.close()
+        raise RuntimeError("{} - replayed coroutine waited".format(key))
+
+class ReplayResult():
+
+    def __init__(self, symbol, times, equity, capital, trades, fees, rejects=0):
+        self.symbol = symbol
+        self.equity = pd.Series(equity, index=pd.DatetimeIndex(times.astype('datetime64[ms]').astype('datetime64[ns]'), name='time'))
+        self.capital = capital
+        self.trades = trades
+        self.fees = fees
+        self.rejects = rejects
+        self.netret = equity[-1] / capital - 1.0 if len(equity) > 0 else 0.0
+        peak = np.maximum.accumulate(equity) if len(equity) > 0 else equity
+        self.maxdrawdown = float(np.max(1.0 - equity / peak)) if len(equity) > 0 else 0.0
+
+    def __str__(self):
+        return "{} - net return {:.2%}, max drawdown {:.2%}, {} trades, {:.2f} fees, {} rejected orders".format(self.symbol, self.netret, self.maxdrawdown,
+            self.trades, self.fees, self.rejects)
+
+class Replay():
+    """Replays klines of one or several symbols through Router, LiveTicker and Book.
+
+    The first warmup candles of each symbol are served as history to the
+    tickers, the following ones are replayed. The capital of a symbol is
+    headroom times the value of its configured quantity at the first replayed
+    open, so that orders are not rejected when the price or the quantity
+    rises, or for the fees. Rejected orders are counted in the results.
+    """
+
+    def __init__(self, config, klines: dict, fee=0.001, warmup=500, db=None, headroom=2.0):
+        self.config = config
+        self.exchange = SimulatedBinance(klines, fee)
+        self.warmup = warmup
+        self.headroom = headroom
+        for symbol in klines:
+            if len(klines[symbol]) <= warmup:
+                raise ValueError("{} - {} klines are needed to replay after the warmup".format(symbol, warmup + 1))
+            self.exchange.cursors[symbol] = warmup
+            self.exchange.now = max(self.exchange.now, int(self.exchange.klines[symbol][0][warmup]))
+        db = db if db != None else MemoryDatabase()
+        # les ordres sont écrits sans thread, la base est à jour à chaque instant du rejeu
+        self.router = ReplayRouter(config, self.exchange, db, 'replay', AsyncSimulatedBinance(self.exchange), OrderWriter(db.orders))
+
+    def run(self) -> dict:
+        """Replays every candle in time order and returns a ReplayResult per symbol."""
+        symbols = list(self.exchange.klines.keys())
+        streams = {symbol: "{}@kline_{}".format(symbol.lower(), self.config['pairs'][symbol]['interval']) for symbol in symbols}
+        times = np.concatenate([self.exchange.klines[symbol][0][self.warmup:] for symbol in symbols])
+        owners = np.concatenate([np.full(len(self.exchange.klines[symbol][0]) - self.warmup, i) for i, symbol in enumerate(symbols)])
+        order = np.argsort(times, kind='stable')
+
+        equity = {symbol: np.empty(len(self.exchange.klines[symbol][0]) - self.warmup) for symbol in symbols}
+        capital = {}
+        for symbol in symbols:
+            # la quantité des ordres suit les gains et les pertes, et les frais sont payés en plus
+            capital[symbol] = float(self.config['pairs'][symbol]['quantity']) * self.exchange.klines[symbol][1][0, self.warmup] * self.headroom
+            self.exchange.cash[symbol] = capital[symbol]
+
+        exchange, route = self.exchange, self.router.route
+        for position in order:
+            symbol = symbols[owners[position]]
+            stamps, values = exchange.klines[symbol]
+            i = exchange.cursors[symbol]
+            t = int(stamps[i])
+            o, h, l, c, v = values[:, i].tolist()
+            exchange.now = t
+            stream = streams[symbol]
+
+            route(stream, Kline(symbol, t, o, o, o, o, 0.0))
+            for report in exchange.match(symbol, h, l):
+                route(stream, report)
+            route(stream, Kline(symbol, t, o, h, l, c, v, True))
+
+            equity[symbol][i - self.warmup] = exchange.cash[symbol] + exchange.position[symbol] * c
+            exchange.cursors[symbol] = i + 1
+
+        results = {}
+        for symbol in symbols:
+            results[symbol] = ReplayResult(symbol, exchange.klines[symbol][0][self.warmup:], equity[symbol], capital[symbol], exchange.fills[symbol], exchange.fees[symbol],
+                exchange.rejects[symbol])
+        return results
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("symbols", nargs='+')
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", help='Start time, as 2020-01-01T00:00:00')
+    parser.add_argument("--end", help='End time, as 2020-12-31T00:00:00')
+    parser.add_argument("--root", default="data", help='Root directory of the store')
+    parser.add_argument("--quantity", type=float, default=1.0)
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--headroom", type=float, default=2.0, help='Capital of a symbol, as a multiple of the value of its quantity')
+    args = parser.parse_args()
+
+    if args.interval not in Intervals:
+        parser.error("invalid interval {}".format(args.interval))
+
+    store = KlineStore(args.root)
+    klines = {}
+    config = {'pairs': {}}
+    for symbol in args.symbols:
+        symbol = symbol.upper()
+        klines[symbol] = store.read(symbol, args.interval, args.start, args.end)
+        config['pairs'][symbol] = {'interval': args.interval, 'quantity': args.quantity}
+
+    replay = Replay(config, klines, args.fee, args.warmup, headroom=args.headroom)
+    start = time.perf_counter()
+    results = replay.run()
+    elapsed = time.perf_counter() - start
+
+    for symbol in results:
+        print(results[symbol])
+    print("{} candles replayed in {:.1f}s".format(sum(len(klines[s]) - args.warmup for s in klines), elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Candles of higher intervals built from the candles of a base interval.
+
+Candles are aligned on UTC boundaries like the klines of Binance : intervals
+up to 3d start at multiples of their length since the epoch, weeks start on
+Monday and months on their first day. A higher candle opens with the first
+base candle of its period, closes with the last one, and has the highest
+high, the lowest low and the total volume of them.
+
+resample builds them at once for backtests, and caches them through
+indicators.cache with Resampled. Resampler builds them incrementally for a
+live ticker, so that a single base interval stream feeds all the intervals
+a strategy reads.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from api.binance import Intervals
+from candles import CandleBuffer, COLUMNS
+
+Day = 24 * 3600 * 1000
+# le 1er janvier 1970 était un jeudi, les semaines de Binance commencent le lundi 5
+WeekOffset = 4 * Day
+
+def milliseconds(interval):
+    return int(Intervals[interval].total_seconds() * 1000)
+
+def opentime(times, interval):
+    """Returns the open time of the candle of interval holding each time, in milliseconds since the epoch."""
+    times = np.asarray(times, dtype=np.int64)
+    if interval == '1M':
+        return times.astype('datetime64[ms]').astype('datetime64[M]').astype('datetime64[ms]').astype(np.int64)
+    width = milliseconds(interval)
+    offset = WeekOffset if interval == '1w' else 0
+    return (times - offset) // width * width + offset
+
+def closetime(opens, interval):
+    """Returns the open time of the candle following each candle of interval opened at opens."""
+    opens = np.asarray(opens, dtype=np.int64)
+    if interval == '1M':
+        return (opens.astype('datetime64[ms]').astype('datetime64[M]') + 1).astype('datetime64[ms]').astype(np.int64)
+    return opens + milliseconds(interval)
+
+def checkintervals(base, interval):
+    """Raises a ValueError unless the candles of interval are made of whole candles of base."""
+    if base not in Intervals or interval not in Intervals:
+        raise ValueError("Unknown interval {}".format(base if base not in Intervals else interval))
+    width = Intervals['1d'] if interval == '1M' else Intervals[interval]
+    if Intervals[base] >= Intervals[interval] or width % Intervals[base] != timedelta(0):
+        raise ValueError("{} candles cannot be built from {} candles".format(interval, base))
+
+def resample(ohlc: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Returns the candles of interval made of the candles of ohlc, shaped like utils.klinestodataframe.
+
+    The last candle is still in progress when ohlc does not reach its end.
+    """
+    times = ohlc.index.values.astype('datetime64[ms]').astype(np.int64)
+    opens = opentime(times, interval)
+    # début de chaque période dans les chandelles de base, triées par date
+    starts = np.flatnonzero(np.diff(opens, prepend=opens[0] - 1))
+    ends = np.append(starts[1:], len(opens)) - 1
+    values = ohlc[COLUMNS].to_numpy(dtype=np.float64)
+    data = {
+        'open': values[starts, 0],
+        'high': np.maximum.reduceat(values[:, 1], starts) if len(starts) else np.zeros(0),
+        'low': np.minimum.reduceat(values[:, 2], starts) if len(starts) else np.zeros(0),
+        'close': values[ends, 3],
+        'volume': np.add.reduceat(values[:, 4], starts) if len(starts) else np.zeros(0),
+    }
+    index = pd.DatetimeIndex(opens[starts].astype('datetime64[ms]').astype('datetime64[ns]'), name='time')
+    return pd.DataFrame(data, index=index, columns=COLUMNS)
+
+def align(bars: pd.DataFrame, index: pd.DatetimeIndex, interval: str) -> pd.DataFrame:
+    """Reindexes candles of interval on the times of index, each time getting the last candle closed at that time.
+
+    Times before the close of the first candle get NaN, so that a backtest
+    never reads a higher candle before it has closed.
+    """
+    closes = closetime(bars.index.values.astype('datetime64[ms]').astype(np.int64), interval)
+    positions = np.searchsorted(closes, index.values.astype('datetime64[ms]').astype(np.int64), side='right') - 1
+    values = bars[COLUMNS].to_numpy(dtype=np.float64)[np.maximum(positions, 0)]
+    values[positions < 0] = np.nan
+    return pd.DataFrame(values, index=index, columns=COLUMNS)
+
+class Resampled(indicators.Indicator):
+    """Candles of a higher interval as an indicator, to be shared through indicators.cache."""
+
+    def __init__(self, data: pd.DataFrame, interval: str):
+        self.df = resample(data, interval)
+
+    def data(self):
+        return self.df
+
+class Resampler():
+    """Builds the candles of higher intervals as the candles of the base interval arrive.
+
+    The last candles of each interval are kept in a CandleBuffer of
+    capacity candles, the last one being in progress. Revisions of the base
+    candle in progress revise the higher candles holding it.
+    """
+
+    def __init__(self, base: str, intervals, capacity: int = 500):
+        for interval in intervals:
+            checkintervals(base, interval)
+        self.base = base
+        self.candles = {interval: CandleBuffer(capacity) for interval in intervals}
+        # agrégat (open, high, low, volume) des chandelles de base closes de la période en cours, par intervalle
+        self.partial = dict.fromkeys(intervals)
+        # fin des chandelles closes reçues de l'exchange, que les chandelles de base ne modifient plus
+        self.sealed = dict.fromkeys(intervals, 0)
+        self.basetime = None
+        self.last = None
+
+    def __getitem__(self, interval) -> CandleBuffer:
+        return self.candles[interval]
+
+    def seed(self, interval, df: pd.DataFrame, history: pd.DataFrame = None):
+        """Appends candles of interval shaped like utils.klinestodataframe, such as fetched from the exchange.
+
+        The candles of df are closed, unless history, the base candles fetched
+        just before them, is given. The last candle of df is then the one in
+        progress on the exchange, which already holds the base candles of
+        history but the last one, still in progress and applied by extend.
+        """
+        if history is not None and len(history) > 0:
+            time = int(history.index[-1:].values.astype('datetime64[ms]').astype(np.int64)[0])
+            start = int(opentime(time, interval))
+            # les chandelles ouvertes après la chandelle de base en cours sont ignorées
+            df = df[df.index.values.astype('datetime64[ms]').astype(np.int64) <= start]
+            if len(df) > 0 and df.index[-1] == pd.Timestamp(start, unit='ms'):
+                if start < time:
+                    self.candles[interval].extend(df)
+                    open, high, low, close, volume = df[COLUMNS].to_numpy(dtype=np.float64)[-1]
+                    # le volume de la chandelle de base en cours est ajouté à nouveau par extend
+                    self.partial[interval] = (open, high, low, volume - float(history['volume'].iloc[-1]))
+                    self.sealed[interval] = time
+                    return
+                # la chandelle en cours ne tient que la chandelle de base en cours, elle est reconstruite
+                df = df.iloc[:-1]
+        self.candles[interval].extend(df)
+        if len(df) > 0:
+            self.sealed[interval] = int(closetime(self.candles[interval].lasttime(), interval))
+
+    def extend(self, df: pd.DataFrame):
+        """Updates the higher candles with base candles shaped like utils.klinestodataframe."""
+        times = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        values = df[COLUMNS].to_numpy(dtype=np.float64)
+        for i in range(len(df)):
+            self.update(int(times[i]), *values[i])
+
+    def update(self, time: int, open: float, high: float, low: float, close: float, volume: float):
+        """Updates the higher candles with a new or revised base candle opened at time in milliseconds.
+
+        Returns the intervals whose candle has just closed.
+        """
+        if self.basetime != None and time < self.basetime:
+            return []
+        if self.basetime != None and time != self.basetime:
+            # la chandelle de base précédente est close, elle rejoint l'agrégat de sa période
+            o, h, l, c, v = self.last
+            for interval, partial in self.partial.items():
+                if self.basetime < self.sealed[interval]:
+                    # déjà comprise dans une chandelle reçue de l'exchange
+                    continue
+                self.partial[interval] = (o, h, l, v) if partial == None else (partial[0], max(partial[1], h), min(partial[2], l), partial[3] + v)
+
+        closed = []
+        for interval, candles in self.candles.items():
+            if time < self.sealed[interval]:
+                continue
+            start = int(opentime(time, interval))
+            last = candles.lasttime()
+            if last == None or start > last:
+                if last != None and self.basetime != None:
+                    closed.append(interval)
+                self.partial[interval] = None
+            elif start < last:
+                # chandelle de base antérieure aux chandelles déjà reçues de l'intervalle
+                continue
+
+            partial = self.partial[interval]
+            if partial == None:
+                values = (open, high, low, close, volume)
+            else:
+                values = (partial[0], max(partial[1], high), min(partial[2], low), close, partial[3] + volume)
+            if last == None or start > last:
+                candles.append(start, *values)
+            else:
+                candles.revise(*values)
+
+        self.basetime = time
+        self.last = (open, high, low, close, volume)
+        return closed
+
+    def dataframe(self, interval) -> pd.DataFrame:
+        """Returns the candles of interval as a DataFrame shaped like utils.klinestodataframe."""
+        return self.candles[interval].dataframe()
@@ -0,0 +1,292 @@
+"""Live trading of many pairs over several processes.
+
+The pairs are partitioned between shards by a hash of their symbol. Each
+shard is a process running a live.Router for its own pairs, with their
+tickers, books and order client, on its own event loop. The ingest process
+reads the websocket, finds the symbol of each message without decoding its
+kline, and forwards the raw message through a pipe to the shard owning the
+symbol. Execution reports are forwarded the same way, by their symbol.
+"""
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import struct
+import threading
+import time
+import zlib
+
+import websockets
+from pymongo import MongoClient
+
+import live
+from api.binance import Binance, AsyncBinance
+from api.latency import telemetry
+from api.messages import Decoder
+
+# instant d'envoi par le processus d'ingestion, suivi du message du websocket
+Header = struct.Struct('d')
+Stop = b''
+# suit l'instant de la déconnexion, les shards complètent les chandelles de leurs paires
+Backfill = b'backfill'
+
+def shardof(symbol, count):
+    """Returns the index of the shard owning a symbol, the same in every process and run."""
+    return zlib.crc32(symbol.upper().encode()) % count
+
+def partition(pairs: dict, count):
+    """Splits the pairs of a configuration into one dict per shard."""
+    shards = [{} for i in range(count)]
+    for symbol, pair in pairs.items():
+        shards[shardof(symbol, count)][symbol] = pair
+    return shards
+
+def routingsymbol(message: str, listenkey):
+    """Returns the symbol of a combined stream message, or None.
+
+    Klines are routed on their stream name, which is read from the raw
+    message. The less frequent events of the listen key are decoded.
+    """
+    start = message.find('"stream"')
+    if start < 0:
+        return None
+    # guillemet ouvrant de la valeur, avec ou sans espace après les deux points
+    start = message.find('"', start + len('"stream"')) + 1
+    stream = message[start:message.find('"', start)]
+    if stream == listenkey:
+        return json.loads(message)['data'].get('s')
+    return stream.split('@')[0].upper()
+
+def opendatabase(host, name):
+    return MongoClient(host)[name]
+
+def runshard(index, config, test, listenkey, connection, database, processed, lags, logconfig=None):
+    """Main function of a shard process, returns once the ingest process sent Stop."""
+    if logconfig != None:
+        logging.basicConfig(**logconfig)
+    # Ctrl-C et SIGTERM arrivent au processus d'ingestion, qui arrête les shards après leurs derniers messages
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    api = Binance(config, test)
+    # la listen key est maintenue par le processus d'ingestion
+    router = live.Router(config, api, database(), listenkey)
+    if 'port' in config.get('telemetry', {}):
+        telemetry.serve(config['telemetry']['port'] + 1 + index)
+    decoder = Decoder()
+    connection.send_bytes(b'ready')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stopped = loop.create_future()
+
+    def receive():
+        # un nombre limité de messages par appel, pour laisser les ordres avancer
+        for i in range(100):
+            try:
+                if not connection.poll():
+                    return
+                message = connection.recv_bytes()
+            except (EOFError, OSError):
+                # le processus d'ingestion a disparu
+                message = Stop
+            if message == Stop:
+                loop.remove_reader(connection.fileno())
+                stopped.set_result(None)
+                return
+            if message.endswith(Backfill):
+                router.disconnected, = Header.unpack_from(message)
+                router.connected()
+                processed[index] += 1
+                continue
+
+            sent, = Header.unpack_from(message)
+            lag = time.monotonic() - sent
+            # la latence jusqu'à l'ordre est mesurée depuis la réception par le processus d'ingestion
+            telemetry.received = time.perf_counter() - lag
+            stream, event = decoder(message[Header.size:])
+            router.receive(stream, event)
+            telemetry.received = None
+            telemetry.record('lag', lag)
+            processed[index] += 1
+            lags[index] = lag
+
+    loop.add_reader(connection.fileno(), receive)
+    # chaque shard écrit ses propres mesures dans le log
+    report = loop.create_task(router.report())
+    try:
+        loop.run_until_complete(stopped)
+        loop.run_until_complete(asyncio.gather(*router.tasks.values(), return_exceptions=True))
+        report.cancel()
+        loop.run_until_complete(asyncio.gather(report, return_exceptions=True))
+    finally:
+        router.orderapi.close()
+        router.close()
+        api.close()
+        loop.close()
+        connection.close()
+
+class ShardedRouter(live.Supervisor):
+    """Fans the websocket messages out to shard processes, each running a Router.
+
+    Shards are started with the spawn method and their pairs are read once
+    they are ready, so that their history ends before the first forwarded
+    message. shardstats gives the messages sent to and processed by each
+    shard, the ones still in its pipe, and the lag of the last one, which
+    are also part of the telemetry. After a reconnection every shard
+    backfills the candles of its own pairs.
+
+    Messages are written to the pipe of a shard by a thread of its own,
+    from a buffer of buffer messages, so that a slow shard never blocks the
+    websocket nor the other shards. The messages of a full buffer are
+    dropped, and the shard backfills its candles once it caught up. A shard
+    which died stops the router, its pairs could not be traded anymore.
+    """
+
+    def __init__(self, config, api, listenkey, shards, database=None, logconfig=None, timeout=300.0, buffer=10000):
+        self.config = config
+        self.api = api
+        self.orderapi = AsyncBinance(config, api.test)
+        self.listenkey = listenkey
+        self.count = shards
+
+        context = multiprocessing.get_context('spawn')
+        self.processed = context.RawArray('q', shards)
+        self.lags = context.RawArray('d', shards)
+        self.sent = [0] * shards
+        self.dropped = [0] * shards
+        # instant du premier message perdu par un shard, tant qu'il n'a pas rattrapé son retard
+        self.overflowed = [None] * shards
+        self.buffer = buffer
+        self.pairs = partition(config['pairs'], shards)
+        self.owners = {symbol: index for index, pairs in enumerate(self.pairs) for symbol in pairs}
+        database = database if database != None else functools.partial(opendatabase, config['db']['host'], config['db']['name'])
+
+        self.connections = []
+        self.processes = []
+        for index in range(shards):
+            connection, child = context.Pipe()
+            process = context.Process(target=runshard, name='shard{}'.format(index), daemon=True,
+                args=(index, dict(config, pairs=self.pairs[index]), api.test, listenkey, child, database, self.processed, self.lags, logconfig))
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        # chaque shard est alimenté par son propre thread, un shard lent ne bloque pas les autres
+        self.queues = [queue.Queue(buffer) for index in range(shards)]
+        self.senders = [threading.Thread(target=self.forward, args=(index,), name='sender{}'.format(index), daemon=True) for index in range(shards)]
+        for sender in self.senders:
+            sender.start()
+
+        # les chandelles de l'historique doivent précéder le premier message
+        deadline = time.monotonic() + timeout
+        for index, connection in enumerate(self.connections):
+            while not connection.poll(0.1):
+                if not self.processes[index].is_alive() or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError("Shard {} could not start".format(index))
+            connection.recv_bytes()
+        logging.info("{} shards started for {} pairs".format(shards, len(config['pairs'])))
+
+        telemetry.sources['shards'] = self.shardstats
+        self.initsupervisor(config)
+
+    def forward(self, index):
+        """Writes the messages of the buffer of a shard to its pipe, until Stop or until the shard is gone."""
+        while True:
+            message = self.queues[index].get()
+            try:
+                self.connections[index].send_bytes(message)
+            except OSError as e:
+                logging.error("Shard {} does not read its messages anymore : {!r}".format(index, e))
+                return
+            if message == Stop:
+                return
+
+    def send(self, index, message):
+        try:
+            self.queues[index].put_nowait(message)
+        except queue.Full:
+            self.dropped[index] += 1
+            telemetry.count('dropped')
+            if self.overflowed[index] == None:
+                logging.warning("Shard {} is late, its messages are dropped until it catches up".format(index))
+                self.overflowed[index] = time.monotonic()
+            return
+        self.sent[index] += 1
+        # le shard a rattrapé son retard, il complète les chandelles des messages perdus
+        if self.overflowed[index] != None and self.queues[index].qsize() < self.buffer // 2:
+            overflowed, self.overflowed[index] = self.overflowed[index], None
+            self.send(index, Header.pack(overflowed) + Backfill)
+
+    def route(self, message: str):
+        start = time.perf_counter()
+        symbol = routingsymbol(message, self.listenkey)
+        index = self.owners.get(symbol, 0)
+        self.send(index, Header.pack(time.monotonic()) + message.encode())
+        telemetry.record('ingest', time.perf_counter() - start)
+
+    async def ws(self):
+        uri = self.api.streamuri(listenkey=self.listenkey)
+        async with websockets.connect(uri, ssl=True if uri.startswith('wss://') else None) as websocket:
+            self.connected()
+            async for message in websocket:
+                self.route(message)
+
+    def connected(self):
+        self.attempt = 0
+        if self.disconnected != None:
+            message = Header.pack(self.disconnected) + Backfill
+            for index in range(self.count):
+                self.send(index, message)
+            self.disconnected = None
+
+    async def supervise(self):
+        watch = asyncio.ensure_future(self.watch())
+        try:
+            await super().supervise()
+        finally:
+            watch.cancel()
+            await asyncio.gather(watch, return_exceptions=True)
+
+    async def watch(self, period=1.0):
+        """Stops the router when a shard died, instead of reconnecting the websocket for ever."""
+        while not self.stopping:
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logging.critical("Shard {} died with exit code {}, stopping".format(index, process.exitcode))
+                    telemetry.count('shardfailures')
+                    self.stop()
+                    return
+            await asyncio.sleep(period)
+
+    def shardstats(self):
+        return [{'shard': index, 'pairs': len(self.pairs[index]), 'sent': self.sent[index], 'processed': self.processed[index],
+            'backlog': self.sent[index] - self.processed[index], 'dropped': self.dropped[index], 'lag': self.lags[index] * 1000,
+            'alive': self.processes[index].is_alive()}
+            for index in range(self.count)]
+
+    def close(self, timeout=30.0):
+        """Stops the shards once they processed the messages sent to them, their orders are written on the way out."""
+        deadline = time.monotonic() + timeout
+        for index, sender in enumerate(self.senders):
+            try:
+                if sender.is_alive():
+                    self.queues[index].put(Stop, timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Full:
+                pass
+        for sender in self.senders:
+            sender.join(max(deadline - time.monotonic(), 0.0))
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0.0))
+            if process.is_alive():
+                # les shards ignorent SIGTERM
+                process.kill()
+        for connection in self.connections:
+            connection.close()
+        self.orderapi.close()
+        telemetry.sources.pop('shards', None)
@@ -0,0 +1,140 @@
+"""Local columnar store of klines.
+
+Klines are partitioned by symbol, interval and month, each partition being a
+single .npy file holding a (6, n) float64 array : the open time in
+milliseconds followed by the open, high, low, close and volume columns, each
+row contiguous on disk. Partitions are memory-mapped on read and a range
+query within a single partition is returned without copying the prices.
+
+    data/BTCUSDT/15m/2020-01.npy
+"""
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def tomillis(value) -> int:
+    """Converts a datetime, a timestamp string or milliseconds to UTC milliseconds."""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo != None:
+        timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+    return int(timestamp.value // 1000000)
+
+class KlineStore():
+
+    def __init__(self, root='data'):
+        self.root = root
+
+    def directory(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), interval)
+
+    def months(self, symbol, interval):
+        """Lists the stored months of a series as 'YYYY-MM' strings, in chronological order."""
+        directory = self.directory(symbol, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.npy') and not name.startswith('.'))
+
+    def partition(self, symbol, interval, month, mmap=True):
+        """Returns the (6, n) array of a month, memory-mapped unless mmap is False."""
+        path = os.path.join(self.directory(symbol, interval), month + '.npy')
+        if not os.path.exists(path):
+            return np.empty((len(COLUMNS) + 1, 0))
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    def write(self, symbol, interval, df: pd.DataFrame):
+        """Stores klines shaped like utils.klinestodataframe, replacing the already stored ones at the same time."""
+        if len(df) == 0:
+            return
+
+        times = df.index.values.astype('datetime64[ms]')
+        months = times.astype('datetime64[M]')
+        values = np.empty((len(COLUMNS) + 1, len(df)))
+        values[0] = times.astype(np.int64)
+        values[1:] = df[COLUMNS].to_numpy(dtype=np.float64).T
+
+        directory = self.directory(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        for month in np.unique(months):
+            new = values[:, months == month]
+            name = str(month)
+            stored = self.partition(symbol, interval, name, mmap=False)
+            merged = np.concatenate([stored, new], axis=1)
+
+            # les nouvelles valeurs remplacent les anciennes, elles sont placées après lors de la concaténation
+            order = np.argsort(merged[0], kind='stable')
+            merged = merged[:, order]
+            last = np.append(merged[0][1:] != merged[0][:-1], True)
+            merged = np.ascontiguousarray(merged[:, last])
+
+            # écriture atomique pour ne jamais exposer une partition incomplète
+            path = os.path.join(directory, name + '.npy')
+            tmp = os.path.join(directory, '.{}-{}.npy'.format(name, uuid.uuid4().hex))
+            np.save(tmp, merged)
+            os.replace(tmp, path)
+
+    def select(self, symbol, interval, start=None, end=None):
+        """Returns the (6, n) array of the klines between start and end included.
+
+        It is a view on the memory-mapped partition when the range lies within a single month.
+        """
+        start, end = tomillis(start), tomillis(end)
+        months = self.months(symbol, interval)
+        if start != None:
+            first = str(np.datetime64(start, 'ms').astype('datetime64[M]'))
+            months = [m for m in months if m >= first]
+        if end != None:
+            last = str(np.datetime64(end, 'ms').astype('datetime64[M]'))
+            months = [m for m in months if m <= last]
+
+        parts = []
+        for month in months:
+            values = self.partition(symbol, interval, month)
+            lo = 0 if start == None else np.searchsorted(values[0], start, side='left')
+            hi = values.shape[1] if end == None else np.searchsorted(values[0], end, side='right')
+            if hi > lo:
+                parts.append(values[:, lo:hi])
+
+        if len(parts) == 0:
+            return np.empty((len(COLUMNS) + 1, 0))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts, axis=1)
+
+    def times(self, symbol, interval, start=None, end=None):
+        """Returns the stored open times in milliseconds."""
+        return self.select(symbol, interval, start, end)[0].astype(np.int64)
+
+    def read(self, symbol, interval, start=None, end=None) -> pd.DataFrame:
+        """Returns the klines between start and end included, shaped like utils.klinestodataframe."""
+        values = self.select(symbol, interval, start, end)
+        index = pd.DatetimeIndex(values[0].astype(np.int64).astype('datetime64[ms]').astype('datetime64[ns]'), name='time')
+        return pd.DataFrame(values[1:].T, index=index, columns=COLUMNS, copy=False)
+
+def addarguments(parser):
+    """Adds the arguments selecting klines either from a CSV file or from the store."""
+    parser.add_argument("file", nargs='?', help='CSV file generated by former versions of klines.py')
+    parser.add_argument("--symbol", help='Reads the klines of this symbol from the store')
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", help='Start time, as 2020-01-01T00:00:00')
+    parser.add_argument("--end", help='End time, as 2020-01-31T00:00:00')
+    parser.add_argument("--root", default="data", help='Root directory of the store')
+
+def load(parser, args) -> pd.DataFrame:
+    """Loads the klines selected by the arguments added with addarguments."""
+    if args.file != None:
+        return pd.read_csv(args.file, index_col='time', parse_dates=True)
+    if args.symbol == None:
+        parser.error("a file or --symbol is required")
+
+    ohlc = KlineStore(args.root).read(args.symbol, args.interval, args.start, args.end)
+    if len(ohlc) == 0:
+        parser.error("no {} {} klines stored in {}".format(args.symbol, args.interval, args.root))
+    return ohlc
@@ -1,22 +1,51 @@
 import pandas as pd 
 import numpy as np
 import indicators
+import kernels
+import metrics
 import logging
 
 class BacktestResult:
+    """Compact record of the metrics of a backtest, see metrics.summarize for their units.
 
-    def __init__(self, start, end, trades, netret, sharpe, maxdrawdown, maxdrawdownduration):
+    Results hold only numbers and the bounds of the backtest, so that the
+    results of large sweeps are cheap to send between processes and to
+    aggregate with todict.
+    """
+
+    __slots__ = ['start', 'end', 'bars'] + metrics.Names
+
+    def __init__(self, start, end, bars, trades, netret, annualret, sharpe, sortino, calmar, maxdrawdown, maxdrawdownduration, winrate, exposure, turnover):
         self.start = start
         self.end = end
+        self.bars = bars
         self.trades = trades
         self.netret = netret
+        self.annualret = annualret
         self.sharpe = sharpe
+        self.sortino = sortino
+        self.calmar = calmar
         self.maxdrawdown = maxdrawdown
         self.maxdrawdownduration = maxdrawdownduration
+        self.winrate = winrate
+        self.exposure = exposure
+        self.turnover = turnover
+
+    def todict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getstate__(self):
+        return self.todict()
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def __str__(self):
-        return 'Start :\t\t\t{}\nEnd :\t\t\t{}\nTrades :\t\t{}\nReturn % :\t\t{}\nSharpe Ratio :\t\t{}\nMax Drawdown % :\t{}\nMax Drawdown Duration :\t{}'\
-            .format(self.start, self.end, self.trades, self.netret, self.sharpe, self.maxdrawdown, self.maxdrawdownduration) 
+        return 'Start :\t\t\t{}\nEnd :\t\t\t{}\nTrades :\t\t{}\nReturn % :\t\t{:.2f}\nAnnual Return % :\t{:.2f}\nSharpe Ratio :\t\t{:.3f}\nSortino Ratio :\t\t{:.3f}\n'\
+            'Calmar Ratio :\t\t{:.3f}\nMax Drawdown % :\t{:.2f}\nMax Drawdown Duration :\t{}\nWin Rate % :\t\t{:.1f}\nExposure % :\t\t{:.1f}\nTurnover / year :\t{:.1f}'\
+            .format(self.start, self.end, self.trades, self.netret, self.annualret, self.sharpe, self.sortino, self.calmar,
+                self.maxdrawdown, self.maxdrawdownduration, self.winrate, self.exposure, self.turnover)
 
 class Strategy:
 
@@ -28,32 +57,20 @@ class Strategy:
         self.signals['positions'] = 0.0
         self.signals['pct_change'] = 0.0
 
-    def backtest(self, data):
+    def backtest(self, data, interval=None):
+        """Backtests the signal on the prices of data, with the fee paid at each change of position.
+
+        interval is the kline interval, such as '15m', which scales the
+        annualized metrics. It is inferred from the index of data when None.
+        """
+        close = data.to_numpy(dtype=np.float64)
+        signal = self.signals['signal'].to_numpy(dtype=np.float64)
+        periods = metrics.periodsperyear(interval if interval != None else metrics.inferinterval(data.index))
         self.signals['pct_change'] = data.pct_change()
-        self.signals['equity'] = 100.0 + (self.signals['pct_change'][self.signals['signal'] == 1.0].cumsum() * 100.0)
-        self.signals['equity'].iloc[0] = 100.0
-        # TODO : withdraw fees
-        self.signals['equity'] = self.signals['equity'].fillna(method='ffill')
-
-        self.signals['himark'] = self.signals['equity'].cummax()
-        self.signals['drawdown'] = self.signals['equity'] - self.signals['himark']
-
-        drawdownduration = 0.0
-        maxdrawdownduration = 0.0
-        for index, value in self.signals['drawdown'].iteritems():
-            if value != 0:
-                drawdownduration += 1
-            else:
-                if drawdownduration > maxdrawdownduration:
-                    maxdrawdownduration = drawdownduration
-                drawdownduration = 0
-
-        netret = self.signals['pct_change'][self.signals['signal'] == 1.0].sum() * 100.0
-        sharpe = self.signals['pct_change'][self.signals['signal'] == 1.0].mean() / self.signals['pct_change'][self.signals['signal'] == 1.0].std()
-        trades = self.signals['positions'][self.signals['positions'] == 1.0].count()
-        maxdrawdown = self.signals['drawdown'].min()
-
-        return BacktestResult(self.signals.index[0], self.signals.index[len(self.signals.index) - 1], trades, netret, sharpe, maxdrawdown, maxdrawdownduration)
+        self.signals['equity'] = 100.0 * np.cumprod(1.0 + metrics.netreturns(close, signal, self.fee))
+
+        values = metrics.compute(close, signal, self.fee, periods)
+        return BacktestResult(self.signals.index[0], self.signals.index[len(self.signals.index) - 1], len(close), **values)
 
 class BuyAndHoldStrategy(Strategy):
 
@@ -74,125 +91,30 @@ class AvgCrossStrategy(Strategy):
 class RSIMACDStrategy(Strategy):
 
     def __init__(self, close, rsi: indicators.RSI, macd: indicators.MACD, fee=0.0):
-        Strategy.__init__(self, close.index, fee=0.0)
-
-        # indique le signal en cours sachant que MACD > RSI
-        buysignalstrat = None
-
-        macdcrossedfromdown = False
-        macdcrossedfromtop = False
+        Strategy.__init__(self, close.index, fee)
 
-        lowthreshpassed = False
-        lowlowthreshpassed = False
-        hithreshpassed = False
-        hihithreshpassed = False
-        hasbought = False
+        # achat lorsque le RSI remonte au dessus de 20 ou 33, vente lorsqu'il redescend sous 80 ou 66
+        # seulement si c'est le RSI qui a généré l'achat, un croisement de la MACD prévaut sur le RSI
+        # TODO : lorsque le marché stagne, la MACD génère beaucoup de faux signaux, comment les éviter ?
         self.signals['rsi'] = rsi.data()
         self.signals['macd'], self.signals['macd_signal'] = macd.data()
-        for index, row in self.signals.iterrows():
-            # achat en fonction du RSI
-            if row['rsi'] < 33:
-                lowthreshpassed = True
-            if row['rsi'] < 20:
-                lowlowthreshpassed = True
-            if row['rsi'] > 66:
-                hithreshpassed = True
-            if row['rsi'] > 80:
-                hihithreshpassed = True
-
-            if row['rsi'] > 20 and lowlowthreshpassed == True:
-                lowlowthreshpassed = False
-                if hasbought == False:
-                    hasbought = True
-                    buysignalstrat = "RSI"
-            if row['rsi'] > 33 and lowthreshpassed == True:
-                lowthreshpassed = False
-                if hasbought == False:
-                    hasbought = True
-                    buysignalstrat = "RSI"
-            # on revend par RSI seulement si c'est le seul signal qui a généré l'achat
-            if row['rsi'] < 80 and hihithreshpassed == True:
-                hihithreshpassed = False
-                if hasbought == True and buysignalstrat == "RSI":
-                    hasbought = False
-                    buysignalstrat = None
-            if row['rsi'] < 66 and hithreshpassed == True:
-                hithreshpassed = False
-                if hasbought == True and buysignalstrat == "RSI":
-                    hasbought = False
-                    buysignalstrat = None
-
-            # achat en fonction de la MACD
-            # TODO : lorsque le marché stagne, la MACD génère beaucoup de faux signaux, comment les éviter ?
-            if row['macd'] > row['macd_signal'] and macdcrossedfromdown == False:
-                macdcrossedfromdown = True
-                macdcrossedfromtop = False
-                if hasbought == False:
-                    hasbought = True
-                # même si nous avions acheté avec le RSI, si le signal est confirmé par la MACD
-                # il sera considéré comme étant prévalant
-                buysignalstrat = "MACD"
-            if  row['macd'] < row['macd_signal'] and macdcrossedfromtop == False:
-                macdcrossedfromtop = True
-                macdcrossedfromdown = False
-                if hasbought == True:
-                    hasbought = False
-                    buysignalstrat = None
-
-            if hasbought == True:
-                self.signals['signal'].loc[index] = 1.0
-
+        self.signals['signal'] = kernels.rsimacdsignals(kernels.asarray(self.signals['rsi'], self.signals.index),
+            kernels.asarray(self.signals['macd'], self.signals.index), kernels.asarray(self.signals['macd_signal'], self.signals.index))
         self.signals['positions'] = self.signals['signal'].diff()
 
 class RSIStrategy(Strategy):
 
     def __init__(self, close, rsi: indicators.RSI, fee=0.0):
-        Strategy.__init__(self, close.index, fee=0.0)
-
-        lowthreshpassed = False
-        lowlowthreshpassed = False
-        hithreshpassed = False
-        hihithreshpassed = False
-        hasbought = False
-        close['rsi'] = rsi.data()
-        for index, row in close.iterrows():
-            # achat en fonction du RSI
-            if row['rsi'] < 33:
-                lowthreshpassed = True
-            if row['rsi'] < 20:
-                lowlowthreshpassed = True
-            if row['rsi'] > 66:
-                hithreshpassed = True
-            if row['rsi'] > 80:
-                hihithreshpassed = True
-
-            if row['rsi'] > 20 and lowlowthreshpassed == True:
-                lowlowthreshpassed = False
-                if hasbought == False:
-                    hasbought = True
-            if row['rsi'] > 33 and lowthreshpassed == True:
-                lowthreshpassed = False
-                if hasbought == False:
-                    hasbought = True
-            # on revend par RSI seulement si c'est le seul signal qui a généré l'achat
-            if row['rsi'] < 80 and hihithreshpassed == True:
-                hihithreshpassed = False
-                if hasbought == True:
-                    hasbought = False
-            if row['rsi'] < 66 and hithreshpassed == True:
-                hithreshpassed = False
-                if hasbought == True:
-                    hasbought = False
-
-            if hasbought == True:
-                self.signals['signal'].loc[index] = 1.0
+        Strategy.__init__(self, close.index, fee)
 
+        # achat lorsque le RSI remonte au dessus de 20 ou 33, vente lorsqu'il redescend sous 80 ou 66
+        self.signals['signal'] = kernels.rsisignals(kernels.asarray(rsi.data(), self.signals.index))
         self.signals['positions'] = self.signals['signal'].diff()
 
 class MACDStrategy(Strategy):
 
     def __init__(self, close, macd: indicators.MACD, fee=0.0):
-        Strategy.__init__(self, close.index, fee=0.0)
+        Strategy.__init__(self, close.index, fee)
         line, signal = macd.data()
         self.signals['signal'] = np.where(line > signal, 1.0, 0.0)
         self.signals['positions'] = self.signals['signal'].diff()
@@ -200,17 +122,32 @@ class MACDStrategy(Strategy):
 class DBBStrategy(Strategy):
 
     def __init__(self, close, bb1: indicators.BollingerBands, bb2: indicators.BollingerBands, fee=0.0):
-        Strategy.__init__(self, close.index, fee=0.0)
-        
-        hasbought = False
-        for index, row in bb1.df.iterrows():
-            if row['close'] > row['upper'] and row['close'] < bb2.df.loc[index]['upper']:
-                hasbought = True
+        Strategy.__init__(self, close.index, fee)
+
+        # achat lorsque le prix est entre les deux bandes supérieures, vente lorsqu'il est entre les deux bandes inférieures
+        index = self.signals.index
+        self.signals['signal'] = kernels.dbbsignals(kernels.asarray(bb1.df['close'], index), kernels.asarray(bb1.df['upper'], index),
+            kernels.asarray(bb1.df['lower'], index), kernels.asarray(bb2.df['upper'], index), kernels.asarray(bb2.df['lower'], index))
+        self.signals['positions'] = self.signals['signal'].diff()
 
-            if row['close'] < row['lower'] and row['close'] > bb2.df.loc[index]['lower']:
-                hasbought = False
+class StreamingDBBStrategy():
+    """Candle by candle form of DBBStrategy for live trading.
 
-            if hasbought == True:
-                self.signals['signal'].loc[index] = 1.0
+    It is fed with the same value as the two streaming Bollinger Bands and
+    keeps the holding state between calls, so that each new candle costs O(1)
+    instead of replaying the whole history.
+    """
 
-        self.signals['positions'] = self.signals['signal'].diff()
+    def __init__(self):
+        self.hasbought = False
+        self.signal = 0.0
+
+    def update(self, close, bb1: indicators.StreamingBollingerBands, bb2: indicators.StreamingBollingerBands):
+        if close > bb1.upper and close < bb2.upper:
+            self.hasbought = True
+
+        if close < bb1.lower and close > bb2.lower:
+            self.hasbought = False
+
+        self.signal = 1.0 if self.hasbought == True else 0.0
+        return self.signal
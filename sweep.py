@@ -0,0 +1,210 @@
+"""Parameter sweeps of the backtested strategies over a process pool.
+
+The OHLC data is copied once into a shared memory segment which the workers
+attach to, so that only parameter sets and BacktestResult objects go through
+the pool's pipes.
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import batch
+import indicators
+import metrics
+import strategies
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def avgcross(ohlc, fee, fast, slow):
+    fast_ema = indicators.cache.get(indicators.EMA, ohlc['close'], fast)
+    slow_ema = indicators.cache.get(indicators.EMA, ohlc['close'], slow)
+    strategy = strategies.AvgCrossStrategy(ohlc['close'], fast_ema.data(), slow_ema.data(), fee)
+    return strategy.backtest(ohlc['close'])
+
+def macd(ohlc, fee, short, long, signal):
+    strategy = strategies.MACDStrategy(ohlc['close'], indicators.cache.get(indicators.MACD, ohlc['close'], short, long, signal), fee)
+    return strategy.backtest(ohlc['close'])
+
+def rsi(ohlc, fee, period):
+    strategy = strategies.RSIStrategy(ohlc['close'], indicators.cache.get(indicators.RSI, ohlc['close'], period), fee)
+    return strategy.backtest(ohlc['close'])
+
+def dbb(ohlc, fee, period, inner, outer):
+    bb1 = indicators.cache.get(indicators.BollingerBands, ohlc['close'], period, inner)
+    bb2 = indicators.cache.get(indicators.BollingerBands, ohlc['close'], period, outer)
+    strategy = strategies.DBBStrategy(ohlc['close'], bb1, bb2, fee)
+    return strategy.backtest(ohlc['close'])
+
+# stratégies disponibles : fonction d'évaluation, paramètres et combinaisons valides
+Strategies = {
+    'avgcross': (avgcross, ('fast', 'slow'), lambda p: p['fast'] < p['slow']),
+    'macd': (macd, ('short', 'long', 'signal'), lambda p: p['short'] < p['long']),
+    'rsi': (rsi, ('period',), lambda p: p['period'] > 1),
+    'dbb': (dbb, ('period', 'inner', 'outer'), lambda p: p['inner'] < p['outer']),
+}
+
+Metrics = metrics.Names
+
+def parsevalues(spec):
+    """Parses 'start:stop[:step]' (stop included) or 'a,b,c' into a list of numbers."""
+    def number(text):
+        return int(text) if text.lstrip('-').isdigit() else float(text)
+
+    if ':' in spec:
+        bounds = [number(x) for x in spec.split(':')]
+        if len(bounds) not in (2, 3):
+            raise ValueError("Invalid range {}".format(spec))
+        start, stop = bounds[0], bounds[1]
+        step = bounds[2] if len(bounds) == 3 else 1
+        if step <= 0:
+            raise ValueError("Invalid step in {}".format(spec))
+        count = int(round((stop - start) / step)) + 1
+        return [start + i * step for i in range(max(count, 0))]
+    return [number(x) for x in spec.split(',')]
+
+def parsegrid(specs):
+    """Parses a list of 'name=values' into a dict of parameter name to values."""
+    grid = {}
+    for spec in specs:
+        if '=' not in spec:
+            raise ValueError("Invalid grid parameter {}, expected name=values".format(spec))
+        name, values = spec.split('=', 1)
+        grid[name.strip()] = parsevalues(values.strip())
+    return grid
+
+def combinations(strategy, grid):
+    """Lists the valid parameter sets of a strategy for a grid."""
+    func, names, valid = Strategies[strategy]
+    missing = [name for name in names if name not in grid]
+    unknown = [name for name in grid if name not in names]
+    if len(missing) > 0 or len(unknown) > 0:
+        raise ValueError("Strategy {} expects parameters {}".format(strategy, ', '.join(names)))
+
+    params = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    return [p for p in params if valid(p)]
+
+class SharedArray():
+    """NumPy array copied once into a shared memory segment."""
+
+    def __init__(self, array: np.ndarray):
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)[...] = array
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype
+
+    @staticmethod
+    def attach(spec):
+        """Returns the segment of spec and the array over it, without copying."""
+        name, shape, dtype = spec
+        shm = shared_memory.SharedMemory(name=name)
+        return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SharedOHLC():
+    """OHLC data stored in shared memory.
+
+    The time index is shared as int64 nanoseconds and the open, high, low,
+    close and volume columns as a float64 array of a row per column.
+    """
+
+    def __init__(self, ohlc: pd.DataFrame):
+        self.times = SharedArray(ohlc.index.values.astype('datetime64[ns]').view(np.int64))
+        self.values = SharedArray(ohlc[COLUMNS].to_numpy(dtype=np.float64).T)
+
+    @property
+    def spec(self):
+        return self.times.spec, self.values.spec
+
+    @staticmethod
+    def attach(spec):
+        """Returns the segments of spec and a DataFrame over the shared arrays, without copying them."""
+        timesshm, times = SharedArray.attach(spec[0])
+        valuesshm, values = SharedArray.attach(spec[1])
+        index = pd.DatetimeIndex(times.view('datetime64[ns]'), name='time')
+        return [timesshm, valuesshm], pd.DataFrame(values.T, index=index, columns=COLUMNS, copy=False)
+
+    def close(self):
+        self.times.close()
+        self.values.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# données attachées par chaque processus du pool
+_segments = []
+_ohlc = None
+
+def attach(spec):
+    global _ohlc
+    segments, _ohlc = SharedOHLC.attach(spec)
+    _segments.extend(segments)
+
+def evaluate(strategy, params, fee):
+    func = Strategies[strategy][0]
+    return [(p, func(_ohlc, fee, **p)) for p in params]
+
+def chunks(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def sweep(ohlc: pd.DataFrame, strategy: str, grid: dict, workers: int = None, fee: float = 0.0, batched: bool = False):
+    """Backtests every valid combination of the grid and returns a list of (params, BacktestResult).
+
+    The combinations are split in a few chunks per worker to balance the load.
+    With batched, they are evaluated as signal matrices in this process, see
+    batch, for the strategies it supports.
+    """
+    params = combinations(strategy, grid)
+    if batched:
+        if strategy not in batch.Signals:
+            raise ValueError("Strategy {} cannot be evaluated in batches".format(strategy))
+        return batch.screen(ohlc, strategy, params, fee)
+    workers = workers if workers != None else os.cpu_count()
+
+    if workers <= 1 or len(params) <= 1:
+        func = Strategies[strategy][0]
+        return [(p, func(ohlc, fee, **p)) for p in params]
+
+    results = []
+    with SharedOHLC(ohlc) as shared:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(shared.spec,)) as executor:
+            futures = [executor.submit(evaluate, strategy, chunk, fee) for chunk in chunks(params, workers * 4)]
+            for future in futures:
+                results.extend(future.result())
+    return results
+
+def rank(results, metric='netret'):
+    """Returns the sweep results as a DataFrame sorted from best to worst on metric."""
+    rows = []
+    for params, result in results:
+        row = dict(params)
+        for name in Metrics:
+            row[name] = getattr(result, name)
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    if len(table) == 0:
+        return table
+
+    # les durées de drawdown sont meilleures lorsqu'elles sont courtes
+    ascending = metric == 'maxdrawdownduration'
+    return table.sort_values(metric, ascending=ascending, na_position='last').reset_index(drop=True)
@@ -0,0 +1,46 @@
+import unittest
+import math
+import numpy as np
+import pandas as pd
+
+import batch
+import indicators
+import strategies
+import sweep
+
+class TestBatch(unittest.TestCase):
+    """Tests batched backtests against the strategies evaluated one by one."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+
+    def test_signals(self):
+        params = sweep.combinations('avgcross', {'fast': [5, 9], 'slow': [21, 26]})
+        signals = batch.signals(self.ohlc.close, 'avgcross', params)
+        self.assertEqual(signals.shape, (4, len(self.ohlc)))
+        for row, p in zip(signals, params):
+            fast = indicators.EMA(self.ohlc.close, p['fast']).data()
+            slow = indicators.EMA(self.ohlc.close, p['slow']).data()
+            strategy = strategies.AvgCrossStrategy(self.ohlc.close, fast, slow)
+            self.assertTrue(np.array_equal(row, strategy.signals['signal'].values))
+
+    def test_screen(self):
+        for strategy, grid in [('avgcross', {'fast': [5, 9, 12], 'slow': [12, 21, 26]}), ('macd', {'short': [8, 12], 'long': [21, 26], 'signal': [5, 9]}),
+                ('rsi', {'period': [9, 14]}), ('dbb', {'period': [20], 'inner': [1.0], 'outer': [2.0, 3.0]})]:
+            # a few rows per chunk
+            batched = batch.screen(self.ohlc, strategy, sweep.combinations(strategy, grid), 0.001, maxbytes=len(self.ohlc) * 8 * 8 * 3)
+            sequential = sweep.sweep(self.ohlc, strategy, grid, workers=1, fee=0.001)
+            self.assertEqual(len(batched), len(sequential))
+            for (params1, result1), (params2, result2) in zip(batched, sequential):
+                self.assertEqual(params1, params2)
+                for name, value in result2.todict().items():
+                    if isinstance(value, float):
+                        self.assertTrue(math.isclose(getattr(result1, name), value, rel_tol=1e-9), name)
+                    else:
+                        self.assertEqual(getattr(result1, name), value)
+
+        table = sweep.rank(sweep.sweep(self.ohlc, 'avgcross', {'fast': [5, 9], 'slow': [21, 26]}, fee=0.001, batched=True), 'sharpe')
+        self.assertTrue(table['sharpe'].is_monotonic_decreasing)
+
+if __name__ == '__main__':
+    unittest.main()
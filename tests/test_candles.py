@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from candles import CandleBuffer
+
+class TestCandles(unittest.TestCase):
+
+    def candle(self, i):
+        return i * 60000, float(i), i + 2.0, i - 2.0, i + 1.0, 10.0 * i
+
+    def test_append(self):
+        buffer = CandleBuffer(5)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.lasttime(), None)
+
+        # the window slides over the mirrored storage without ever being copied
+        for i in range(23):
+            buffer.append(*self.candle(i))
+            expected = np.arange(max(0, i - 4), i + 1, dtype=np.float64)
+            np.testing.assert_array_equal(buffer.open, expected)
+            np.testing.assert_array_equal(buffer.close, expected + 1.0)
+            np.testing.assert_array_equal(buffer.times(), (expected * 60000).astype(np.int64))
+            self.assertTrue(np.shares_memory(buffer.close, buffer.values))
+            self.assertTrue(buffer.close.flags['C_CONTIGUOUS'])
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.lasttime(), 22 * 60000)
+
+    def test_revise(self):
+        buffer = CandleBuffer(3)
+        self.assertRaises(IndexError, buffer.revise, 1.0, 1.0, 1.0, 1.0, 1.0)
+        for i in range(4):
+            buffer.append(*self.candle(i))
+        close = buffer.close
+        buffer.revise(3.0, 9.0, 1.0, 7.0, 5.0)
+
+        np.testing.assert_array_equal(buffer.ohlcv()[:, -1], [3.0, 9.0, 1.0, 7.0, 5.0])
+        np.testing.assert_array_equal(buffer.close, [2.0, 3.0, 7.0])
+        # views taken earlier see the revision
+        self.assertEqual(close[-1], 7.0)
+        self.assertEqual(buffer.lasttime(), 3 * 60000)
+        self.assertFalse(close.flags.writeable)
+        self.assertEqual(buffer.last(), {'time': 3 * 60000, 'open': 3.0, 'high': 9.0, 'low': 1.0, 'close': 7.0, 'volume': 5.0})
+        self.assertEqual(CandleBuffer(3).last(), None)
+
+    def test_dataframe(self):
+        index = pd.date_range('2020-01-01', periods=10, freq='1min', name='time')
+        df = pd.DataFrame({'open': np.arange(10.0), 'high': np.arange(10.0) + 2, 'low': np.arange(10.0) - 2, 'close': np.arange(10.0) + 1, 'volume': np.ones(10)}, index=index)
+        buffer = CandleBuffer(4)
+        buffer.extend(df)
+        pd.testing.assert_frame_equal(buffer.dataframe(), df.iloc[-4:], check_freq=False)
+
+if __name__ == '__main__':
+    unittest.main()
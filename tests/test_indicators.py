@@ -49,5 +49,124 @@ class TestIndicators(unittest.TestCase):
         # consider first 100 values as warmup
         self.assertTrue(np.all(isclose))
 
+    def test_RSI_reference(self):
+        rsi = pd.read_csv('tests/data/BTCUSDT_15m_RSI9.csv', index_col='time', parse_dates=True)
+        myrsi = indicators.RSI(self.ohlc.close, period=9)
+        # no warmup needed, the first value is seeded as TA-Lib does
+        self.assertTrue(np.all(np.isclose(rsi.rsi, myrsi.df.rsi, equal_nan=True)))
+
+        # Wilder's smoothing computed step by step
+        period = 14
+        close = self.ohlc.close.values
+        diff = np.diff(close)
+        avg_gain = np.mean(np.clip(diff[:period], 0.0, None))
+        avg_loss = np.mean(np.clip(-diff[:period], 0.0, None))
+        expected = [np.nan] * period + [100.0 - 100.0 / (1.0 + avg_gain / avg_loss)]
+        for change in diff[period:]:
+            avg_gain = (avg_gain * (period - 1) + max(change, 0.0)) / period
+            avg_loss = (avg_loss * (period - 1) + max(-change, 0.0)) / period
+            expected.append(100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+        myrsi = indicators.RSI(self.ohlc.close, period=period)
+        self.assertTrue(np.all(np.isclose(expected, myrsi.df.rsi, equal_nan=True)))
+
+    def test_RSI_short_series(self):
+        myrsi = indicators.RSI(self.ohlc.close.iloc[:9], period=9)
+        self.assertEqual(len(myrsi.data()), 9)
+        self.assertTrue(myrsi.data().isna().all())
+
+    def test_streaming_SMA(self):
+        sma = indicators.SMA(self.ohlc.close, period=9)
+        stream = indicators.StreamingSMA(period=9)
+        values = [stream.update(price) for price in self.ohlc.close]
+        self.assertTrue(np.all(np.isclose(sma.df.sma9, values, equal_nan=True)))
+
+    def test_streaming_EMA(self):
+        ema = indicators.EMA(self.ohlc.close, period=21)
+        stream = indicators.StreamingEMA(period=21)
+        values = [stream.update(price) for price in self.ohlc.close]
+        self.assertTrue(np.all(np.isclose(ema.df.ema21, values, equal_nan=True)))
+
+    def test_streaming_MACD(self):
+        macd = indicators.MACD(self.ohlc.close, short_period=12, long_period=26, period=9)
+        stream = indicators.StreamingMACD(12, 26, 9)
+        values = np.array([stream.update(price) for price in self.ohlc.close])
+        self.assertTrue(np.all(np.isclose(macd.df.MACD, values[:, 0], equal_nan=True)))
+        self.assertTrue(np.all(np.isclose(macd.df.signal, values[:, 1], equal_nan=True)))
+
+    def test_streaming_RSI(self):
+        rsi = pd.read_csv('tests/data/BTCUSDT_15m_RSI9.csv', index_col='time', parse_dates=True)
+        stream = indicators.StreamingRSI(period=9)
+        values = [stream.update(price) for price in self.ohlc.close]
+        # no warmup needed, the first value is seeded as TA-Lib does
+        self.assertTrue(np.all(np.isclose(rsi.rsi, values, equal_nan=True)))
+
+    def test_streaming_BBANDS(self):
+        bbands = indicators.BollingerBands(self.ohlc.close, period=5, std=2)
+        stream = indicators.StreamingBollingerBands(period=5, std=2)
+        values = np.array([stream.update(price) for price in self.ohlc.close])
+        self.assertTrue(np.all(np.isclose(bbands.df.ma, values[:, 0], equal_nan=True)))
+        self.assertTrue(np.all(np.isclose(bbands.df.upper, values[:, 1], equal_nan=True)))
+        self.assertTrue(np.all(np.isclose(bbands.df.lower, values[:, 2], equal_nan=True)))
+
+    def test_streaming_revise_last(self):
+        factories = [lambda: indicators.StreamingSMA(9), lambda: indicators.StreamingEMA(21), lambda: indicators.StreamingMACD(12, 26, 9),
+            lambda: indicators.StreamingRSI(9), lambda: indicators.StreamingBollingerBands(5, 2)]
+        for factory in factories:
+            stream = factory()
+            reference = factory()
+            for price in self.ohlc.close:
+                # in progress candles are first seen with a different price
+                stream.update(price * 1.01)
+                stream.revise_last(price * 0.99)
+                value = stream.revise_last(price)
+                self.assertTrue(np.all(np.isclose(reference.update(price), value, equal_nan=True)))
+
+    def test_cache(self):
+        cache = indicators.IndicatorCache(maxsize=2)
+        ema9 = cache.get(indicators.EMA, self.ohlc.close, 9)
+        # parameters are normalized and a copy of the series has the same fingerprint
+        self.assertIs(cache.get(indicators.EMA, self.ohlc.close.copy(), period=9), ema9)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # a different series or different parameters are cache misses
+        self.assertIsNot(cache.get(indicators.EMA, self.ohlc.close.iloc[:-1], 9), ema9)
+        self.assertIsNot(cache.get(indicators.EMA, self.ohlc.open, 9), ema9)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        # swapped values have different fingerprints
+        values = np.zeros(8192)
+        values[0], values[4096] = 1.0, 2.0
+        swapped = values.copy()
+        swapped[0], swapped[4096] = 2.0, 1.0
+        self.assertNotEqual(cache.fingerprint(pd.Series(values)), cache.fingerprint(pd.Series(swapped)))
+
+        # least recently used entries are evicted
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        cache.get(indicators.EMA, self.ohlc.close, 9)
+        self.assertEqual(cache.misses, 4)
+
+    def test_cache_maxbytes(self):
+        cache = indicators.IndicatorCache(maxbytes=10000)
+        cache.get(indicators.SMA, self.ohlc.close, 9)
+        cache.get(indicators.SMA, self.ohlc.close, 21)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.nbytes, 10000)
+        # the shared cache is bounded in memory too
+        self.assertEqual(indicators.cache.maxbytes, indicators.CacheBytes)
+
+    def test_cache_MACD(self):
+        cache = indicators.IndicatorCache()
+        ema12 = cache.get(indicators.EMA, self.ohlc.close, 12)
+        macd = cache.get(indicators.MACD, self.ohlc.close, 12, 26, 9)
+        # MACD built by a cache reuses its short EMA, and is found again without it
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertIs(cache.get(indicators.MACD, self.ohlc.close, 12, 26, 9, cache=cache), macd)
+        self.assertTrue(np.allclose(macd.df.MACD, ema12.data() - indicators.EMA(self.ohlc.close, 26).data()))
+
+        # built directly, it leaves the shared cache alone
+        indicators.cache.clear()
+        pd.testing.assert_frame_equal(indicators.MACD(self.ohlc.close, 12, 26, 9).df, macd.df)
+        self.assertEqual(len(indicators.cache), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import pandas as pd
+import numpy as np
+
+import indicators
+import kernels
+
+class TestKernels(unittest.TestCase):
+    """Tests vectorized kernels against the single pass loops."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+        rng = np.random.default_rng(42)
+        # RSI like values hitting exactly the thresholds, with a NaN warmup
+        self.rsi = rng.choice([10.0, 20.0, 25.0, 33.0, 50.0, 66.0, 70.0, 80.0, 90.0], 5000)
+        self.rsi[:9] = np.nan
+        self.macd = rng.normal(0.0, 1.0, 5000)
+        self.macdsignal = np.where(rng.random(5000) < 0.1, self.macd, rng.normal(0.0, 1.0, 5000))
+
+    def test_ffill(self):
+        values = np.array([np.nan, 1.0, np.nan, np.nan, 0.0, np.nan])
+        self.assertTrue(np.array_equal(kernels.ffill(values), [np.nan, 1.0, 1.0, 1.0, 0.0, 0.0], equal_nan=True))
+
+    def test_RSI(self):
+        self.assertTrue(np.array_equal(kernels.rsivectorized(self.rsi), kernels.rsiloop(self.rsi)))
+
+    def test_RSI_MACD(self):
+        self.assertTrue(np.array_equal(kernels.rsimacdvectorized(self.rsi, self.macd, self.macdsignal),
+            kernels.rsimacdloop(self.rsi, self.macd, self.macdsignal)))
+
+    def test_DBB(self):
+        close = self.ohlc.close.values
+        bb1 = indicators.BollingerBands(self.ohlc.close, 5, 1)
+        bb2 = indicators.BollingerBands(self.ohlc.close, 5, 2)
+        arrays = (close, bb1.df.upper.values, bb1.df.lower.values, bb2.df.upper.values, bb2.df.lower.values)
+        self.assertTrue(np.array_equal(kernels.dbbvectorized(*arrays), kernels.dbbloop(*arrays)))
+
+    def test_selected(self):
+        # selected kernels are either compiled loops or the vectorized form
+        self.assertTrue(np.array_equal(kernels.rsisignals(self.rsi), kernels.rsiloop(self.rsi)))
+        self.assertTrue(np.array_equal(kernels.rsimacdsignals(self.rsi, self.macd, self.macdsignal),
+            kernels.rsimacdloop(self.rsi, self.macd, self.macdsignal)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+import json
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import klines
+from api.binance import Binance
+from store import KlineStore, tomillis
+
+STEP = 15 * 60 * 1000
+STEPS = {'15m': STEP, '1h': 4 * STEP}
+START = tomillis('2020-01-01 00:00:00')
+# the exchange has no klines during a maintenance on the 2nd of January
+MAINTENANCE = (tomillis('2020-01-02 10:00:00'), tomillis('2020-01-02 11:45:00'))
+END = tomillis('2020-02-15 00:00:00')
+
+class FakeExchange(BaseHTTPRequestHandler):
+    """Serves /api/v3/klines from a deterministic series of 15m klines."""
+
+    requests = []
+    failafter = None
+    throttle = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        with FakeExchange.lock:
+            FakeExchange.requests.append(params)
+            throttled = FakeExchange.throttle > 0
+            FakeExchange.throttle -= 1 if throttled else 0
+
+        if throttled:
+            self.reply(429, {'code': -1003, 'msg': 'Too many requests'})
+            return
+        if FakeExchange.failafter != None and len(FakeExchange.requests) > FakeExchange.failafter:
+            self.reply(500, {'code': -1000, 'msg': 'Internal error'})
+            return
+
+        step = STEPS[params['interval']]
+        first = max(int(params.get('startTime', START)), START)
+        last = min(int(params.get('endTime', END)), END)
+        first = -(-first // step) * step
+        data = []
+        for time in range(first, last + 1, step):
+            if MAINTENANCE[0] <= time <= MAINTENANCE[1]:
+                continue
+            price = float(time // STEP % 1000)
+            data.append([time, price, price + 2.0, price - 2.0, price + 1.0, 10.0, time + step - 1, '0', 1, '0', '0', '0'])
+            if len(data) == int(params['limit']):
+                break
+        self.reply(200, data)
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestKlines(unittest.TestCase):
+    """Tests the incremental kline downloader against a fake exchange."""
+
+    def setUp(self):
+        FakeExchange.requests = []
+        FakeExchange.failafter = None
+        FakeExchange.throttle = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeExchange)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.api = Binance({'api': {'url': 'http://127.0.0.1:{}'.format(self.server.server_port)}})
+        self.root = tempfile.mkdtemp()
+        self.store = KlineStore(self.root)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+    def test_missingranges(self):
+        self.assertEqual(klines.missingranges([], 0, 100, 10), [(0, 100)])
+        self.assertEqual(klines.missingranges([0, 10, 20, 50, 60], 0, 100, 10), [(21, 49), (61, 100)])
+        self.assertEqual(klines.missingranges([20, 30], 0, 35, 10), [(0, 19)])
+        self.assertEqual(klines.subtract([(0, 100)], [(10, 19), (50, 200)]), [(0, 9), (20, 49)])
+
+    def test_download(self):
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m')
+        count = downloader.download(START, END)
+
+        expected = (END - START) // STEP + 1 - 8
+        self.assertEqual(count, expected)
+        df = self.store.read('BTCUSDT', '15m')
+        self.assertEqual(len(df), expected)
+        self.assertTrue(df.index.is_monotonic_increasing)
+        self.assertEqual(self.store.months('BTCUSDT', '15m'), ['2020-01', '2020-02'])
+
+        # nothing is requested once everything is stored, the maintenance is remembered
+        FakeExchange.requests = []
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m')
+        self.assertEqual(downloader.download(START, END), 0)
+        self.assertEqual(FakeExchange.requests, [])
+
+    def test_resume(self):
+        FakeExchange.failafter = 2
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m', flushpages=1)
+        self.assertRaises(klines.DownloadError, downloader.download, START, END)
+        # pages downloaded before the failure are kept
+        self.assertEqual(len(self.store.read('BTCUSDT', '15m')), 2000)
+
+        FakeExchange.failafter = None
+        FakeExchange.requests = []
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m')
+        downloader.download(START, END)
+        # the download resumes after the stored klines
+        self.assertEqual(int(FakeExchange.requests[0]['startTime']), int(self.store.times('BTCUSDT', '15m')[1999]) + 1)
+        self.assertEqual(len(self.store.read('BTCUSDT', '15m')), (END - START) // STEP + 1 - 8)
+
+    def test_gap(self):
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m')
+        downloader.download(START, END)
+        times = self.store.times('BTCUSDT', '15m')
+        df = self.store.read('BTCUSDT', '15m')
+
+        # a hole in the stored klines is the only range fetched again
+        for month in self.store.months('BTCUSDT', '15m'):
+            os.remove(os.path.join(self.store.directory('BTCUSDT', '15m'), month + '.npy'))
+        self.store.write('BTCUSDT', '15m', df.iloc[:1000])
+        self.store.write('BTCUSDT', '15m', df.iloc[1500:])
+        FakeExchange.requests = []
+        downloader = klines.Downloader(self.api, self.store, 'BTCUSDT', '15m')
+        self.assertEqual(downloader.download(START, END), 500)
+        self.assertEqual(len(FakeExchange.requests), 1)
+        self.assertEqual(int(FakeExchange.requests[0]['startTime']), int(times[999]) + 1)
+        self.assertEqual(int(FakeExchange.requests[0]['endTime']), int(times[1500]) - 1)
+
+    def test_ratelimiter(self):
+        info = {'rateLimits': [
+            {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'SECOND', 'intervalNum': 1, 'limit': 10},
+            {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 50},
+        ]}
+        limiter = klines.RateLimiter.fromexchangeinfo(info, margin=1.0)
+        self.assertEqual(len(limiter.windows), 1)
+        self.assertEqual(klines.klinesweight(1000), 5)
+
+        begin = time.monotonic()
+        for i in range(3):
+            limiter.acquire(5)
+        # the third request waits for the first one to leave the window
+        self.assertGreaterEqual(time.monotonic() - begin, 0.9)
+
+        limiter.pause(0.3)
+        begin = time.monotonic()
+        limiter.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - begin, 0.25)
+
+    def test_bulk(self):
+        FakeExchange.throttle = 2
+        series = [(symbol, interval) for symbol in ('BTCUSDT', 'ETHUSDT') for interval in ('15m', '1h')]
+        downloader = klines.BulkDownloader(self.api, self.store, series, workers=4, backoff=0.05)
+        count = downloader.download(START, END)
+
+        self.assertGreaterEqual(downloader.limiter.pauses, 2)
+        for symbol, interval in series:
+            df = self.store.read(symbol, interval)
+            self.assertTrue(df.index.is_monotonic_increasing)
+            self.assertFalse(df.index.has_duplicates)
+        self.assertEqual(len(self.store.read('BTCUSDT', '15m')), (END - START) // STEP + 1 - 8)
+        self.assertEqual(len(self.store.read('ETHUSDT', '1h')), (END - START) // (4 * STEP) + 1 - 2)
+        self.assertEqual(count, sum(len(self.store.read(symbol, interval)) for symbol, interval in series))
+
+        # the series are complete, resuming them fetches nothing
+        FakeExchange.requests = []
+        downloader = klines.BulkDownloader(self.api, self.store, series, workers=4)
+        self.assertEqual(downloader.download(START, END), 0)
+        self.assertEqual(FakeExchange.requests, [])
+
+if __name__ == '__main__':
+    unittest.main()
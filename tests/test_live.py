@@ -0,0 +1,304 @@
+import unittest
+import asyncio
+import random
+from unittest.mock import MagicMock
+from mongomock import MongoClient
+
+import live
+from api.binance import OrderSide, OrderStatus
+from api.latency import telemetry
+from api.messages import Kline
+
+START = 1577836800000
+MINUTE = 60 * 1000
+
+class SlowOrders():
+    """Asynchronous order api whose orders for a symbol wait until it is released."""
+
+    def __init__(self):
+        self.orders = []
+        self.prices = []
+        self.released = {}
+
+    def release(self, symbol):
+        self.released.setdefault(symbol, asyncio.Event()).set()
+
+    async def order(self, symbol, side, type, quantity, price):
+        event = self.released.setdefault(symbol, asyncio.Event())
+        await event.wait()
+        self.orders.append((symbol, side))
+        self.prices.append(price)
+        return 200, {'symbol': symbol, 'side': side.name, 'status': OrderStatus.FILLED.name, 'price': str(price), 'orderId': random.randint(1000, 9999), 'transactTime': START}
+
+    async def cancelorder(self, symbol, orderid):
+        return 200, {}
+
+class TestRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.orderapi = SlowOrders()
+        self.api = MagicMock()
+        self.api.getklines.return_value = 200, [[START + i * MINUTE, 100.0, 101.0, 99.0, 100.0, 1.0, 0, 0, 0, 0, 0, 0] for i in range(30)]
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}, 'ETHUSDT': {'interval': '1m', 'quantity': 1}}}
+        self.db = MongoClient().binance
+        self.router = live.Router(config, self.api, self.db, 'listenkey', self.orderapi)
+        for ticker in self.router.tickers.values():
+            ticker.startup = False
+            ticker.strategy = MagicMock()
+
+    def tearDown(self):
+        self.router.close()
+        self.loop.close()
+
+    def kline(self, symbol, minute, price):
+        return {'e': 'kline', 'E': START + minute * MINUTE, 's': symbol, 'k': {'t': START + minute * MINUTE, 'o': price, 'h': price, 'l': price, 'c': price, 'v': 1.0}}
+
+    def signal(self, symbol, value):
+        self.router.tickers[symbol].strategy.signal = value
+
+    def test_dispatch(self):
+        async def scenario():
+            self.signal('BTCUSDT', 1.0)
+            self.signal('ETHUSDT', 1.0)
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 30, 100.0))
+            self.router.route('ethusdt@kline_1m', self.kline('ETHUSDT', 30, 50.0))
+            self.orderapi.release('ETHUSDT')
+            await asyncio.sleep(0.01)
+
+            # the pending BTCUSDT order does not delay ETHUSDT
+            self.assertEqual(self.orderapi.orders, [('ETHUSDT', OrderSide.BUY)])
+            self.assertTrue(self.router.tickers['ETHUSDT'].book.holding)
+            self.assertFalse(self.router.tickers['BTCUSDT'].book.holding)
+
+            # candles are still processed, the sell waits for the buy of the same symbol
+            self.signal('BTCUSDT', 0.0)
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 31, 110.0))
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 31, 111.0))
+            self.assertEqual(self.router.tickers['BTCUSDT'].candles.close[-1], 111.0)
+
+            self.orderapi.release('BTCUSDT')
+            await self.router.tasks['BTCUSDT']
+            self.assertEqual(self.router.tasks, {})
+
+        self.loop.run_until_complete(scenario())
+        self.assertEqual(self.orderapi.orders, [('ETHUSDT', OrderSide.BUY), ('BTCUSDT', OrderSide.BUY), ('BTCUSDT', OrderSide.SELL)])
+        self.assertFalse(self.router.tickers['BTCUSDT'].book.holding)
+
+        # the orders are written by the background writer, at the latest when the router is closed
+        self.router.close()
+        self.assertEqual(self.db.orders.count_documents({}), 3)
+        self.assertEqual(self.db.orders.count_documents({'symbol': 'BTCUSDT', 'side': 'SELL'}), 1)
+
+    def test_signalonopen(self):
+        async def scenario():
+            self.signal('BTCUSDT', 1.0)
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 30, 100.0))
+            # the buy waits for the exchange while the next candles open
+            self.signal('BTCUSDT', 0.0)
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 31, 110.0))
+            self.signal('BTCUSDT', 0.5)
+            self.router.route('btcusdt@kline_1m', self.kline('BTCUSDT', 32, 120.0))
+            self.orderapi.release('BTCUSDT')
+            await self.router.tasks['BTCUSDT']
+
+        self.loop.run_until_complete(scenario())
+        # each order has the side and the price of the candle it was decided on
+        self.assertEqual(self.orderapi.orders, [('BTCUSDT', OrderSide.BUY), ('BTCUSDT', OrderSide.SELL)])
+        self.assertEqual([float(price) for price in self.orderapi.prices], [100.0, 110.0])
+
+    def test_unchanged(self):
+        async def scenario():
+            ticker = self.router.tickers['BTCUSDT']
+            self.signal('BTCUSDT', 0.5)
+            self.router.route('btcusdt@kline_1m', Kline('BTCUSDT', START + 30 * MINUTE, 100.0, 101.0, 99.0, 100.5, 1.0))
+            self.router.route('btcusdt@kline_1m', Kline('BTCUSDT', START + 30 * MINUTE, 100.0, 101.0, 99.0, 100.5, 2.0))
+            # only the volume changed, the candle is left as it was
+            self.assertEqual(ticker.candles.volume[-1], 1.0)
+            self.router.route('btcusdt@kline_1m', Kline('BTCUSDT', START + 30 * MINUTE, 100.0, 101.0, 99.0, 100.5, 3.0, True))
+            self.assertEqual(ticker.candles.volume[-1], 3.0)
+            self.router.route('btcusdt@kline_1m', Kline('BTCUSDT', START + 30 * MINUTE, 100.0, 101.0, 99.0, 100.7, 3.0))
+            self.assertEqual(ticker.candles.close[-1], 100.7)
+            await asyncio.gather(*self.router.tasks.values())
+
+        self.loop.run_until_complete(scenario())
+
+class HistoryOrders():
+    """Asynchronous api serving klines from a list, the last one still open."""
+
+    def __init__(self, klines):
+        self.klines = klines
+        self.requests = 0
+
+    async def getklines(self, symbol, interval, limit):
+        self.requests += 1
+        return 200, self.klines[-limit:]
+
+class FailingStream():
+    """Api whose websocket fails before connecting a number of times, then sends messages."""
+
+    def __init__(self, failures, messages, stopping):
+        self.failures = failures
+        self.messages = messages
+        self.stopping = stopping
+        self.connections = 0
+
+    async def ws(self, handler, listenkey=None, connected=None):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError('network unreachable')
+        self.connections += 1
+        connected()
+        for message in self.messages:
+            handler(*message)
+        await asyncio.sleep(0.01)
+        self.stopping()
+
+    def timestamp(self):
+        return START + 40 * MINUTE
+
+class TestReconnect(unittest.TestCase):
+
+    def setUp(self):
+        telemetry.reset()
+        prices = [100.0 + (i * 7) % 11 for i in range(41)]
+        self.klines = [[START + i * MINUTE, prices[i], prices[i] + 1, prices[i] - 1, prices[i] + 0.5, 1.0, 0, 0, 0, 0, 0, 0] for i in range(41)]
+        self.db = MongoClient().binance
+
+    def ticker(self):
+        api = MagicMock()
+        api.getklines.return_value = 200, self.klines[:30]
+        return live.LiveTicker(api, self.db, 'BTCUSDT', '1m', 1)
+
+    def stream(self, ticker, minutes):
+        for k in self.klines[minutes]:
+            ticker.update_price(Kline('BTCUSDT', k[0], k[1], k[2], k[3], k[4], k[5]))
+
+    def test_backfill(self):
+        # a ticker which received every kline, and one whose websocket was down from the 33rd to the 38th minute
+        continuous, interrupted = self.ticker(), self.ticker()
+        self.stream(continuous, slice(29, 41))
+        self.stream(interrupted, slice(29, 33))
+        self.assertEqual(interrupted.backfill(self.klines[:40]), 6)
+        self.stream(interrupted, slice(39, 41))
+
+        self.assertEqual(list(interrupted.candles.times()), list(continuous.candles.times()))
+        self.assertEqual(list(interrupted.candles.close), list(continuous.candles.close))
+        self.assertEqual(interrupted.indicatorvalues(), continuous.indicatorvalues())
+        self.assertEqual(telemetry.counters['BTCUSDT']['backfilled'], 6)
+        self.assertNotIn('missed', telemetry.counters['BTCUSDT'])
+
+        # a closing update of an older candle, received during the backfill, is dropped
+        times, closes = list(interrupted.candles.times()), list(interrupted.candles.close)
+        k = self.klines[38]
+        self.assertEqual(interrupted.update_price(Kline('BTCUSDT', k[0], k[1], k[2], k[3], 0.0, k[5], True)), None)
+        self.assertEqual(list(interrupted.candles.times()), times)
+        self.assertEqual(list(interrupted.candles.close), closes)
+        self.assertEqual(interrupted.indicatorvalues(), continuous.indicatorvalues())
+        self.assertEqual(telemetry.counters['BTCUSDT']['stale'], 1)
+
+        # without backfill, the gap is counted when the next candle opens
+        gapped = self.ticker()
+        self.stream(gapped, slice(29, 36))
+        self.stream(gapped, slice(38, 39))
+        self.assertEqual(telemetry.counters['BTCUSDT']['missed'], 2)
+
+    def test_supervise(self):
+        messages = [('btcusdt@kline_1m', Kline('BTCUSDT', k[0], k[1], k[2], k[3], k[4], k[5])) for k in self.klines[39:41]]
+        api = MagicMock()
+        api.getklines.return_value = 200, self.klines[:30]
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}}, 'reconnect': {'backoff': 0.001, 'maxbackoff': 0.002}}
+        orderapi = HistoryOrders(self.klines[:40])
+        router = live.Router(config, api, self.db, 'listenkey', orderapi)
+        router.api = FailingStream(2, messages, router.stop)
+        ticker = router.tickers['BTCUSDT']
+        # the websocket of the first subscription closes after a candle, the router reconnects after two failures
+        ticker.update_price(Kline('BTCUSDT', *self.klines[30][:6]))
+        router.disconnected = 0.0
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(router.supervise())
+            loop.run_until_complete(asyncio.gather(*router.tasks.values()))
+        finally:
+            router.close()
+            loop.close()
+            asyncio.set_event_loop(None)
+
+        self.assertEqual(telemetry.counters[None]['disconnects'], 2)
+        self.assertEqual((router.attempt, router.api.connections, orderapi.requests), (0, 1, 1))
+        # the klines missed are applied before the messages of the new websocket
+        self.assertEqual(ticker.candles.lasttime(), START + 40 * MINUTE)
+        self.assertEqual(list(ticker.candles.times())[-11:], [START + i * MINUTE for i in range(30, 41)])
+        self.assertEqual(telemetry.counters['BTCUSDT']['backfilled'], 8)
+        self.assertEqual(telemetry.stages()['reconnect'].count, 1)
+        self.assertEqual((router.pending, router.disconnected), (None, None))
+
+    def test_keepalive(self):
+        class ListenKeys():
+            def __init__(self, responses):
+                self.responses = responses
+                self.created = 0
+
+            async def pinglistenkey(self, listenkey):
+                response = self.responses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+            async def createlistenkey(self):
+                self.created += 1
+                return 200, {'listenKey': 'new{}'.format(self.created)}
+
+        api = MagicMock()
+        api.getklines.return_value = 200, self.klines[:30]
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}}, 'reconnect': {'backoff': 0.001, 'maxbackoff': 0.002}, 'listenkey': {'period': 0.001, 'retries': 2}}
+        # a timeout or a truncated response is retried, an expired key is replaced at once, and one whose pings keep failing after the retries
+        orderapi = ListenKeys([asyncio.IncompleteReadError(b'', 8), (200, {}), asyncio.TimeoutError(), (200, {}), (400, {'code': -1125, 'msg': 'This listenKey does not exist.'}),
+            (503, {}), (503, {})])
+        router = live.Router(config, api, self.db, 'listenkey', orderapi)
+        router.resubscribe = MagicMock()
+
+        calls = []
+        async def flaky():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise RuntimeError('failed')
+            if len(calls) == 3:
+                await asyncio.sleep(3600)
+
+        async def scenario():
+            task = asyncio.ensure_future(router.keepalive())
+            while orderapi.created < 2:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            # a task that fails or exits is run again
+            task = asyncio.ensure_future(router.restarting(flaky))
+            while len(calls) < 3:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(scenario())
+        finally:
+            router.close()
+            loop.close()
+
+        self.assertEqual(router.listenkey, 'new2')
+        self.assertEqual(router.resubscribe.call_count, 2)
+        self.assertEqual(orderapi.responses, [])
+        counters = telemetry.counters[None]
+        self.assertEqual((counters['listenkeypings'], counters['listenkeyfailures'], counters['listenkeys']), (2, 5, 2))
+        self.assertEqual(counters['restarts'], 2)
+
+    def test_delay(self):
+        delays = [live.reconnectdelay(attempt, 1.0, 60.0) for attempt in range(10)]
+        for attempt, delay in enumerate(delays):
+            self.assertGreaterEqual(delay, min(60.0, 2 ** attempt) * 0.5)
+            self.assertLessEqual(delay, min(60.0, 2 ** attempt) * 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
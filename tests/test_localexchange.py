@@ -0,0 +1,94 @@
+import unittest
+import asyncio
+
+import live
+import replay
+from api.binance import Binance, OrderSide, OrderType
+from api.messages import ExecutionReport
+from localexchange import LocalExchange, synthetic
+
+class TestLocalExchange(unittest.TestCase):
+
+    def setUp(self):
+        self.klines = synthetic(3, 700)
+        self.exchange = LocalExchange(self.klines, '1m')
+        self.exchange.background()
+        self.pairs = {symbol: {'interval': '1m', 'quantity': 1} for symbol in self.klines}
+        self.config = self.exchange.config(self.pairs)
+        self.api = Binance(self.config, test=False)
+
+    def tearDown(self):
+        self.api.close()
+        self.exchange.shutdown()
+
+    def test_rest(self):
+        status, data = self.api.getklines('PAIR0000USDT', '1m', 500)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(data), 500)
+        self.assertEqual(data[-1][0], int(self.klines['PAIR0000USDT'].index[500].value // 1000000))
+        self.assertEqual(self.api.getklines('UNKNOWN', '1m', 500)[0], 400)
+
+        status, data = self.api.exchangeinfo()
+        self.assertEqual(len(data['symbols']), 3)
+        self.assertIn('rateLimits', data)
+
+        status, order = self.api.order('PAIR0001USDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 90.0)
+        self.assertEqual((status, order['status']), (200, 'NEW'))
+        self.assertEqual(self.api.cancelorder('PAIR0001USDT', order['orderId'])[0], 200)
+        self.assertEqual(self.api.cancelorder('PAIR0001USDT', order['orderId'])[0], 400)
+
+        status, data = self.api.createlistenkey()
+        self.assertEqual(self.api.pinglistenkey(data['listenKey'])[0], 200)
+        self.assertEqual(self.api.pinglistenkey('unknown')[0], 400)
+        # every request went through a single keep-alive connection
+        self.assertEqual(self.api.pool.connections, 1)
+
+    def test_failed(self):
+        def fail(symbol, high, low):
+            raise RuntimeError("matching failed")
+        self.exchange.exchange.match = fail
+        # a failed replay finishes the exchange instead of leaving serve waiting
+        with self.assertLogs(level='ERROR'):
+            self.exchange.loop.call_soon_threadsafe(self.exchange.subscribed.set)
+            self.assertTrue(self.exchange.wait(10))
+        self.assertTrue(self.exchange.clock.done())
+
+    def test_router(self):
+        status, data = self.api.createlistenkey()
+        listenkey = data['listenKey']
+        router = live.Router(self.config, self.api, replay.MemoryDatabase(), listenkey)
+        reports = []
+        messages = []
+        route = router.route
+
+        def observe(stream, event):
+            messages.append(stream)
+            if type(event) is ExecutionReport:
+                reports.append(event)
+            route(stream, event)
+
+        async def trade():
+            task = asyncio.ensure_future(self.api.ws(observe, listenkey=listenkey))
+            # the last messages may still be on their way when the exchange is finished
+            while not (self.exchange.finished.is_set() and len(messages) == self.exchange.messages) and not task.done():
+                await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, *router.tasks.values(), return_exceptions=True)
+            router.orderapi.close()
+
+        asyncio.run(trade())
+        router.close()
+        self.assertTrue(self.exchange.finished.is_set())
+
+        # orders sent by the books were filled and reported back to them
+        self.assertGreater(self.exchange.orders, 0)
+        self.assertGreater(len(reports), 0)
+        self.assertEqual(self.exchange.latency.count, self.exchange.orders)
+        for report in reports:
+            book = router.tickers[report.symbol].book
+            self.assertEqual(book.orders[report.orderid]['status'], 'FILLED')
+        for symbol, ticker in router.tickers.items():
+            self.assertEqual(ticker.candles.lasttime(), int(self.klines[symbol].index[-1].value // 1000000))
+
+if __name__ == '__main__':
+    unittest.main()
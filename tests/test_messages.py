@@ -0,0 +1,33 @@
+import unittest
+import json
+
+from api import messages
+from api.messages import Decoder, Kline, ExecutionReport
+
+KLINE = '{"stream":"bnbbtc@kline_1m","data":{"e":"kline","E":123456789,"s":"BNBBTC","k":{"t":123400000,"T":123460000,"s":"BNBBTC","i":"1m","f":100,"L":200,"o":"0.0010","c":"0.0020","h":"0.0025","l":"0.0015","v":"1000","n":100,"x":false,"q":"1.0000","V":"500","Q":"0.500","B":"123456"}}}'
+REPORT = '{"stream":"key","data":{"e":"executionReport","E":1499405658658,"s":"ETHBTC","c":"mUvoqJxFIILMdfAW5iGSOW","S":"BUY","o":"LIMIT","f":"GTC","q":"1.00000000","p":"0.10264410","P":"0.00000000","F":"0.00000000","g":-1,"C":"","x":"TRADE","X":"FILLED","r":"NONE","i":4293153,"l":"1.00000000","z":"1.00000000","L":"0.10264410","n":"0","N":null,"T":1499405658657,"t":-1,"I":8641984,"w":true,"m":false,"M":false,"O":1499405658657,"Z":"0.10264410","Y":"0.00000000","Q":"0.00000000"}}'
+ACCOUNT = '{"stream":"key","data":{"e":"outboundAccountPosition","E":1564034571105,"u":1564034571073,"B":[]}}'
+
+class TestMessages(unittest.TestCase):
+
+    def test_decode(self):
+        decoders = [Decoder(json.loads), Decoder()]
+        for decoder in decoders:
+            stream, kline = decoder(KLINE)
+            self.assertEqual(stream, 'bnbbtc@kline_1m')
+            self.assertEqual(kline, Kline('BNBBTC', 123400000, 0.001, 0.0025, 0.0015, 0.002, 1000.0, False, 123456789))
+
+            stream, report = decoder(REPORT.encode())
+            self.assertEqual(report, ExecutionReport('ETHBTC', 'BUY', 'FILLED', '0.10264410', 4293153, 1499405658657, 1.0, 1.0, 1499405658658))
+
+            # events without a struct are left as dicts
+            stream, account = decoder(ACCOUNT)
+            self.assertEqual(account['e'], 'outboundAccountPosition')
+
+        # structs have no instance dict
+        self.assertRaises(AttributeError, setattr, kline, 'other', 1)
+        self.assertEqual(messages.fromdict(json.loads(KLINE)['data']), kline)
+        self.assertIn("symbol='BNBBTC'", repr(kline))
+
+if __name__ == '__main__':
+    unittest.main()
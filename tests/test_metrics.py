@@ -0,0 +1,109 @@
+import unittest
+import math
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+import metrics
+import strategies
+
+class TestMetrics(unittest.TestCase):
+    """Tests the backtest metrics against a candle by candle computation."""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.close = 100.0 * np.cumprod(1.0 + rng.normal(0.0, 0.01, 500))
+        self.signals = (rng.random((4, 500)) > 0.7).astype(np.float64)
+        self.signals[1, :] = 1.0
+        self.signals[2, :] = 0.0
+
+    def reference(self, signal, fee, periods):
+        equity = [1.0]
+        returns = []
+        trades = []
+        previous = 0.0
+        for i in range(len(self.close)):
+            # the signal of a candle is held during the next one
+            change = self.close[i] / self.close[i - 1] - 1.0 if i > 0 else 0.0
+            position = signal[i - 1] if i > 0 else 0.0
+            r = (1.0 + position * change) * (1.0 - fee * abs(position - previous)) - 1.0
+            returns.append(r)
+            equity.append(equity[-1] * (1.0 + r))
+            if position == 1.0 and previous == 0.0:
+                trades.append(equity[-2])
+            if position == 0.0 and previous == 1.0:
+                trades[-1] = equity[-1] / trades[-1] - 1.0
+            previous = position
+        if previous == 1.0:
+            trades[-1] = equity[-1] / trades[-1] - 1.0
+
+        equity = pd.Series(equity[1:])
+        drawdown = equity / equity.cummax() - 1.0
+        longest = duration = 0
+        for value in drawdown:
+            duration = duration + 1 if value < 0 else 0
+            longest = max(longest, duration)
+        returns = pd.Series(returns)
+        return {'trades': len(trades), 'netret': (equity.iloc[-1] - 1.0) * 100.0, 'sharpe': returns.mean() / returns.std() * math.sqrt(periods),
+            'maxdrawdown': drawdown.min() * 100.0, 'maxdrawdownduration': longest, 'winrate': np.mean(np.array(trades) > 0) * 100.0 if trades else np.nan}
+
+    def test_compute(self):
+        periods = metrics.periodsperyear('15m')
+        self.assertEqual(periods, 35040)
+        batch = metrics.compute(self.close, self.signals, 0.001, periods)
+        for n, signal in enumerate(self.signals):
+            single = metrics.compute(self.close, signal, 0.001, periods)
+            expected = self.reference(signal, 0.001, periods)
+            for name, value in expected.items():
+                if isinstance(value, float) and math.isnan(value):
+                    self.assertTrue(math.isnan(single[name]))
+                else:
+                    self.assertAlmostEqual(single[name], value, places=9, msg=name)
+            for name, value in single.items():
+                np.testing.assert_allclose(batch[name][n], value, rtol=1e-12)
+
+        # buying and holding pays the fee once, and is exposed from the second candle
+        held = metrics.compute(self.close, self.signals[1], 0.001, periods)
+        self.assertAlmostEqual(held['netret'], ((self.close[-1] / self.close[0]) * 0.999 - 1.0) * 100.0)
+        self.assertEqual(held['trades'], 1)
+        self.assertAlmostEqual(held['exposure'], 499 / 500 * 100.0)
+        self.assertAlmostEqual(held['turnover'], periods / 500)
+        # never trading has no return and no ratio
+        flat = metrics.compute(self.close, self.signals[2], 0.001, periods)
+        self.assertEqual((flat['trades'], flat['netret'], flat['maxdrawdown']), (0, 0.0, 0.0))
+        self.assertTrue(math.isnan(flat['sharpe']))
+
+    def test_positions(self):
+        # a signal known at the close of a candle does not earn its change
+        close = np.array([100.0, 110.0, 121.0, 121.0])
+        self.assertTrue(np.array_equal(metrics.positions([1.0, 1.0, 0.0, 0.0]), [0.0, 1.0, 1.0, 0.0]))
+        self.assertTrue(np.allclose(metrics.netreturns(close, [0.0, 1.0, 0.0, 0.0]), [0.0, 0.0, 0.1, 0.0]))
+        self.assertTrue(np.allclose(metrics.netreturns(close, [0.0, 0.0, 0.0, 1.0]), 0.0))
+
+    def test_stats(self):
+        change = metrics.changes(self.close)
+        np.testing.assert_allclose(metrics.statsvectorized(change, self.signals, 0.001), metrics.statsloop(change, self.signals, 0.001), rtol=1e-9, atol=1e-12)
+        # selected kernels are either compiled loops or the vectorized form
+        np.testing.assert_allclose(metrics.rowstats(change, self.signals, 0.001), metrics.statsloop(change, self.signals, 0.001), rtol=1e-9, atol=1e-12)
+
+    def test_runs(self):
+        mask = np.array([[1, 1, 0, 1], [0, 0, 0, 0], [0, 1, 1, 1]], dtype=bool)
+        rows, starts, lengths = metrics.runs(mask)
+        self.assertEqual(list(rows), [0, 0, 2])
+        self.assertEqual(list(starts), [0, 3, 1])
+        self.assertEqual(list(lengths), [2, 1, 3])
+
+    def test_result(self):
+        index = pd.date_range('2020-01-01', periods=500, freq='15min')
+        self.assertEqual(metrics.inferinterval(index), timedelta(minutes=15))
+        close = pd.Series(self.close, index=index)
+        strategy = strategies.BuyAndHoldStrategy(close, 0.001)
+        result = strategy.backtest(close)
+        self.assertEqual(result.todict(), strategies.BuyAndHoldStrategy(close, 0.001).backtest(close, '15m').todict())
+        self.assertAlmostEqual(strategy.signals['equity'].iloc[-1], 100.0 + result.netret)
+        # results can be aggregated as plain records
+        table = pd.DataFrame([result.todict(), result.todict()])
+        self.assertEqual(list(table.columns), ['start', 'end', 'bars'] + metrics.Names)
+
+if __name__ == '__main__':
+    unittest.main()
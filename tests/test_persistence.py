@@ -0,0 +1,115 @@
+import unittest
+import datetime
+from unittest.mock import MagicMock
+from mongomock import MongoClient
+from pymongo.errors import AutoReconnect
+
+import live
+from api.binance import OrderSide, OrderStatus
+from persistence import BulkWriter, OrderWriter, CandleWriter, recentcandles
+from tests.test_live import START, MINUTE
+
+class FlakyCollection():
+    """Collection whose first bulk writes fail."""
+
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.name = collection.name
+        self.failures = failures
+
+    def bulk_write(self, requests, ordered=True):
+        if self.failures > 0:
+            self.failures -= 1
+            raise AutoReconnect('connection lost')
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MongoClient().binance
+
+    def test_immediate(self):
+        writer = OrderWriter(self.db.orders)
+        writer.ensureindexes()
+        indexes = [index['key'] for index in self.db.orders.index_information().values()]
+        self.assertIn([('symbol', 1), ('transactTime', -1)], indexes)
+        self.assertIn([('orderId', 1)], indexes)
+
+        # without the thread, documents are written when they are given
+        writer.upsert({'symbol': 'BTCUSDT', 'orderId': 1, 'status': 'NEW', 'side': 'BUY'})
+        writer.upsert({'symbol': 'BTCUSDT', 'orderId': 1, 'status': 'FILLED'})
+        writer.upsert({'symbol': 'ETHUSDT', 'orderId': 1, 'status': 'NEW'})
+        self.assertEqual(self.db.orders.count_documents({}), 2)
+        self.assertEqual(self.db.orders.find_one({'symbol': 'BTCUSDT', 'orderId': 1})['status'], 'FILLED')
+        self.assertEqual(self.db.orders.find_one({'symbol': 'BTCUSDT', 'orderId': 1})['side'], 'BUY')
+
+    def test_batches(self):
+        writer = OrderWriter(self.db.orders, batchsize=4, period=60.0).start()
+        for i in range(10):
+            writer.upsert({'symbol': 'BTCUSDT', 'orderId': i % 6, 'status': 'NEW', 'price': str(i)})
+        writer.flush()
+        self.assertEqual(self.db.orders.count_documents({}), 6)
+        # the last version of an order wins, whichever batch it was in
+        self.assertEqual(self.db.orders.find_one({'orderId': 3})['price'], '9')
+        self.assertLessEqual(writer.batches, 3)
+
+        # close writes what is still queued, however long the period
+        writer.upsert({'symbol': 'BTCUSDT', 'orderId': 6, 'status': 'NEW'})
+        writer.close()
+        self.assertEqual(self.db.orders.count_documents({}), 7)
+        self.assertEqual(writer.thread, None)
+
+    def test_retry(self):
+        writer = BulkWriter(FlakyCollection(self.db.orders, 1), ('orderId',), retries=1)
+        self.assertTrue(writer.write([{'orderId': 1}]))
+        self.assertEqual(self.db.orders.count_documents({}), 1)
+
+        writer = BulkWriter(FlakyCollection(self.db.orders, 2), ('orderId',), retries=1)
+        self.assertFalse(writer.write([{'orderId': 2}]))
+        self.assertEqual(writer.lost, 1)
+
+    def test_book(self):
+        api = MagicMock()
+        writer = OrderWriter(self.db.orders).start()
+        book = live.Book(api, self.db, 'BTCUSDT', 0.1, writer)
+        api.order.return_value = 200, {'symbol': 'BTCUSDT', 'side': 'BUY', 'status': OrderStatus.NEW.name, 'price': '6500', 'orderId': 7, 'transactTime': 1499405658657}
+        self.assertTrue(book.buy(6500))
+        book.update_order({'s': 'BTCUSDT', 'S': 'BUY', 'X': OrderStatus.FILLED.name, 'p': '6500', 'i': 7, 'T': 1499405658658, 'q': '0.1', 'z': '0.1'})
+        writer.close()
+
+        self.assertEqual(self.db.orders.count_documents({}), 1)
+        stored = self.db.orders.find_one({'orderId': 7})
+        self.assertEqual(stored['status'], OrderStatus.FILLED.name)
+        self.assertEqual(stored['filledQuantity'], 0.1)
+        # the book keeps its own copy of the orders
+        self.assertNotIn('_id', book.orders[7])
+
+        # a new book finds the last order of the symbol
+        self.assertTrue(live.Book(api, self.db, 'BTCUSDT', 0.1).holding)
+
+    def test_candles(self):
+        # the candles of the test are from 2020, they would expire with a shorter retention
+        writer = CandleWriter(self.db.candles, retention=10 * 365 * 86400, indicators=True)
+        writer.ensureindexes()
+        ttl = [index for index in self.db.candles.index_information().values() if 'expireAfterSeconds' in index]
+        self.assertEqual([(index['key'], index['expireAfterSeconds']) for index in ttl], [([('time', 1)], 10 * 365 * 86400)])
+
+        api = MagicMock()
+        api.getklines.return_value = 200, [[START + i * MINUTE, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1.0, 0, 0, 0, 0, 0, 0] for i in range(30)]
+        ticker = live.LiveTicker(api, self.db, 'BTCUSDT', '1m', 1, candlewriter=writer)
+        for minute, open, close in [(29, 130.0, 130.0), (30, 131.0, 131.0), (30, 131.0, 132.0), (31, 133.0, 133.0)]:
+            ticker.update_price({'e': 'kline', 's': 'BTCUSDT', 'k': {'t': START + minute * MINUTE, 'o': open, 'h': close, 'l': open, 'c': close, 'v': 2.0}})
+
+        # a candle is written once the next one opens, with the indicators computed with its open
+        self.assertEqual(self.db.candles.count_documents({}), 2)
+        candle = self.db.candles.find_one({'time': datetime.datetime.utcfromtimestamp((START + 30 * MINUTE) / 1000)})
+        self.assertEqual((candle['symbol'], candle['interval'], candle['open'], candle['close']), ('BTCUSDT', '1m', 131.0, 132.0))
+        self.assertAlmostEqual(candle['indicators']['ma'], (sum(range(111, 129)) + 130.0 + 131.0) / 20)
+
+        candles = recentcandles(self.db.candles, 'BTCUSDT', 1)
+        self.assertEqual(candles, [{'time': candle['time'], 'close': 132.0}])
+        self.assertEqual(len(recentcandles(self.db.candles, 'BTCUSDT', 10)), 2)
+        self.assertEqual(recentcandles(self.db.candles, 'ETHUSDT', 10), [])
+
+if __name__ == '__main__':
+    unittest.main()
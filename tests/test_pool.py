@@ -0,0 +1,249 @@
+import unittest
+import asyncio
+import threading
+import json
+import socket
+import time
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from api.binance import Binance, AsyncBinance, OrderSide, OrderType
+from api.latency import LatencyHistogram
+from api.pool import ConnectionPool
+
+class StubExchange(BaseHTTPRequestHandler):
+    """Answers every request with its method and path over HTTP/1.1 keep-alive connections."""
+
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    received = []
+    delay = 0.0
+    closeafter = None
+    drop = 0
+    chunked = False
+
+    def setup(self):
+        StubExchange.connections += 1
+        super().setup()
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode() if length > 0 else ''
+        StubExchange.received.append((self.command, self.path, body))
+        if StubExchange.drop > 0:
+            # la requête est reçue mais la connexion est perdue avant la réponse
+            StubExchange.drop -= 1
+            self.close_connection = True
+            return
+        time.sleep(StubExchange.delay)
+
+        data = json.dumps({'method': self.command, 'path': self.path, 'body': body}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if StubExchange.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(data), 10):
+                chunk = data[i:i + 10]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode() + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        # le serveur ferme la connexion sans prévenir, comme à l'expiration d'une connexion inactive
+        if StubExchange.closeafter != None and len(StubExchange.received) >= StubExchange.closeafter:
+            self.close_connection = True
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+class StubTestCase(unittest.TestCase):
+
+    def setUp(self):
+        StubExchange.connections = 0
+        StubExchange.received = []
+        StubExchange.delay = 0.0
+        StubExchange.closeafter = None
+        StubExchange.drop = 0
+        StubExchange.chunked = False
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubExchange)
+        self.server.daemon_threads = True
+        # les clients qui abandonnent une requête trop lente ne sont pas une erreur
+        self.server.handle_error = lambda request, address: None
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.api = Binance({'api': {'url': self.url, 'apikey': 'key', 'secretkey': 'secret', 'poolsize': 2, 'timeout': 2.0}})
+
+    def tearDown(self):
+        self.api.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+class TestPool(StubTestCase):
+
+    def test_keepalive(self):
+        for i in range(10):
+            status, data = self.api.time()
+            self.assertEqual(status, 200)
+            self.assertEqual(data['path'], '/api/v3/time')
+        self.assertEqual(StubExchange.connections, 1)
+        self.assertEqual(self.api.pool.connections, 1)
+
+        histogram = self.api.latencies['GET /api/v3/time']
+        self.assertEqual(histogram.count, 10)
+        self.assertTrue(histogram.percentile(50) > 0)
+
+    def test_reconnect(self):
+        StubExchange.closeafter = 1
+        self.api.time()
+        # the pooled connection was closed by the server, the next request reconnects
+        status, data = self.api.pinglistenkey('abc')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['method'], 'PUT')
+        self.assertEqual(StubExchange.connections, 2)
+
+    def test_stale(self):
+        pool = ConnectionPool(self.url[len('http://'):], secure=False, size=1)
+        pool.request('GET', '/api/v3/time')
+        # the server drops the idle connection, the request is sent again on a new one
+        conn, since = pool.idle.queue[0]
+        conn.sock.shutdown(socket.SHUT_RDWR)
+        status, headers, data = pool.request('GET', '/api/v3/time')
+        self.assertEqual(status, 200)
+        self.assertEqual(pool.connections, 2)
+        pool.close()
+
+    def test_lostresponse(self):
+        self.api.time()
+        StubExchange.drop = 1
+        # an order may have reached the exchange, it is never sent twice
+        self.assertRaises(http.client.RemoteDisconnected, self.api.order, 'BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 7500)
+        self.assertEqual(len(StubExchange.received), 2)
+
+        # idempotent requests are sent again
+        self.api.time()
+        StubExchange.drop = 1
+        status, data = self.api.time()
+        self.assertEqual(status, 200)
+        self.assertEqual(len(StubExchange.received), 5)
+
+    def test_poolsize(self):
+        StubExchange.delay = 0.2
+        threads = [threading.Thread(target=self.api.time) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(StubExchange.received), 6)
+        self.assertLessEqual(self.api.pool.connections, 2)
+
+    def test_timeout(self):
+        StubExchange.delay = 0.5
+        self.assertRaises(OSError, self.api._request, 'GET', '/api/v3/time', timeout=0.1)
+        # the timed out connection is not reused
+        StubExchange.delay = 0.0
+        status, data = self.api.time()
+        self.assertEqual(status, 200)
+
+    def test_order(self):
+        status, data = self.api.order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 7500)
+        self.assertEqual(status, 200)
+        method, path, body = StubExchange.received[-1]
+        self.assertEqual((method, path), ('POST', '/api/v3/order/test'))
+        self.assertIn('signature=', body)
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for ms in [0.5, 3, 3, 3, 40, 2000]:
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.percentile(50), 5)
+        self.assertEqual(histogram.percentile(100), 2000)
+        self.assertAlmostEqual(histogram.max, 2000)
+
+class TestAsyncPool(StubTestCase):
+    """Sends the requests through AsyncBinance and its asyncio connection pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.aapi = AsyncBinance(self.api.config)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.aapi.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        super().tearDown()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_async_keepalive(self):
+        async def requests():
+            return [await self.aapi.time() for i in range(5)]
+
+        StubExchange.chunked = True
+        for status, data in self.run_async(requests()):
+            self.assertEqual(status, 200)
+            self.assertEqual(data['path'], '/api/v3/time')
+        self.assertEqual(StubExchange.connections, 1)
+        self.assertEqual(self.aapi.latencies['GET /api/v3/time'].count, 5)
+
+    def test_async_concurrent(self):
+        async def requests():
+            return await asyncio.gather(*[self.aapi.time() for i in range(6)])
+
+        StubExchange.delay = 0.2
+        start = time.monotonic()
+        results = self.run_async(requests())
+        # two connections serve six requests in three rounds
+        self.assertLess(time.monotonic() - start, 1.1)
+        self.assertEqual([status for status, data in results], [200] * 6)
+        self.assertEqual(self.aapi.pool.connections, 2)
+
+        # a pool built before the loop, such as that of a shard, waits in the loop running its requests
+        other = asyncio.new_event_loop()
+        try:
+            results = other.run_until_complete(requests())
+        finally:
+            self.aapi.close()
+            other.run_until_complete(asyncio.sleep(0))
+            other.close()
+        self.assertEqual([status for status, data in results], [200] * 6)
+
+    def test_async_lostresponse(self):
+        async def requests():
+            await self.aapi.time()
+            StubExchange.drop = 1
+            with self.assertRaises(http.client.RemoteDisconnected):
+                await self.aapi.order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 7500)
+            await self.aapi.time()
+            StubExchange.drop = 1
+            return await self.aapi.pinglistenkey('abc')
+
+        status, data = self.run_async(requests())
+        self.assertEqual(status, 200)
+        self.assertEqual(data['method'], 'PUT')
+        self.assertEqual(len(StubExchange.received), 5)
+
+    def test_async_order(self):
+        status, data = self.run_async(self.aapi.order('BTCUSDT', OrderSide.SELL, OrderType.LIMIT, 1.0, 7500))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['side'], 'SELL')
+        method, path, body = StubExchange.received[-1]
+        self.assertEqual((method, path), ('POST', '/api/v3/order/test'))
+        self.assertIn('signature=', body)
+
+    def test_async_timeout(self):
+        StubExchange.delay = 0.5
+        self.assertRaises(asyncio.TimeoutError, self.run_async, self.aapi._request('GET', '/api/v3/time', timeout=0.1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+import shutil
+import math
+import numpy as np
+import pandas as pd
+
+import batch
+import metrics
+import portfolio
+from store import KlineStore
+
+class TestPortfolio(unittest.TestCase):
+    """Tests portfolio backtests over a temporary store."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+        self.root = tempfile.mkdtemp()
+        self.store = KlineStore(self.root)
+        self.store.write('BTCUSDT', '15m', self.ohlc)
+        # a second symbol listed later, with a few missing klines
+        other = pd.DataFrame(self.ohlc.values[::-1] / 50.0, index=self.ohlc.index, columns=self.ohlc.columns)
+        self.store.write('ETHUSDT', '15m', other.iloc[100:].drop(other.index[500:510]))
+        self.params = {'fast': 5, 'slow': 12}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_single(self):
+        # a single symbol fully invested is the backtest of its strategy
+        result = portfolio.backtest(self.store, ['BTCUSDT'], '15m', 'avgcross', self.params, fee=0.001)
+        close = self.ohlc['close'].values
+        signal = batch.signals(self.ohlc['close'], 'avgcross', [self.params])[0].astype(np.float64)
+        expected = metrics.compute(close, signal, 0.001, metrics.periodsperyear('15m'))
+        self.assertTrue(np.allclose(result.equity.values, 100.0 * np.cumprod(1.0 + metrics.netreturns(close, signal, 0.001))))
+        for name, value in expected.items():
+            self.assertTrue(math.isclose(getattr(result.result, name), value, rel_tol=1e-9), name)
+        self.assertEqual(result.symbols.loc['BTCUSDT', 'trades'], expected['trades'])
+
+    def test_chunks(self):
+        symbols = ['BTCUSDT', 'ETHUSDT']
+        for sizing in portfolio.Sizings:
+            whole = portfolio.backtest(self.store, symbols, '15m', 'avgcross', self.params, sizing=sizing, maxweight=0.8, fee=0.001, lookback=50)
+            # chunks of 100 candles read with 300 candles of warmup
+            chunked = portfolio.backtest(self.store, symbols, '15m', 'avgcross', self.params, sizing=sizing, maxweight=0.8, fee=0.001, lookback=50,
+                warmup=300, maxbytes=len(symbols) * 8 * 10 * 400)
+            self.assertTrue(np.allclose(chunked.equity.values, whole.equity.values, rtol=1e-12), sizing)
+            pd.testing.assert_frame_equal(chunked.symbols, whole.symbols)
+
+        # the volatilities of a chunk are read over more candles than the warmup
+        whole = portfolio.backtest(self.store, symbols, '15m', 'avgcross', self.params, sizing='inversevol', fee=0.001, lookback=400)
+        chunked = portfolio.backtest(self.store, symbols, '15m', 'avgcross', self.params, sizing='inversevol', fee=0.001, lookback=400,
+            warmup=300, maxbytes=len(symbols) * 8 * 10 * 400)
+        self.assertTrue(np.allclose(chunked.equity.values, whole.equity.values, rtol=1e-12))
+        pd.testing.assert_frame_equal(chunked.symbols, whole.symbols)
+
+        self.assertEqual(len(whole.equity), len(self.ohlc))
+        self.assertLess(whole.symbols.loc['ETHUSDT', 'exposure'], 90.0)
+        self.assertIn('Symbols', str(whole))
+
+    def test_weights(self):
+        signal = np.array([[1.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        self.assertTrue(np.array_equal(portfolio.weights(signal, None, 'equal'), signal / 3.0))
+        self.assertTrue(np.array_equal(portfolio.weights(signal, None, 'active', maxweight=0.8), [[0.5, 0.5, 0.0], [0.8, 0.0, 0.0], [0.0, 0.0, 0.0]]))
+
+        change = np.tile([[0.01, 0.02, 0.0]], (10, 1))
+        change[::2] *= -1.0
+        weight = portfolio.weights(np.ones((10, 3)), change, 'inversevol', lookback=4)
+        # the least volatile symbol gets the most capital, the flat one none
+        self.assertTrue(math.isclose(weight[-1, 0], 2.0 / 3.0) and math.isclose(weight[-1, 1], 1.0 / 3.0) and weight[-1, 2] == 0.0)
+        self.assertRaises(ValueError, portfolio.weights, signal, None, 'other')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+import replay
+from persistence import OrderWriter
+from api.binance import OrderSide, OrderType, OrderStatus
+
+def klines(count, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, count)))
+    open = np.r_[close[0], close[:-1]]
+    index = pd.date_range('2020-01-01', periods=count, freq='1min', name='time')
+    return pd.DataFrame({'open': open, 'high': np.maximum(open, close) * 1.001, 'low': np.minimum(open, close) * 0.999, 'close': close, 'volume': 1.0}, index=index)
+
+class TestReplay(unittest.TestCase):
+
+    def test_exchange(self):
+        exchange = replay.SimulatedBinance({'BTCUSDT': klines(10)}, fee=0.001)
+        exchange.cash['BTCUSDT'] = 150.0
+        exchange.cursors['BTCUSDT'] = 5
+
+        status, data = exchange.getklines('BTCUSDT', '1m', 3)
+        self.assertEqual(len(data), 3)
+        # the candle in progress is only known by its open
+        self.assertEqual(data[-1][1:5], [data[-1][1]] * 4)
+
+        status, order = exchange.order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 100.0)
+        self.assertEqual((status, order['status']), (200, OrderStatus.NEW.name))
+        # the pending order reserves the cash
+        status, data = exchange.order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1.0, 100.0)
+        self.assertEqual(status, 400)
+        status, data = exchange.order('BTCUSDT', OrderSide.SELL, OrderType.LIMIT, 1.0, 120.0)
+        self.assertEqual(status, 400)
+
+        self.assertEqual(exchange.match('BTCUSDT', 102.0, 100.5), [])
+        reports = exchange.match('BTCUSDT', 101.0, 99.0)
+        self.assertEqual(len(reports), 1)
+        self.assertEqual((reports[0]['i'], reports[0]['X'], reports[0]['z']), (order['orderId'], 'FILLED', '1.0'))
+        self.assertAlmostEqual(exchange.cash['BTCUSDT'], 150.0 - 100.0 - 0.1)
+        self.assertEqual(exchange.position['BTCUSDT'], 1.0)
+
+        status, order = exchange.order('BTCUSDT', OrderSide.SELL, OrderType.LIMIT, 1.0, 120.0)
+        self.assertEqual(exchange.cancelorder('BTCUSDT', order['orderId'])[0], 200)
+        self.assertEqual(exchange.cancelorder('BTCUSDT', order['orderId'])[0], 400)
+        self.assertEqual(exchange.match('BTCUSDT', 130.0, 110.0), [])
+
+    def test_memoryorders(self):
+        db = replay.MemoryDatabase()
+        for i, side in enumerate(['BUY', 'SELL', 'BUY']):
+            db.orders.insert_one({'orderId': i, 'symbol': 'BTCUSDT', 'side': side, 'transactTime': i})
+        db.orders.insert_one({'orderId': 9, 'symbol': 'ETHUSDT', 'side': 'SELL', 'transactTime': 9})
+
+        cursor = db.orders.find({'symbol': 'BTCUSDT'}).limit(1).sort('transactTime', -1)
+        self.assertEqual(cursor.count(), 1)
+        self.assertEqual(cursor.next()['orderId'], 2)
+
+        writer = OrderWriter(db.orders)
+        writer.upsert({'orderId': 1, 'symbol': 'BTCUSDT', 'status': 'FILLED'})
+        writer.upsert({'orderId': 5, 'symbol': 'BTCUSDT', 'side': 'BUY', 'transactTime': 5})
+        self.assertEqual(db.orders.find_one({'orderId': 1})['status'], 'FILLED')
+        self.assertEqual(db.orders.find_one({'orderId': 1})['side'], 'SELL')
+        self.assertEqual(db.orders.find_one({'symbol': 'BTCUSDT', 'orderId': 5})['side'], 'BUY')
+        self.assertEqual(db.orders.find_one({'symbol': 'ETHUSDT', 'orderId': 5}), None)
+        self.assertEqual(db.orders.find_one({'orderId': 6}), None)
+
+    def test_run(self):
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}, 'ETHUSDT': {'interval': '1m', 'quantity': 2}}}
+        data = {'BTCUSDT': klines(3000, 1), 'ETHUSDT': klines(2500, 2)}
+        engine = replay.Replay(config, data, fee=0.001)
+        results = engine.run()
+
+        for symbol in data:
+            result = results[symbol]
+            exchange = engine.exchange
+            self.assertEqual(len(result.equity), len(data[symbol]) - 500)
+            self.assertGreater(result.trades, 0)
+            self.assertAlmostEqual(result.equity.iloc[-1], exchange.cash[symbol] + exchange.position[symbol] * data[symbol]['close'].iloc[-1])
+            self.assertAlmostEqual(result.netret, result.equity.iloc[-1] / result.capital - 1.0)
+            # every fill went through Book, which recorded it
+            filled = [o for o in engine.router.tickers[symbol].book.db.orders.documents.values() if o['symbol'] == symbol and o['status'] == 'FILLED']
+            self.assertEqual(len(filled), result.trades)
+            self.assertTrue(result.equity.min() > 0)
+            # the capital covers the fees and the changes of the quantity
+            self.assertEqual(result.rejects, 0)
+
+        # the same klines replayed without fees end with a better return
+        free = replay.Replay(config, data, fee=0.0).run()
+        self.assertEqual(free['BTCUSDT'].fees, 0.0)
+        self.assertGreater(free['BTCUSDT'].netret, results['BTCUSDT'].netret)
+
+    def test_warmup(self):
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}}}
+        self.assertRaises(ValueError, replay.Replay, config, {'BTCUSDT': klines(400)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+import pandas as pd
+from mongomock import MongoClient
+
+import indicators
+import live
+import resample
+from api.messages import Kline
+
+class TestResample(unittest.TestCase):
+    """Tests higher interval candles built from the 15m klines."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+
+    def millis(self, text):
+        return int(pd.Timestamp(text).value // 10 ** 6)
+
+    def test_opentime(self):
+        time = self.millis('2020-01-08 05:47:00')
+        self.assertEqual(resample.opentime(time, '4h'), self.millis('2020-01-08 04:00:00'))
+        self.assertEqual(resample.opentime(time, '1d'), self.millis('2020-01-08'))
+        # weeks start on Monday, months on their first day
+        self.assertEqual(resample.opentime(time, '1w'), self.millis('2020-01-06'))
+        self.assertEqual(resample.opentime(time, '1M'), self.millis('2020-01-01'))
+        self.assertEqual(resample.closetime(self.millis('2020-02-01'), '1M'), self.millis('2020-03-01'))
+        self.assertRaises(ValueError, resample.checkintervals, '1h', '15m')
+        self.assertRaises(ValueError, resample.checkintervals, '3d', '1w')
+        resample.checkintervals('1h', '1M')
+
+    def test_resample(self):
+        aggregations = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        for interval, rule in [('1h', '1H'), ('4h', '4H'), ('1d', '1D')]:
+            expected = self.ohlc.resample(rule, label='left', closed='left').agg(aggregations).dropna()
+            bars = resample.resample(self.ohlc, interval)
+            pd.testing.assert_frame_equal(bars, expected, check_freq=False)
+
+        # higher candles are only read once closed
+        bars = resample.resample(self.ohlc, '4h')
+        aligned = resample.align(bars, self.ohlc.index, '4h')
+        self.assertTrue(aligned.loc[:'2020-01-08 03:45:00'].isna().all().all())
+        self.assertEqual(aligned.loc['2020-01-08 04:00:00', 'close'], bars.loc['2020-01-08 00:00:00', 'close'])
+        self.assertEqual(aligned.loc['2020-01-08 07:45:00', 'close'], bars.loc['2020-01-08 00:00:00', 'close'])
+
+        cache = indicators.IndicatorCache()
+        self.assertIs(cache.get(resample.Resampled, self.ohlc, '4h'), cache.get(resample.Resampled, self.ohlc, '4h'))
+        self.assertEqual(cache.hits, 1)
+
+    def test_resampler(self):
+        resampler = resample.Resampler('15m', ['1h', '4h'])
+        times = self.ohlc.index.values.astype('datetime64[ms]').astype(np.int64)
+        closed = []
+        for time, (open, high, low, close, volume) in zip(times, self.ohlc.values):
+            # each candle is first received in progress, then revised
+            closed.extend(resampler.update(int(time), open, open, open, open, 0.0))
+            closed.extend(resampler.update(int(time), open, high, low, close, volume))
+
+        for interval in ['1h', '4h']:
+            pd.testing.assert_frame_equal(resampler.dataframe(interval), resample.resample(self.ohlc, interval).iloc[-500:])
+        self.assertEqual(closed.count('4h'), len(resample.resample(self.ohlc, '4h')) - 1)
+
+        # seeded closed candles are kept, the candle in progress is built from the base candles
+        seeded = resample.Resampler('15m', ['4h'])
+        bars = resample.resample(self.ohlc, '4h')
+        seeded.seed('4h', bars.iloc[:-1])
+        seeded.extend(self.ohlc.iloc[-40:])
+        pd.testing.assert_frame_equal(seeded.dataframe('4h'), bars)
+
+    def test_ticker(self):
+        klines = {}
+        for interval in ['15m', '1h']:
+            bars = self.ohlc if interval == '15m' else resample.resample(self.ohlc.iloc[:-20], interval)
+            times = bars.index.values.astype('datetime64[ms]').astype(np.int64)
+            klines[interval] = [[int(t)] + list(v) + [0] * 6 for t, v in zip(times, bars.values)]
+        api = MagicMock()
+        api.getklines.side_effect = lambda symbol, interval, limit: (200, (klines[interval] if interval == '1h' else klines[interval][:-20])[-limit:])
+
+        ticker = live.LiveTicker(api, MongoClient().binance, 'BTCUSDT', '15m', 1, timeframes=['1h'])
+        for t, open, high, low, close, volume, *rest in klines['15m'][-20:]:
+            ticker.update_price(Kline('BTCUSDT', t, open, high, low, close, volume))
+        pd.testing.assert_frame_equal(ticker.resampler.dataframe('1h'), resample.resample(self.ohlc, '1h').iloc[-500:])
+
+    def test_seedinprogress(self):
+        # two days and 900 minutes of 1m klines, the exchange only gives the last 500 of them
+        rng = np.random.default_rng(1)
+        index = pd.date_range('2020-01-06', periods=2 * 1440 + 900, freq='1min')
+        close = 500.0 + np.cumsum(rng.normal(0.0, 1.0, len(index)))
+        minutes = pd.DataFrame({'open': close - 0.5, 'high': close + 1.0, 'low': close - 1.0, 'close': close, 'volume': 1.0}, index=index)
+        klines = {}
+        for interval in ['1m', '1d']:
+            bars = minutes.iloc[:-10] if interval == '1m' else resample.resample(minutes.iloc[:-10], interval)
+            times = bars.index.values.astype('datetime64[ms]').astype(np.int64)
+            klines[interval] = [[int(t)] + list(v) + [0] * 6 for t, v in zip(times, bars.values)]
+        api = MagicMock()
+        api.getklines.side_effect = lambda symbol, interval, limit: (200, klines[interval][-limit:])
+
+        # the candle in progress of the day holds the minutes older than the base history
+        ticker = live.LiveTicker(api, MongoClient().binance, 'BTCUSDT', '1m', 1, timeframes=['1d'])
+        times = index.values.astype('datetime64[ms]').astype(np.int64)
+        for t, (open, high, low, close, volume) in zip(times[-10:], minutes.values[-10:]):
+            ticker.update_price(Kline('BTCUSDT', int(t), open, high, low, close, volume))
+        pd.testing.assert_frame_equal(ticker.resampler.dataframe('1d'), resample.resample(minutes, '1d'))
+        self.assertEqual(ticker.resampler.dataframe('1d')['volume'].iloc[-1], 900.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import asyncio
+import json
+import os
+import signal
+import time
+
+import replay
+import shards
+from api.binance import Binance
+from api.latency import telemetry
+from localexchange import LocalExchange, synthetic, klinemessage
+
+class TestShards(unittest.TestCase):
+
+    def test_partition(self):
+        pairs = {'PAIR{:04d}USDT'.format(i): {'interval': '1m', 'quantity': 1} for i in range(200)}
+        parts = shards.partition(pairs, 4)
+        self.assertEqual(sum(len(part) for part in parts), 200)
+        self.assertEqual(set().union(*parts), set(pairs))
+        for part in parts:
+            self.assertGreater(len(part), 30)
+            for symbol in part:
+                self.assertEqual(parts[shards.shardof(symbol.lower(), 4)], part)
+
+    def test_routingsymbol(self):
+        kline = json.dumps({'stream': 'btcusdt@kline_1m', 'data': {'e': 'kline', 's': 'BTCUSDT'}})
+        report = json.dumps({'stream': 'key', 'data': {'e': 'executionReport', 's': 'ETHUSDT'}})
+        account = json.dumps({'stream': 'key', 'data': {'e': 'outboundAccountPosition'}})
+        self.assertEqual(shards.routingsymbol(kline, 'key'), 'BTCUSDT')
+        self.assertEqual(shards.routingsymbol(report, 'key'), 'ETHUSDT')
+        self.assertEqual(shards.routingsymbol(account, 'key'), None)
+        self.assertEqual(shards.routingsymbol('{}', 'key'), None)
+        # binance sends compact messages
+        self.assertEqual(shards.routingsymbol(json.dumps(json.loads(kline), separators=(',', ':')), 'key'), 'BTCUSDT')
+
+    def test_sharded(self):
+        klines = synthetic(6, 800)
+        exchange = LocalExchange(klines, '1m')
+        exchange.background()
+        config = exchange.config({symbol: {'interval': '1m', 'quantity': 1} for symbol in klines})
+        api = Binance(config, test=False)
+        try:
+            status, data = api.createlistenkey()
+            router = shards.ShardedRouter(config, api, data['listenKey'], 2, database=replay.MemoryDatabase)
+
+            async def ingest():
+                task = asyncio.ensure_future(router.ws())
+                # the last messages may still be on their way when the exchange is finished
+                while not (exchange.finished.is_set() and sum(router.sent) == exchange.messages) and not task.done():
+                    await asyncio.sleep(0.05)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+            asyncio.run(ingest())
+            # once the shards processed every message sent to them, the telemetry shows them settled
+            self.assertTrue(self.settle(router))
+            for shard in telemetry.snapshot()['shards']:
+                self.assertEqual((shard['processed'], shard['backlog'], shard['dropped'], shard['alive']), (shard['sent'], 0, 0, True))
+            router.close()
+        finally:
+            api.close()
+            exchange.shutdown()
+
+        # every message reached the shard of its symbol before it stopped
+        stats = router.shardstats()
+        self.assertEqual(sum(shard['pairs'] for shard in stats), 6)
+        self.assertEqual(sum(shard['sent'] for shard in stats), exchange.messages)
+        for shard in stats:
+            self.assertEqual(shard['backlog'], 0)
+            self.assertFalse(shard['alive'])
+        # the shards traded, and were sent the reports of their orders
+        self.assertGreater(exchange.orders, 0)
+        self.assertEqual(exchange.latency.count, exchange.orders)
+        self.assertNotIn('shards', telemetry.snapshot())
+
+    def settle(self, router, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while any(shard['backlog'] > 0 for shard in router.shardstats()):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_slowshard(self):
+        klines = synthetic(10, 700)
+        exchange = LocalExchange(klines, '1m')
+        exchange.background()
+        config = exchange.config({symbol: {'interval': '1m', 'quantity': 1} for symbol in klines})
+        api = Binance(config, test=False)
+        telemetry.reset()
+        router, stopped = None, False
+        try:
+            status, data = api.createlistenkey()
+            router = shards.ShardedRouter(config, api, data['listenKey'], 2, database=replay.MemoryDatabase, logconfig={'level': 'CRITICAL'}, buffer=50)
+            symbols = [next(iter(pairs)) for pairs in router.pairs]
+            # klines older than the history, which the tickers ignore
+            messages = [json.dumps({'stream': '{}@kline_1m'.format(symbol.lower()), 'data': klinemessage(symbol, '1m', 0, 60000, 1.0, 1.0, 1.0, 1.0, 1.0, True)})
+                for symbol in symbols]
+
+            # a stopped shard does not block the routing, nor the other shard
+            os.kill(router.processes[0].pid, signal.SIGSTOP)
+            stopped = True
+            start = time.monotonic()
+            for i in range(2000):
+                router.route(messages[0])
+            router.route(messages[1])
+            self.assertLess(time.monotonic() - start, 5.0)
+            self.assertGreater(router.dropped[0], 0)
+            self.assertIsNotNone(router.overflowed[0])
+            deadline = time.monotonic() + 30.0
+            while router.processed[1] < router.sent[1] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(router.processed[1], router.sent[1])
+
+            # once it caught up, the shard is sent a backfill with the next message
+            os.kill(router.processes[0].pid, signal.SIGCONT)
+            stopped = False
+            while router.queues[0].qsize() > 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            sent = router.sent[0]
+            router.route(messages[0])
+            self.assertEqual((router.sent[0], router.overflowed[0]), (sent + 2, None))
+            self.assertTrue(self.settle(router))
+            self.assertEqual(telemetry.counters[None]['dropped'], router.dropped[0])
+
+            # a dead shard stops the router instead of the websocket reconnecting for ever
+            router.processes[1].kill()
+            router.processes[1].join()
+            router.route(messages[1])
+            asyncio.run(router.watch(0.01))
+            self.assertTrue(router.stopping)
+            self.assertEqual(telemetry.counters[None]['shardfailures'], 1)
+            self.assertFalse(router.shardstats()[1]['alive'])
+        finally:
+            if router != None:
+                if stopped:
+                    os.kill(router.processes[0].pid, signal.SIGCONT)
+                router.close(5.0)
+            api.close()
+            exchange.shutdown()
+            telemetry.reset()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+import shutil
+import os
+import pandas as pd
+import numpy as np
+
+from store import KlineStore, tomillis
+
+class TestStore(unittest.TestCase):
+    """Tests the columnar kline store."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+        self.root = tempfile.mkdtemp()
+        self.store = KlineStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_write_and_read(self):
+        self.store.write('BTCUSDT', '15m', self.ohlc)
+
+        self.assertEqual(self.store.months('BTCUSDT', '15m'), ['2020-01'])
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'BTCUSDT', '15m', '2020-01.npy')))
+
+        df = self.store.read('BTCUSDT', '15m')
+        pd.testing.assert_frame_equal(df, self.ohlc, check_freq=False)
+
+        # prices are memory-mapped and not copied
+        self.assertFalse(df['close'].to_numpy().flags.writeable)
+
+    def test_range(self):
+        self.store.write('BTCUSDT', '15m', self.ohlc)
+
+        df = self.store.read('BTCUSDT', '15m', '2020-01-10 00:00:00', '2020-01-10 23:45:00')
+        pd.testing.assert_frame_equal(df, self.ohlc.loc['2020-01-10'], check_freq=False)
+
+        times = self.store.times('BTCUSDT', '15m', start=tomillis('2020-01-18 11:00:00'))
+        self.assertEqual(list(times), [tomillis('2020-01-18 11:00:00'), tomillis('2020-01-18 11:15:00')])
+
+        self.assertEqual(len(self.store.read('ETHUSDT', '15m')), 0)
+
+    def test_merge(self):
+        self.store.write('BTCUSDT', '15m', self.ohlc.iloc[500:])
+        updated = self.ohlc.iloc[:600].copy()
+        updated.loc[updated.index[-1], 'close'] = 42.0
+        self.store.write('BTCUSDT', '15m', updated)
+
+        df = self.store.read('BTCUSDT', '15m')
+        self.assertEqual(len(df), len(self.ohlc))
+        self.assertTrue(df.index.is_monotonic_increasing)
+        # newest values replace stored ones
+        self.assertEqual(df['close'].iloc[599], 42.0)
+        self.assertEqual(df['close'].iloc[600], self.ohlc['close'].iloc[600])
+
+    def test_partitions(self):
+        index = pd.date_range('2020-01-31 23:00:00', periods=4, freq='30min', name='time')
+        df = pd.DataFrame(np.arange(20, dtype=float).reshape(4, 5), index=index, columns=['open', 'high', 'low', 'close', 'volume'])
+        self.store.write('btcusdt', '30m', df)
+
+        self.assertEqual(self.store.months('BTCUSDT', '30m'), ['2020-01', '2020-02'])
+        pd.testing.assert_frame_equal(self.store.read('BTCUSDT', '30m'), df, check_freq=False)
+        pd.testing.assert_frame_equal(self.store.read('BTCUSDT', '30m', start='2020-02-01'), df.iloc[2:], check_freq=False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,9 +21,9 @@ class TestStrategies(unittest.TestCase):
         self.assertEqual(result.start, datetime(2020, 1, 8, 1, 30, 0))
         self.assertEqual(result.end, datetime(2020, 1, 18, 11, 15, 0))
         self.assertEqual(result.trades, 1)
-        self.assertTrue(math.isclose(result.netret, 6.14, rel_tol=1e-02))
-        self.assertTrue(math.isclose(result.sharpe, 0.0191, rel_tol=1e-03))
-        self.assertTrue(math.isclose(result.maxdrawdown, -8.74, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.netret, 5.79, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.sharpe, 3.575, rel_tol=1e-03))
+        self.assertTrue(math.isclose(result.maxdrawdown, -8.48, rel_tol=1e-02))
         self.assertEqual(result.maxdrawdownduration, 527)
 
     def test_avg_cross(self):
@@ -36,10 +36,10 @@ class TestStrategies(unittest.TestCase):
         self.assertEqual(result.start, datetime(2020, 1, 8, 1, 30, 0))
         self.assertEqual(result.end, datetime(2020, 1, 18, 11, 15, 0))
         self.assertEqual(result.trades, 27)
-        self.assertTrue(math.isclose(result.netret, 9.8, rel_tol=1e-02))
-        self.assertTrue(math.isclose(result.sharpe, 0.0533, rel_tol=1e-03))
-        self.assertTrue(math.isclose(result.maxdrawdown, -3.94, rel_tol=1e-02))
-        self.assertEqual(result.maxdrawdownduration, 207)
+        self.assertTrue(math.isclose(result.netret, 0.998, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.sharpe, 0.9831, rel_tol=1e-03))
+        self.assertTrue(math.isclose(result.maxdrawdown, -5.89, rel_tol=1e-02))
+        self.assertEqual(result.maxdrawdownduration, 578)
         
 
     def test_RSI(self):
@@ -51,10 +51,10 @@ class TestStrategies(unittest.TestCase):
         self.assertEqual(result.start, datetime(2020, 1, 8, 1, 30, 0))
         self.assertEqual(result.end, datetime(2020, 1, 18, 11, 15, 0))
         self.assertEqual(result.trades, 11)
-        self.assertTrue(math.isclose(result.netret, 12.81, rel_tol=1e-02))
-        self.assertTrue(math.isclose(result.sharpe, 0.1164, rel_tol=1e-03))
-        self.assertTrue(math.isclose(result.maxdrawdown, -4.0, rel_tol=1e-02))
-        self.assertEqual(result.maxdrawdownduration, 174)
+        self.assertTrue(math.isclose(result.netret, 5.736, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.sharpe, 6.272, rel_tol=1e-03))
+        self.assertTrue(math.isclose(result.maxdrawdown, -3.94, rel_tol=1e-02))
+        self.assertEqual(result.maxdrawdownduration, 214)
 
     def test_MACD(self):
         macd = indicators.MACD(self.ohlc.close, 12, 26, 9)
@@ -65,10 +65,10 @@ class TestStrategies(unittest.TestCase):
         self.assertEqual(result.start, datetime(2020, 1, 8, 1, 30, 0))
         self.assertEqual(result.end, datetime(2020, 1, 18, 11, 15, 0))
         self.assertEqual(result.trades, 41)
-        self.assertTrue(math.isclose(result.netret, 22.39, rel_tol=1e-02))
-        self.assertTrue(math.isclose(result.sharpe, 0.1409, rel_tol=1e-03))
-        self.assertTrue(math.isclose(result.maxdrawdown, -2.97, rel_tol=1e-02))
-        self.assertEqual(result.maxdrawdownduration, 156)
+        self.assertTrue(math.isclose(result.netret, -4.178, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.sharpe, -3.258, rel_tol=1e-03))
+        self.assertTrue(math.isclose(result.maxdrawdown, -9.376, rel_tol=1e-02))
+        self.assertEqual(result.maxdrawdownduration, 980)
 
     def test_RSI_MACD(self):
         rsi = indicators.RSI(self.ohlc.close, period=9)
@@ -80,10 +80,46 @@ class TestStrategies(unittest.TestCase):
         self.assertEqual(result.start, datetime(2020, 1, 8, 1, 30, 0))
         self.assertEqual(result.end, datetime(2020, 1, 18, 11, 15, 0))
         self.assertEqual(result.trades, 41)
-        self.assertTrue(math.isclose(result.netret, 26.06, rel_tol=1e-02))
-        self.assertTrue(math.isclose(result.sharpe, 0.1297, rel_tol=1e-03))
-        self.assertTrue(math.isclose(result.maxdrawdown, -2.85, rel_tol=1e-02))
-        self.assertEqual(result.maxdrawdownduration, 82)
+        self.assertTrue(math.isclose(result.netret, -1.118, rel_tol=1e-02))
+        self.assertTrue(math.isclose(result.sharpe, -0.5842, rel_tol=1e-03))
+        self.assertTrue(math.isclose(result.maxdrawdown, -7.277, rel_tol=1e-02))
+        self.assertEqual(result.maxdrawdownduration, 951)
+
+    def test_RSI_signals(self):
+        expected = pd.read_csv('tests/data/BTCUSDT_15m_signals_RSI9.csv', index_col='time', parse_dates=True, float_precision='round_trip')
+        rsi = indicators.RSI(self.ohlc.close, period=9)
+        strategy = strategies.RSIStrategy(self.ohlc, rsi)
+        pd.testing.assert_frame_equal(strategy.signals, expected, check_freq=False)
+
+    def test_RSI_MACD_signals(self):
+        expected = pd.read_csv('tests/data/BTCUSDT_15m_signals_RSI9_MACD_12_26_9.csv', index_col='time', parse_dates=True, float_precision='round_trip')
+        rsi = indicators.RSI(self.ohlc.close, period=9)
+        macd = indicators.MACD(self.ohlc.close, 12, 26, 9)
+        strategy = strategies.RSIMACDStrategy(self.ohlc, rsi, macd)
+        pd.testing.assert_frame_equal(strategy.signals, expected, check_freq=False)
+
+    def test_DBB_signals(self):
+        expected = pd.read_csv('tests/data/BTCUSDT_15m_signals_DBB20.csv', index_col='time', parse_dates=True, float_precision='round_trip')
+        bb1 = indicators.BollingerBands(self.ohlc.close, 20, 1)
+        bb2 = indicators.BollingerBands(self.ohlc.close, 20, 2)
+        strategy = strategies.DBBStrategy(self.ohlc.close, bb1, bb2)
+        pd.testing.assert_frame_equal(strategy.signals, expected, check_freq=False)
+
+    def test_streaming_DBB(self):
+        bb1 = indicators.BollingerBands(self.ohlc.close, 20, 1)
+        bb2 = indicators.BollingerBands(self.ohlc.close, 20, 2)
+        strategy = strategies.DBBStrategy(self.ohlc.close, bb1, bb2)
+
+        stream1 = indicators.StreamingBollingerBands(20, 1)
+        stream2 = indicators.StreamingBollingerBands(20, 2)
+        streaming = strategies.StreamingDBBStrategy()
+        signals = []
+        for price in self.ohlc.close:
+            stream1.update(price)
+            stream2.update(price)
+            signals.append(streaming.update(price, stream1, stream2))
+
+        self.assertTrue(np.array_equal(strategy.signals['signal'].values, signals))
 
 if __name__ == '__main__':
     unittest.main()
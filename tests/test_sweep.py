@@ -0,0 +1,50 @@
+import unittest
+import math
+import pandas as pd
+import numpy as np
+
+import sweep
+
+class TestSweep(unittest.TestCase):
+    """Tests parameter sweeps."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+
+    def test_parsegrid(self):
+        grid = sweep.parsegrid(['fast=5:9:2', 'slow=21,26', 'std=1:2:0.5'])
+        self.assertEqual(grid['fast'], [5, 7, 9])
+        self.assertEqual(grid['slow'], [21, 26])
+        self.assertEqual(grid['std'], [1.0, 1.5, 2.0])
+        self.assertRaises(ValueError, sweep.parsegrid, ['fast'])
+        self.assertRaises(ValueError, sweep.parsegrid, ['fast=1:5:0'])
+
+    def test_combinations(self):
+        params = sweep.combinations('avgcross', {'fast': [5, 10, 20], 'slow': [10, 20]})
+        # fast average must be faster than the slow one
+        self.assertEqual(params, [{'fast': 5, 'slow': 10}, {'fast': 5, 'slow': 20}, {'fast': 10, 'slow': 20}])
+        self.assertRaises(ValueError, sweep.combinations, 'avgcross', {'fast': [5]})
+
+    def test_shared_ohlc(self):
+        with sweep.SharedOHLC(self.ohlc) as shared:
+            segments, df = sweep.SharedOHLC.attach(shared.spec)
+            pd.testing.assert_frame_equal(df, self.ohlc, check_freq=False)
+            del df
+
+    def test_sweep(self):
+        grid = {'fast': [5, 9], 'slow': [21, 26]}
+        sequential = sweep.sweep(self.ohlc, 'avgcross', grid, workers=1)
+        parallel = sweep.sweep(self.ohlc, 'avgcross', grid, workers=2)
+
+        self.assertEqual(len(parallel), 4)
+        for (params1, result1), (params2, result2) in zip(sequential, parallel):
+            self.assertEqual(params1, params2)
+            self.assertEqual(result1.trades, result2.trades)
+            self.assertTrue(math.isclose(result1.netret, result2.netret))
+
+        table = sweep.rank(parallel, 'netret')
+        self.assertEqual(list(table.columns[:2]), ['fast', 'slow'])
+        self.assertTrue(table['netret'].is_monotonic_decreasing)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import json
+import urllib.request
+
+import replay
+from api.latency import Telemetry, telemetry
+from tests.test_replay import klines
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_record(self):
+        metrics = Telemetry()
+        metrics.record('decode', 0.00003)
+        metrics.record('act', 0.004, 'BTCUSDT')
+        metrics.record('act', 0.2, 'ETHUSDT')
+        metrics.count('orders', 'BTCUSDT')
+        metrics.count('orders', 'ETHUSDT', 2)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'orders': 3})
+        self.assertEqual(snapshot['latencies']['act']['count'], 2)
+        # stages lasting a few microseconds have their own buckets
+        self.assertEqual(snapshot['latencies']['decode']['p50'], 0.05)
+        self.assertEqual(snapshot['symbols']['BTCUSDT']['latencies']['act']['p99'], 5)
+        self.assertEqual(snapshot['symbols']['ETHUSDT']['counters'], {'orders': 2})
+        self.assertNotIn('decode', snapshot['symbols']['BTCUSDT']['latencies'])
+        json.dumps(snapshot)
+
+    def test_serve(self):
+        metrics = Telemetry()
+        metrics.count('messages')
+        server = metrics.serve(0)
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(json.loads(response.read())['counters'], {'messages': 1})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_replay(self):
+        telemetry.reset()
+        config = {'pairs': {'BTCUSDT': {'interval': '1m', 'quantity': 1}}}
+        data = {'BTCUSDT': klines(1500)}
+        engine = replay.Replay(config, data, fee=0.001)
+        result = engine.run()['BTCUSDT']
+
+        snapshot = telemetry.snapshot()
+        symbol = snapshot['symbols']['BTCUSDT']
+        self.assertEqual(symbol['counters']['candles'], 1000)
+        self.assertEqual(symbol['counters']['reports'], result.trades)
+        self.assertEqual(symbol['counters'].get('rejects', 0), result.rejects)
+        self.assertEqual(snapshot['latencies']['route']['count'], snapshot['counters']['messages'])
+        for stage in ('update_price', 'indicators', 'strategy', 'act', 'ticktoorder'):
+            self.assertGreater(symbol['latencies'][stage]['count'], 0)
+        # every order is sent for a signal, whose latency is measured
+        self.assertGreater(symbol['counters']['orders'], 0)
+        self.assertGreaterEqual(symbol['latencies']['ticktoorder']['count'], symbol['counters']['orders'])
+        telemetry.reset()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import math
+import numpy as np
+import pandas as pd
+
+import batch
+import metrics
+import sweep
+import walkforward
+
+class TestWalkForward(unittest.TestCase):
+    """Tests the walk-forward optimization on the 15m klines."""
+
+    def setUp(self):
+        self.ohlc = pd.read_csv('tests/data/BTCUSDT_15m.csv', index_col='time', parse_dates=True)
+        self.grid = {'fast': [5, 9, 12], 'slow': [21, 26, 50]}
+
+    def test_windows(self):
+        self.assertEqual(walkforward.windows(10, 4, 2), [(0, 4, 4, 6), (2, 6, 6, 8), (4, 8, 8, 10)])
+        self.assertEqual(walkforward.windows(10, 4, 2, step=3, anchored=True), [(0, 4, 4, 6), (0, 7, 7, 9)])
+        self.assertEqual(walkforward.windows(5, 4, 2), [])
+        self.assertRaises(ValueError, walkforward.windows, 10, 4, 0)
+        self.assertEqual(walkforward.best([1.0, np.nan, 3.0, 2.0], 'sharpe'), 2)
+        self.assertEqual(walkforward.best([5, 2, 7], 'maxdrawdownduration'), 1)
+
+    def test_walkforward(self):
+        train, test = 300, 100
+        result = walkforward.walkforward(self.ohlc, 'avgcross', self.grid, train, test, fee=0.001, workers=1)
+        spans = walkforward.windows(len(self.ohlc), train, test)
+        self.assertEqual(len(result.windows), len(spans))
+        self.assertEqual(len(result.equity), len(spans) * test)
+        self.assertEqual(result.equity.index[0], self.ohlc.index[train])
+
+        # the parameters chosen are the best of their training period
+        params = sweep.combinations('avgcross', self.grid)
+        signals = batch.signals(self.ohlc.close, 'avgcross', params)
+        periods = metrics.periodsperyear('15m')
+        close = self.ohlc.close.values
+        for (trainstart, trainend, teststart, testend), row in zip(spans, result.windows.itertuples()):
+            sharpes = metrics.compute(close[trainstart:trainend], signals[:, trainstart:trainend], 0.001, periods)['sharpe']
+            self.assertTrue(math.isclose(row.train, np.nanmax(sharpes)))
+            chosen = params.index({'fast': row.fast, 'slow': row.slow})
+            self.assertTrue(math.isclose(row.test, metrics.compute(close[teststart:testend], signals[chosen, teststart:testend], 0.001, periods)['sharpe']))
+
+        # the equity curve compounds the stitched test periods
+        self.assertTrue(math.isclose(result.equity.iloc[-1] / 100.0 - 1.0, result.result.netret / 100.0))
+
+        # overlapping test periods stop where the next one starts, gaps between them are rejected
+        overlapping = walkforward.walkforward(self.ohlc, 'avgcross', self.grid, train, test, step=60, fee=0.001, workers=1)
+        spans = walkforward.windows(len(self.ohlc), train, test, step=60)
+        self.assertEqual(len(overlapping.equity), spans[-1][3] - spans[0][2])
+        ends = [span[2] for span in spans[1:]] + [spans[-1][3]]
+        for (trainstart, trainend, teststart, testend), end, row in zip(spans, ends, overlapping.windows.itertuples()):
+            chosen = params.index({'fast': row.fast, 'slow': row.slow})
+            self.assertEqual(row.testend, self.ohlc.index[end - 1])
+            self.assertTrue(math.isclose(row.test, metrics.compute(close[teststart:end], signals[chosen, teststart:end], 0.001, periods)['sharpe']))
+        self.assertRaises(ValueError, walkforward.walkforward, self.ohlc, 'avgcross', self.grid, train, test, step=150, workers=1)
+
+        # windows run in parallel give the same result
+        parallel = walkforward.walkforward(self.ohlc, 'avgcross', self.grid, train, test, fee=0.001, workers=2)
+        pd.testing.assert_frame_equal(parallel.windows, result.windows)
+        pd.testing.assert_series_equal(parallel.equity, result.equity)
+
+        self.assertEqual(list(result.stability.index), ['fast', 'slow'])
+        fast = result.stability.loc['fast']
+        self.assertEqual(fast['distinct'], result.windows['fast'].nunique())
+        self.assertEqual(fast['changes'], (result.windows['fast'].diff().fillna(0) != 0).sum())
+        self.assertIn('Parameter stability', str(result))
+
+if __name__ == '__main__':
+    unittest.main()
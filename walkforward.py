@@ -0,0 +1,186 @@
+"""Walk-forward optimization of the parameters of a strategy.
+
+The klines are split in consecutive windows, each made of a training period
+followed by a test period. The parameters of the strategy are optimized on
+each training period, and used on the following test period, so that the
+test periods, stitched together, give an out-of-sample equity curve.
+
+The signals of every parameter set are computed once over the whole klines,
+see batch, and shared with the worker processes, which only slice them for
+their windows. As the indicators only depend on the past, this gives the
+same signals as computing them again for each window, after their warmup.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import batch
+import metrics
+import store
+import strategies
+import sweep
+
+def windows(length, train, test, step=None, anchored=False):
+    """Lists the (trainstart, trainend, teststart, testend) positions of the windows of klines of a given length.
+
+    The test periods follow each other every step candles, test by default.
+    Anchored windows all train from the first candle.
+    """
+    step = step if step != None else test
+    if train <= 1 or test <= 0 or step <= 0:
+        raise ValueError("Invalid windows, train {} test {} step {}".format(train, test, step))
+    result = []
+    start = 0
+    while start + train + test <= length:
+        result.append((0 if anchored else start, start + train, start + train, start + train + test))
+        start += step
+    return result
+
+def best(values, metric):
+    """Returns the row of the best value of a metric, NaN being the worst."""
+    values = np.asarray(values, dtype=np.float64)
+    # les durées de drawdown sont meilleures lorsqu'elles sont courtes
+    scores = -values if metric == 'maxdrawdownduration' else values
+    return int(np.argmax(np.where(np.isnan(scores), -np.inf, scores)))
+
+# tableaux attachés par chaque processus du pool
+_segments = []
+_close = None
+_signals = None
+
+def attach(closespec, signalspec):
+    global _close, _signals
+    closeshm, _close = sweep.SharedArray.attach(closespec)
+    signalshm, _signals = sweep.SharedArray.attach(signalspec)
+    _segments.extend([closeshm, signalshm])
+
+def optimize(window, metric, fee, periods, close=None, signals=None):
+    """Returns the best row of a training window and its value of the metric."""
+    close = close if close is not None else _close
+    signals = signals if signals is not None else _signals
+    trainstart, trainend, teststart, testend = window
+    values = batch.evaluate(close[trainstart:trainend], signals[:, trainstart:trainend], fee, periods)[metric]
+    row = best(values, metric)
+    return row, float(values[row])
+
+class WalkForwardResult():
+    """Out-of-sample results of a walk-forward optimization.
+
+    windows has a row per window with its bounds, the parameters chosen,
+    and the metric on its training and test periods. equity is the
+    out-of-sample equity curve starting at 100, result the metrics of the
+    stitched test periods, and stability has a row per parameter.
+    """
+
+    def __init__(self, windows: pd.DataFrame, equity: pd.Series, result: strategies.BacktestResult, stability: pd.DataFrame):
+        self.windows = windows
+        self.equity = equity
+        self.result = result
+        self.stability = stability
+
+    def __str__(self):
+        return 'Windows :\n{}\n\nOut of sample :\n{}\n\nParameter stability :\n{}'.format(self.windows.to_string(), self.result, self.stability.to_string())
+
+def stability(chosen: pd.DataFrame):
+    """Describes how the parameters chosen for consecutive windows vary."""
+    rows = []
+    for name in chosen.columns:
+        values = chosen[name]
+        counts = values.value_counts()
+        rows.append({'parameter': name, 'mean': values.mean(), 'std': values.std(ddof=0), 'min': values.min(), 'max': values.max(),
+            'distinct': len(counts), 'mode': counts.index[0], 'modeshare': counts.iloc[0] / len(values),
+            'changes': int((values.values[1:] != values.values[:-1]).sum())})
+    return pd.DataFrame(rows).set_index('parameter')
+
+def walkforward(ohlc: pd.DataFrame, strategy: str, grid: dict, train: int, test: int, step: int = None, anchored: bool = False,
+        metric: str = 'sharpe', fee: float = 0.0, workers: int = None, interval=None):
+    """Optimizes the parameters of a strategy on rolling windows of train candles and tests them on the test candles after each.
+
+    The windows are optimized in parallel over workers processes, defaults
+    to the number of CPUs. interval scales the annualized metrics, it is
+    inferred from the index when None.
+
+    The test periods are stitched into the out-of-sample curve. When step
+    is shorter than test, a test period stops where the next one starts and
+    its test value is measured on the candles stitched. A step longer than
+    test would leave gaps in the curve and is rejected.
+    """
+    if metric not in metrics.Names:
+        raise ValueError("Unknown metric {}".format(metric))
+    if step != None and step > test:
+        raise ValueError("Test periods of {} candles every {} candles leave gaps between them".format(test, step))
+    params = sweep.combinations(strategy, grid)
+    if len(params) == 0:
+        raise ValueError("No valid combination of {} in the grid".format(strategy))
+    close = ohlc['close']
+    values = close.to_numpy(dtype=np.float64)
+    spans = windows(len(values), train, test, step, anchored)
+    if len(spans) == 0:
+        raise ValueError("{} klines are not enough for a window of {} + {}".format(len(values), train, test))
+    periods = metrics.periodsperyear(interval if interval != None else metrics.inferinterval(close.index))
+    workers = workers if workers != None else os.cpu_count()
+
+    # les indicateurs sont calculés une fois sur toutes les klines, les fenêtres n'en lisent que des tranches
+    signals = batch.signals(close, strategy, params).astype(np.int8)
+
+    if workers <= 1 or len(spans) <= 1:
+        optimized = [optimize(span, metric, fee, periods, values, signals) for span in spans]
+    else:
+        with sweep.SharedArray(values) as sharedclose, sweep.SharedArray(signals) as sharedsignals:
+            with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(sharedclose.spec, sharedsignals.spec)) as executor:
+                optimized = list(executor.map(optimize, spans, [metric] * len(spans), [fee] * len(spans), [periods] * len(spans)))
+
+    # les périodes de test sont mises bout à bout, la position est conservée d'une fenêtre à la suivante
+    first, last = spans[0][2], spans[-1][3]
+    # une période de test qui chevauche la suivante s'arrête à son début
+    ends = [span[2] for span in spans[1:]] + [last]
+    stitched = np.zeros(last - first)
+    rows = []
+    for (trainstart, trainend, teststart, testend), testend, (row, trainvalue) in zip(spans, ends, optimized):
+        stitched[teststart - first:testend - first] = signals[row, teststart:testend]
+        testvalue = metrics.compute(values[teststart:testend], signals[row, teststart:testend], fee, periods)[metric]
+        rows.append(dict(params[row], trainstart=close.index[trainstart], teststart=close.index[teststart], testend=close.index[testend - 1],
+            train=trainvalue, test=testvalue))
+
+    returns = metrics.netreturns(values[first:last], stitched, fee)
+    equity = pd.Series(100.0 * np.cumprod(1.0 + returns), index=close.index[first:last], name='equity')
+    result = strategies.BacktestResult(close.index[first], close.index[last - 1], last - first, **metrics.compute(values[first:last], stitched, fee, periods))
+    table = pd.DataFrame(rows)
+    names = list(params[0].keys())
+    return WalkForwardResult(table[['trainstart', 'teststart', 'testend'] + names + ['train', 'test']], equity, result, stability(table[names]))
+
+def candles(duration, interval):
+    """Converts a number of candles, or a duration such as '30D', into a number of candles."""
+    if duration.isdigit():
+        return int(duration)
+    return int(pd.Timedelta(duration) / interval)
+
+def main():
+    parser = argparse.ArgumentParser()
+    store.addarguments(parser)
+    parser.add_argument("--strategy", required=True, choices=sorted(sweep.Strategies))
+    parser.add_argument("--grid", nargs='+', default=[], help='Parameter values as name=start:stop[:step] (stop included) or name=a,b,c')
+    parser.add_argument("--train", required=True, help='Training period, as a number of candles or a duration such as 30D')
+    parser.add_argument("--test", required=True, help='Test period, as a number of candles or a duration such as 7D')
+    parser.add_argument("--step", help='Interval between windows, at most and by default the test period')
+    parser.add_argument("--anchored", action='store_true', help='Trains every window from the first candle')
+    parser.add_argument("--metric", default='sharpe', choices=metrics.Names, help='Metric optimized on the training periods')
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--workers", type=int, help='Number of processes, defaults to the number of CPUs')
+    parser.add_argument("--equity", help='Writes the out-of-sample equity curve to this CSV file')
+    args = parser.parse_args()
+
+    ohlc = store.load(parser, args)
+    interval = metrics.inferinterval(ohlc.index)
+    step = candles(args.step, interval) if args.step != None else None
+    result = walkforward(ohlc, args.strategy, sweep.parsegrid(args.grid), candles(args.train, interval), candles(args.test, interval),
+        step, args.anchored, args.metric, args.fee, args.workers, interval)
+    print(result)
+    if args.equity != None:
+        result.equity.to_csv(args.equity, header=True)
+
+if __name__ == "__main__":
+    main()